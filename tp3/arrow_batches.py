@@ -0,0 +1,159 @@
+import io
+import struct
+
+import bson
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+    from pymongoarrow.api import Schema
+    from pymongoarrow.context import PyMongoArrowContext
+except ImportError:
+    pa = None
+
+# Colonnes de fact_flight_positions lues telles quelles dans les documents
+# (aircraft_id et country_id viennent des dimensions)
+FACT_FIELDS = (
+    "callsign",
+    "longitude",
+    "latitude",
+    "geo_altitude",
+    "velocity",
+    "true_track",
+    "on_ground",
+    "api_timestamp",
+    "ingestion_time",
+)
+
+_length = struct.Struct("<i").unpack_from
+
+
+def require_arrow():
+    if pa is None:
+        raise RuntimeError(
+            "pymongoarrow non installé: pip install -r requirements-optional.txt"
+        )
+
+
+def fact_schema():
+    return Schema(
+        {
+            "icao24": pa.string(),
+            "origin_country": pa.string(),
+            "callsign": pa.string(),
+            "longitude": pa.float64(),
+            "latitude": pa.float64(),
+            "geo_altitude": pa.float64(),
+            "velocity": pa.float64(),
+            "true_track": pa.float64(),
+            "on_ground": pa.bool_(),
+            "api_timestamp": pa.int64(),
+            "ingestion_time": pa.timestamp("ms"),
+        }
+    )
+
+
+def last_document(batch):
+    # Lot brut = documents BSON concaténés, chacun préfixé de sa taille:
+    # seul le dernier est décodé en dict
+    offset = 0
+    while True:
+        size = _length(batch, offset)[0]
+        if offset + size >= len(batch):
+            return bson.decode(batch[offset:])
+        offset += size
+
+
+def decode_batch(batch, schema):
+    # Lot brut (find_raw_batches) -> table Arrow, décodée en C sans passer
+    # par un dict Python par document
+    context = PyMongoArrowContext(schema)
+    context.process_bson_stream(batch)
+    return context.finish()
+
+
+def decode_fact_batch(batch):
+    # Exécuté dans un processus de transformation: la table revient au
+    # processus ETL en un flux IPC Arrow (bytes), pas en dicts ni en table
+    # picklée colonne par colonne
+    table = decode_batch(batch, fact_schema())
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def read_fact_batch(stream):
+    # Flux IPC -> table, les colonnes pointent dans les bytes reçus (sans copie)
+    return pa.ipc.open_stream(stream).read_all()
+
+
+def unique_values(column):
+    return pc.unique(column).drop_null().to_pylist()
+
+
+def map_ids(column, mapping):
+    # Jointure vectorisée valeur -> id de dimension (null si inconnue)
+    keys = pa.array(list(mapping.keys()), pa.string())
+    ids = pa.array(list(mapping.values()), pa.int32())
+    return pc.take(ids, pc.index_in(column, value_set=keys))
+
+
+def fact_table(table, aircraft_map, country_map):
+    # Table Arrow aux colonnes de fact_flight_positions; les positions sans
+    # avion connu sont écartées
+    aircraft_ids = map_ids(table["icao24"], aircraft_map)
+    columns = [aircraft_ids, map_ids(table["origin_country"], country_map)]
+    columns += [table[field] for field in FACT_FIELDS]
+
+    known = pc.is_valid(aircraft_ids)
+    return pa.table(
+        [pc.filter(column, known) for column in columns],
+        names=["aircraft_id", "country_id", *FACT_FIELDS],
+    )
+
+
+def table_rows(table):
+    # Colonnes -> tuples (pour execute_values), assemblés en C par zip
+    return list(zip(*(column.to_pylist() for column in table.columns)))
+
+
+def fact_keys(table):
+    return set(
+        zip(table["aircraft_id"].to_pylist(), table["api_timestamp"].to_pylist())
+    )
+
+
+def partition_table(table, partitions):
+    # Même découpage que etl_pipeline.partition_rows (aircraft_id % partitions)
+    owners = table["aircraft_id"].to_numpy() % partitions
+    return [table.filter(pa.array(owners == p)) for p in range(partitions)]
+
+
+def merge_tables(tables):
+    # Tri stable par (aircraft_id, api_timestamp), comme etl_pipeline.merge_rows
+    return pa.concat_tables(tables).sort_by(
+        [("aircraft_id", "ascending"), ("api_timestamp", "ascending")]
+    )
+
+
+def last_seen(table):
+    # (aircraft_id, ingestion_time la plus récente) par avion, groupé en C
+    latest = table.group_by("aircraft_id").aggregate([("ingestion_time", "max")])
+    return zip(
+        latest["aircraft_id"].to_pylist(), latest["ingestion_time_max"].to_pylist()
+    )
+
+
+def to_csv(table, batch_id):
+    # Table -> flux COPY (FORMAT csv) écrit par le writer CSV d'Arrow, sans
+    # objet Python par ligne; les null deviennent des champs vides non quotés
+    batch = table.add_column(
+        0, "batch_id", pa.array(np.full(table.num_rows, batch_id, dtype=np.int64))
+    )
+    buffer = io.BytesIO()
+    pa_csv.write_csv(batch, buffer, pa_csv.WriteOptions(include_header=False))
+    buffer.seek(0)
+    return buffer
@@ -1,19 +1,110 @@
 import os
 import time
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
 
 import requests
 from dotenv import load_dotenv
 from pymongo import ASCENDING, MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure, PyMongoError
+
+from fleet_simulator import FleetSimulator
+from ingestion_metrics import (
+    API_LATENCY,
+    DECODE_SECONDS,
+    ERRORS,
+    SCRAPE_PERIOD,
+    SNAPSHOTS_SKIPPED,
+    STATES_FILTERED,
+    STATES_RECEIVED,
+    WRITE_SECONDS,
+    record_written,
+    start_metrics_server,
+)
+from opensky import (
+    URL_OPENSKY,
+    decode_states,
+    fetch_tiles,
+    parse_grid,
+    parse_regions,
+    retry_after,
+)
+from recordings import Replay, SegmentRecorder, parse_speed
+from scheduler import AdaptiveScheduler
+from shards import shard_of
+from trajectory import DeadReckoningFilter
 
 load_dotenv()
 
-URL_OPENSKY = "https://opensky-network.org/api/states/all"
 PARAMS = {}
+OPENSKY_URL = os.getenv("OPENSKY_URL", URL_OPENSKY)
+REQUEST_TIMEOUT = 10
+
+# Mode tuiles: grille "LIGNESxCOLONNES" de bbox interrogées en parallèle.
+# Les tuiles qui touchent une zone dense sont interrogées à chaque cycle, les
+# autres tous les OPENSKY_COLD_TILE_EVERY cycles.
+HOT_REGIONS = parse_regions(
+    os.getenv("OPENSKY_HOT_REGIONS", "35:72:-25:45,24:50:-125:-66")
+)
+TILES = parse_grid(
+    os.getenv("OPENSKY_TILES", ""),
+    HOT_REGIONS,
+    int(os.getenv("OPENSKY_COLD_TILE_EVERY", "3")),
+)
+TILE_TIMEOUT = float(os.getenv("OPENSKY_TILE_TIMEOUT", "5"))
+TILE_RETRIES = int(os.getenv("OPENSKY_TILE_RETRIES", "2"))
+TILE_BACKOFF = 0.5
+
+# Enregistrement des snapshots (NDJSON compressé) et rejeu hors ligne
+RECORD_DIR = os.getenv("OPENSKY_RECORD_DIR", "")
+RECORD_SEGMENT_SIZE = int(os.getenv("OPENSKY_RECORD_SEGMENT_SIZE", "120"))
+REPLAY_PATH = os.getenv("OPENSKY_REPLAY_PATH", "")
+REPLAY_SPEED = parse_speed(os.getenv("OPENSKY_REPLAY_SPEED", "1"))
+REPLAY_LOOP = os.getenv("OPENSKY_REPLAY_LOOP", "false").lower() == "true"
+
+recorder = SegmentRecorder(RECORD_DIR, RECORD_SEGMENT_SIZE) if RECORD_DIR else None
 
 RETENTION_HOURS = int(os.getenv("RETENTION_HOURS"))
 SCRAPE_INTERVAL = int(os.getenv("SCRAPE_INTERVAL"))
 
+# Cadence adaptative: SCRAPE_INTERVAL est la période de base, allongée (x2)
+# sur 429/5xx ou si l'écriture Mongo dépasse MONGO_WRITE_BUDGET secondes
+SCRAPE_MAX_INTERVAL = float(os.getenv("SCRAPE_MAX_INTERVAL", "300"))
+MONGO_WRITE_BUDGET = float(os.getenv("MONGO_WRITE_BUDGET", "5"))
+scheduler = AdaptiveScheduler(SCRAPE_INTERVAL, SCRAPE_MAX_INTERVAL, MONGO_WRITE_BUDGET)
+
+# Flotte simulée injectée directement à la place de l'API (0 = désactivé).
+# Chaque cycle avance la simulation de SYNTHETIC_STEP secondes simulées.
+SYNTHETIC_AIRCRAFT = int(os.getenv("SYNTHETIC_AIRCRAFT", "0"))
+SYNTHETIC_STEP = float(os.getenv("SYNTHETIC_STEP", str(SCRAPE_INTERVAL or 10)))
+simulator = FleetSimulator(SYNTHETIC_AIRCRAFT) if SYNTHETIC_AIRCRAFT else None
+
+# Compression de trajectoire: seuls les points qui s'écartent de l'estime
+# (dernier point gardé + vitesse + cap) au-delà des tolérances sont écrits
+COMPRESS_TRAJECTORIES = os.getenv("COMPRESS_TRAJECTORIES", "false").lower() == "true"
+trajectory_filter = (
+    DeadReckoningFilter(
+        distance=float(os.getenv("COMPRESS_DISTANCE", "500")),
+        altitude=float(os.getenv("COMPRESS_ALTITUDE", "100")),
+        heading=float(os.getenv("COMPRESS_HEADING", "5")),
+        max_gap=float(os.getenv("COMPRESS_MAX_GAP", "300")),
+    )
+    if COMPRESS_TRAJECTORIES
+    else None
+)
+
+# upsert: UpdateOne par position (historique) | insert: insert_many avec _id naturel
+INGESTION_MODE = os.getenv("INGESTION_MODE", "upsert")
+DROP_UNIQUE_INDEX = os.getenv("MONGO_DROP_UNIQUE_INDEX", "false").lower() == "true"
+UNIQUE_INDEX_NAME = "icao24_1_api_timestamp_1"
+DUPLICATE_KEY_ERROR = 11000
+
+# collection: collection classique | timeseries: collection time-series native
+# (metaField icao24, timeField position_time), insert uniquement
+MONGO_BACKEND = os.getenv("MONGO_BACKEND", "collection")
+
+# Endpoint /metrics Prometheus (0 = désactivé)
+METRICS_PORT = int(os.getenv("INGESTION_METRICS_PORT", "8000"))
+
 MONGO_HOST = os.getenv("MONGO_HOST")
 MONGO_PORT = os.getenv("MONGO_PORT")
 MONGO_USER = os.getenv("MONGO_ROOT_USERNAME")
@@ -26,89 +117,299 @@ client = MongoClient(MONGO_URI)
 db = client[MONGO_DB]
 collection = db[MONGO_COLLECTION]
 
-collection.create_index(
-    [("ingestion_time", ASCENDING)], expireAfterSeconds=RETENTION_HOURS * 3600
-)
-collection.create_index(
-    [("icao24", ASCENDING), ("api_timestamp", ASCENDING)], unique=True
-)
 
-print(
-    f"Connexion MongoDB active (rétention: {RETENTION_HOURS}h, intervalle: {SCRAPE_INTERVAL}s)"
-)
+def init_collection(
+    target=collection,
+    mode=INGESTION_MODE,
+    drop_unique_index=DROP_UNIQUE_INDEX,
+    backend=MONGO_BACKEND,
+):
+    if backend == "timeseries":
+        init_timeseries_collection(target, mode)
+        return
+
+    target.create_index(
+        [("ingestion_time", ASCENDING)], expireAfterSeconds=RETENTION_HOURS * 3600
+    )
+    # Curseur de l'ETL: (ingestion_time, _id), tri et reprise sans ex aequo;
+    # préfixé de shard pour l'ETL multi-instance
+    target.create_index([("ingestion_time", ASCENDING), ("_id", ASCENDING)])
+    target.create_index(
+        [("shard", ASCENDING), ("ingestion_time", ASCENDING), ("_id", ASCENDING)]
+    )
+
+    # En mode insert, l'_id (icao24 + api_timestamp) garantit déjà l'unicité
+    if mode == "insert" and drop_unique_index:
+        try:
+            target.drop_index(UNIQUE_INDEX_NAME)
+            print(f"Index {UNIQUE_INDEX_NAME} supprimé (redondant avec _id)")
+        except OperationFailure:
+            pass
+    else:
+        target.create_index(
+            [("icao24", ASCENDING), ("api_timestamp", ASCENDING)], unique=True
+        )
+
+    print(
+        f"Connexion MongoDB active (rétention: {RETENTION_HOURS}h, intervalle: {SCRAPE_INTERVAL}s, mode: {mode})"
+    )
+
+
+def init_timeseries_collection(target, mode):
+    # Les time-series n'acceptent ni index unique ni upsert: les doublons
+    # éventuels (rejeu) sont absorbés par l'ON CONFLICT de l'ETL PostgreSQL
+    if mode != "insert":
+        raise ValueError("MONGO_BACKEND=timeseries requiert INGESTION_MODE=insert")
+
+    database = target.database
+    existing = database.list_collections(filter={"name": target.name})
+    options = next(existing, None)
+    if options is None:
+        database.create_collection(
+            target.name,
+            timeseries={
+                "timeField": "position_time",
+                "metaField": "icao24",
+                "granularity": "seconds",
+            },
+            expireAfterSeconds=RETENTION_HOURS * 3600,
+        )
+    elif options["type"] != "timeseries":
+        raise RuntimeError(
+            f"La collection {target.name} existe déjà sans time-series: "
+            "la supprimer ou changer MONGO_COLLECTION"
+        )
+
+    # Lecture incrémentale de l'ETL sur (position_time, _id), par shard en
+    # multi-instance
+    target.create_index([("position_time", ASCENDING), ("_id", ASCENDING)])
+    target.create_index(
+        [("shard", ASCENDING), ("position_time", ASCENDING), ("_id", ASCENDING)]
+    )
+
+    print(
+        f"Connexion MongoDB active (time-series, rétention: {RETENTION_HOURS}h, intervalle: {SCRAPE_INTERVAL}s)"
+    )
+
+
+def position_id(icao24, api_timestamp):
+    return f"{icao24}-{api_timestamp}"
+
+
+def with_shards(documents):
+    # Shard de l'icao24, lu par l'ETL multi-instance (ETL_SHARDING)
+    for doc in documents:
+        doc["shard"] = shard_of(doc["icao24"])
+    return documents
+
+
+def decode_snapshot(data):
+    snapshot = decode_states(data)
+    STATES_RECEIVED.inc(snapshot.received)
+    STATES_FILTERED.labels("no_position").inc(snapshot.received - len(snapshot))
+    if trajectory_filter:
+        before = len(snapshot)
+        trajectory_filter.apply(snapshot)
+        STATES_FILTERED.labels("trajectory").inc(before - len(snapshot))
+    return snapshot
 
 
-def cleanup_old_data():
-    cutoff = datetime.now() - timedelta(hours=RETENTION_HOURS)
-    result = collection.delete_many({"ingestion_time": {"$lt": cutoff}})
-    if result.deleted_count > 0:
-        print(f"{result.deleted_count} documents supprimés (> {RETENTION_HOURS}h)")
+def build_operations(data):
+    snapshot = decode_snapshot(data)
+
+    return [
+        UpdateOne(
+            {"icao24": doc["icao24"], "api_timestamp": snapshot.time},
+            {"$set": doc},
+            upsert=True,
+        )
+        for doc in with_shards(snapshot.documents(datetime.now()))
+    ]
+
+
+def build_documents(data, backend=MONGO_BACKEND):
+    snapshot = decode_snapshot(data)
+    return prepare_documents(snapshot.time, snapshot.documents(datetime.now()), backend)
+
+
+def prepare_documents(api_timestamp, documents, backend=MONGO_BACKEND):
+    with_shards(documents)
+    # En time-series, _id n'est pas unique: inutile de stocker l'_id naturel
+    if backend == "timeseries":
+        position_time = datetime.fromtimestamp(api_timestamp, timezone.utc)
+        for doc in documents:
+            doc["position_time"] = position_time
+        return documents
+
+    for doc in documents:
+        doc["_id"] = position_id(doc["icao24"], api_timestamp)
+    return documents
+
+
+def insert_documents(target, documents):
+    try:
+        result = target.insert_many(documents, ordered=False)
+        return len(result.inserted_ids), 0
+    except BulkWriteError as e:
+        return ignore_duplicates(e)
+
+
+def ignore_duplicates(error):
+    errors = error.details["writeErrors"]
+    duplicates = sum(1 for err in errors if err["code"] == DUPLICATE_KEY_ERROR)
+    if duplicates != len(errors):
+        raise error
+    return error.details["nInserted"], duplicates
+
+
+def write_snapshot(target, data, mode=INGESTION_MODE):
+    with DECODE_SECONDS.time():
+        batch = build_documents(data) if mode == "insert" else build_operations(data)
+    if not batch:
+        record_written(mode, None)
+        return None
+
+    with WRITE_SECONDS.time():
+        if mode == "insert":
+            written = insert_documents(target, batch)
+        else:
+            result = target.bulk_write(batch, ordered=False)
+            written = result.upserted_count, result.modified_count
+    record_written(mode, written)
+    return written
+
+
+def error_type(error):
+    if isinstance(error, requests.RequestException):
+        return "api"
+    if isinstance(error, PyMongoError):
+        return "write"
+    return "other"
+
+
+def fetch_snapshot(cycle_count):
+    with API_LATENCY.time():
+        data = fetch_live_snapshot(cycle_count)
+    if recorder and data is not None:
+        recorder.record(data)
+    return data
+
+
+def simulate_snapshot():
+    simulator.step(SYNTHETIC_STEP)
+    return simulator.payload()
+
+
+def fetch_live_snapshot(cycle_count):
+    if simulator:
+        return simulate_snapshot()
+
+    if TILES:
+        tiles = [tile for tile in TILES if tile.is_due(cycle_count)]
+        data, errors = fetch_tiles(
+            OPENSKY_URL, tiles, TILE_TIMEOUT, TILE_RETRIES, TILE_BACKOFF
+        )
+        for tile, error in errors:
+            ERRORS.labels("tile").inc()
+            print(
+                f"Erreur API tuile {tuple(tile.params.values())}: {error}", flush=True
+            )
+        if errors:
+            # Un seul ralentissement par cycle, en priorité sur un rate-limit
+            worst = max(
+                (error for _, error in errors),
+                key=lambda e: (e.status == 429, e.retry_after or 0),
+            )
+            scheduler.on_fetch_error(worst.status, worst.retry_after)
+        return data
+
+    response = requests.get(OPENSKY_URL, params=PARAMS, timeout=REQUEST_TIMEOUT)
+    if response.status_code == 200:
+        return response.json()
+
+    ERRORS.labels("api").inc()
+    scheduler.on_fetch_error(response.status_code, retry_after(response.headers))
+    print(f"Erreur API: {response.status_code}", flush=True)
+    return None
+
+
+def log_cycle(prefix, cycle_count, written):
+    now = datetime.now().strftime("%H:%M:%S")
+    if written:
+        inserted, other = written
+        label = "doublons ignorés" if INGESTION_MODE == "insert" else "mis à jour"
+        compression = f" | {trajectory_filter.summary()}" if trajectory_filter else ""
+        print(
+            f"[{now}] {prefix} #{cycle_count} | {inserted} nouveaux | {other} {label}{compression}",
+            flush=True,
+        )
+    else:
+        print(f"[{now}] {prefix} #{cycle_count} | Aucune donnée", flush=True)
+
+
+def run_replay():
+    speed = f"x{REPLAY_SPEED:g}" if REPLAY_SPEED else "max"
+    print(f"Rejeu de {REPLAY_PATH} (vitesse: {speed})", flush=True)
+
+    snapshots = written_total = 0
+    start = time.perf_counter()
+    for cycle_count, data in enumerate(Replay(REPLAY_PATH, REPLAY_SPEED, REPLAY_LOOP)):
+        written = write_snapshot(collection, data)
+        snapshots += 1
+        if written:
+            written_total += written[0]
+        log_cycle("Rejeu", cycle_count, written)
+
+    duration = time.perf_counter() - start
+    print(
+        f"Rejeu terminé: {snapshots} snapshots, {written_total} documents en "
+        f"{duration:.1f}s ({written_total / duration:.0f} docs/s, "
+        f"{snapshots / duration:.2f} snapshots/s)",
+        flush=True,
+    )
 
 
 def run_ingestion():
-    print("Démarrage de l'ingestion continue (Zone: Monde entier)", flush=True)
+    init_collection()
+    start_metrics_server(METRICS_PORT)
+    if REPLAY_PATH:
+        run_replay()
+        return
+
+    if simulator:
+        zone = f"flotte simulée de {SYNTHETIC_AIRCRAFT} avions"
+    else:
+        zone = f"{len(TILES)} tuiles" if TILES else "Monde entier"
+    print(f"Démarrage de l'ingestion continue (Zone: {zone})", flush=True)
     cycle_count = 0
 
     while True:
+        cycle_start = time.monotonic()
         try:
-            response = requests.get(URL_OPENSKY, params=PARAMS, timeout=10)
-
-            if response.status_code == 200:
-                data = response.json()
-                states = data.get("states", [])
-                timestamp = data["time"]
-
-                operations = []
-                if states:
-                    for state in states:
-                        if state[5] and state[6]:
-                            plane_obj = {
-                                "icao24": state[0],
-                                "callsign": state[1].strip() if state[1] else "N/A",
-                                "origin_country": state[2],
-                                "longitude": state[5],
-                                "latitude": state[6],
-                                "geo_altitude": state[13],
-                                "velocity": state[9],
-                                "true_track": state[10],
-                                "on_ground": state[8],
-                                "ingestion_time": datetime.now(),
-                                "api_timestamp": timestamp,
-                            }
-
-                            operations.append(
-                                UpdateOne(
-                                    {"icao24": state[0], "api_timestamp": timestamp},
-                                    {"$set": plane_obj},
-                                    upsert=True,
-                                )
-                            )
-
-                if operations:
-                    result = collection.bulk_write(operations, ordered=False)
-                    inserted = result.upserted_count
-                    updated = result.modified_count
-
-                    now = datetime.now().strftime("%H:%M:%S")
-                    print(
-                        f"[{now}] Cycle #{cycle_count} | {inserted} nouveaux | {updated} mis à jour",
-                        flush=True,
-                    )
-                else:
-                    now = datetime.now().strftime("%H:%M:%S")
-                    print(f"[{now}] Cycle #{cycle_count} | Aucune donnée", flush=True)
-
-                if cycle_count % 10 == 0:
-                    cleanup_old_data()
-
-            else:
-                print(f"Erreur API: {response.status_code}", flush=True)
+            data = fetch_snapshot(cycle_count)
+
+            if data is not None and not scheduler.is_new(data):
+                SNAPSHOTS_SKIPPED.inc()
+                now = datetime.now().strftime("%H:%M:%S")
+                print(
+                    f"[{now}] Cycle #{cycle_count} | Snapshot inchangé ({data['time']}), ignoré",
+                    flush=True,
+                )
+            elif data is not None:
+                start = time.monotonic()
+                written = write_snapshot(collection, data)
+                scheduler.on_write(time.monotonic() - start)
+                log_cycle("Cycle", cycle_count, written)
 
         except Exception as e:
+            ERRORS.labels(error_type(e)).inc()
+            if isinstance(e, requests.RequestException):
+                scheduler.on_fetch_error()
             print(f"Erreur: {e}", flush=True)
 
         cycle_count += 1
-        time.sleep(SCRAPE_INTERVAL)
+        SCRAPE_PERIOD.set(scheduler.interval)
+        scheduler.sleep(cycle_start)
 
 
 if __name__ == "__main__":
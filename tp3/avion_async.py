@@ -0,0 +1,343 @@
+import asyncio
+import os
+from datetime import datetime
+
+import aiohttp
+from pymongo import AsyncMongoClient
+from pymongo.errors import BulkWriteError
+
+from avion import (
+    INGESTION_MODE,
+    MONGO_COLLECTION,
+    MONGO_DB,
+    METRICS_PORT,
+    MONGO_URI,
+    OPENSKY_URL,
+    PARAMS,
+    REQUEST_TIMEOUT,
+    TILE_BACKOFF,
+    TILE_RETRIES,
+    TILE_TIMEOUT,
+    TILES,
+    build_documents,
+    build_operations,
+    error_type,
+    ignore_duplicates,
+    init_collection,
+    recorder,
+    scheduler,
+    simulate_snapshot,
+    simulator,
+    trajectory_filter,
+)
+from ingestion_metrics import (
+    API_LATENCY,
+    DECODE_SECONDS,
+    ERRORS,
+    QUEUE_DEPTH,
+    SCRAPE_PERIOD,
+    SNAPSHOTS_DROPPED,
+    SNAPSHOTS_SKIPPED,
+    WRITE_SECONDS,
+    record_written,
+    start_metrics_server,
+)
+from opensky import FetchError, merge_payloads, retry_after, should_retry
+
+QUEUE_SIZE = int(os.getenv("INGESTION_QUEUE_SIZE", "4"))
+WRITERS = int(os.getenv("INGESTION_WRITERS", "1"))
+
+
+PROMETHEUS_STAGES = {
+    "fetch": API_LATENCY,
+    "decode": DECODE_SECONDS,
+    "write": WRITE_SECONDS,
+}
+
+
+class Latency:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.last = seconds
+
+    def summary(self):
+        avg = self.total / self.count if self.count else 0.0
+        return f"{avg * 1000:.0f}/{self.max * 1000:.0f}ms"
+
+
+class EngineStats:
+    def __init__(self):
+        self.counters = {
+            "snapshots": 0,
+            "fetch_errors": 0,
+            "cycle_errors": 0,
+            "skipped": 0,
+            "written": 0,
+            "duplicates": 0,
+            "write_errors": 0,
+            "dropped": 0,
+            "late_ticks": 0,
+        }
+        self.latency = {
+            "fetch": Latency(),
+            "decode": Latency(),
+            "queue": Latency(),
+            "write": Latency(),
+        }
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+        if name == "dropped":
+            SNAPSHOTS_DROPPED.inc(value)
+        elif name == "skipped":
+            SNAPSHOTS_SKIPPED.inc(value)
+        elif name == "write_errors":
+            ERRORS.labels("write").inc(value)
+
+    def observe(self, stage, seconds):
+        self.latency[stage].observe(seconds)
+        if stage in PROMETHEUS_STAGES:
+            PROMETHEUS_STAGES[stage].observe(seconds)
+
+    def set_queue_depth(self, depth):
+        self.queue_depth = depth
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+        QUEUE_DEPTH.set(depth)
+
+    def summary(self):
+        stages = " ".join(
+            f"{stage} {latency.summary()}" for stage, latency in self.latency.items()
+        )
+        compression = f" | {trajectory_filter.summary()}" if trajectory_filter else ""
+        return (
+            f"file {self.queue_depth}/{QUEUE_SIZE} (max {self.max_queue_depth}) | "
+            f"pertes {self.counters['dropped']} | retards {self.counters['late_ticks']} | "
+            f"erreurs {self.counters['cycle_errors']} | "
+            f"{stages}{compression}"
+        )
+
+
+def build_batch(data):
+    if INGESTION_MODE == "insert":
+        return build_documents(data)
+    return build_operations(data)
+
+
+def enqueue(queue, item, stats):
+    # File pleine: l'écriture ne suit plus, on abandonne le snapshot le plus ancien
+    if queue.full():
+        queue.get_nowait()
+        queue.task_done()
+        stats.count("dropped")
+    queue.put_nowait(item)
+    stats.set_queue_depth(queue.qsize())
+
+
+async def fetch_tile(session, tile, stats):
+    # -> (données, None) ou (None, FetchError), comme opensky.fetch_tile
+    timeout = aiohttp.ClientTimeout(total=TILE_TIMEOUT)
+    error = None
+    for attempt in range(TILE_RETRIES + 1):
+        if attempt:
+            await asyncio.sleep(TILE_BACKOFF * 2 ** (attempt - 1))
+        try:
+            async with session.get(
+                OPENSKY_URL, params=tile.params, timeout=timeout
+            ) as response:
+                if response.status == 200:
+                    return await response.json(), None
+                error = FetchError(
+                    response.status,
+                    f"HTTP {response.status}",
+                    retry_after(response.headers),
+                )
+                # Attente imposée par l'API: réessayer consommerait du quota
+                if not should_retry(response.status) or error.retry_after:
+                    break
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = FetchError(None, repr(e), None)
+
+    stats.count("fetch_errors")
+    ERRORS.labels("tile").inc()
+    print(f"Erreur API tuile {tuple(tile.params.values())}: {error}", flush=True)
+    return None, error
+
+
+async def fetch_snapshot(session, cycle_count, stats):
+    if simulator:
+        return await asyncio.to_thread(simulate_snapshot)
+
+    if TILES:
+        tiles = [tile for tile in TILES if tile.is_due(cycle_count)]
+        results = await asyncio.gather(
+            *(fetch_tile(session, tile, stats) for tile in tiles)
+        )
+        errors = [error for _, error in results if error]
+        if errors:
+            # Un seul ralentissement par cycle, en priorité sur un rate-limit
+            worst = max(errors, key=lambda e: (e.status == 429, e.retry_after or 0))
+            scheduler.on_fetch_error(worst.status, worst.retry_after)
+        payloads = [payload for payload, _ in results if payload]
+        return merge_payloads(payloads) if payloads else None
+
+    try:
+        async with session.get(OPENSKY_URL, params=PARAMS) as response:
+            if response.status == 200:
+                return await response.json()
+            stats.count("fetch_errors")
+            ERRORS.labels("api").inc()
+            scheduler.on_fetch_error(response.status, retry_after(response.headers))
+            print(f"Erreur API: {response.status}", flush=True)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        stats.count("fetch_errors")
+        ERRORS.labels("api").inc()
+        scheduler.on_fetch_error()
+        print(f"Erreur API: {e!r}", flush=True)
+    return None
+
+
+async def produce(session, queue, stats):
+    loop = asyncio.get_running_loop()
+    next_tick = loop.time()
+    cycle_count = 0
+
+    while True:
+        # Un cycle en erreur (snapshot illisible, enregistrement, décodage)
+        # est compté et sauté, comme dans avion.run_ingestion
+        try:
+            start = loop.time()
+            data = await fetch_snapshot(session, cycle_count, stats)
+            stats.observe("fetch", loop.time() - start)
+
+            if data and not scheduler.is_new(data):
+                stats.count("skipped")
+                now = datetime.now().strftime("%H:%M:%S")
+                print(
+                    f"[{now}] Cycle #{cycle_count} | Snapshot inchangé ({data['time']}), ignoré",
+                    flush=True,
+                )
+            elif data:
+                stats.count("snapshots")
+                if recorder:
+                    await asyncio.to_thread(recorder.record, data)
+                start = loop.time()
+                batch = await asyncio.to_thread(build_batch, data)
+                stats.observe("decode", loop.time() - start)
+                enqueue(queue, (cycle_count, batch, loop.time()), stats)
+        except Exception as e:
+            stats.count("cycle_errors")
+            ERRORS.labels(error_type(e)).inc()
+            print(f"Erreur: {e}", flush=True)
+
+        cycle_count += 1
+        SCRAPE_PERIOD.set(scheduler.interval)
+
+        # Période du scheduler adaptatif (ralenti sur 429 / 5xx / écriture
+        # hors budget); un Retry-After de l'API repousse le prochain fetch
+        interval = scheduler.interval
+        now = loop.time()
+        if interval <= 0:
+            # SCRAPE_INTERVAL=0 (charge simulée): pas de cadence, on rend
+            # juste la main aux écritures avant le fetch suivant
+            await asyncio.sleep(max(0.0, scheduler.wait_until - now))
+            next_tick = loop.time()
+            continue
+
+        # Cadence fixe: le prochain fetch part à l'heure, quelle que soit la
+        # durée de l'écriture précédente; les ticks manqués sont sautés
+        next_tick += interval
+        if now > next_tick:
+            missed = int((now - next_tick) // interval) + 1
+            stats.count("late_ticks", missed)
+            next_tick += missed * interval
+        next_tick = max(next_tick, scheduler.wait_until)
+        await asyncio.sleep(next_tick - now)
+
+
+async def write_batch(target, batch):
+    if INGESTION_MODE == "insert":
+        try:
+            result = await target.insert_many(batch, ordered=False)
+            return len(result.inserted_ids), 0
+        except BulkWriteError as e:
+            return ignore_duplicates(e)
+
+    result = await target.bulk_write(batch, ordered=False)
+    return result.upserted_count, result.modified_count
+
+
+async def consume(target, queue, stats):
+    loop = asyncio.get_running_loop()
+    label = "doublons ignorés" if INGESTION_MODE == "insert" else "mis à jour"
+
+    while True:
+        cycle_count, batch, enqueued_at = await queue.get()
+        stats.set_queue_depth(queue.qsize())
+        stats.observe("queue", loop.time() - enqueued_at)
+
+        start = loop.time()
+        try:
+            if not batch:
+                record_written(INGESTION_MODE, None)
+                now = datetime.now().strftime("%H:%M:%S")
+                print(f"[{now}] Cycle #{cycle_count} | Aucune donnée", flush=True)
+                continue
+
+            inserted, other = await write_batch(target, batch)
+            stats.observe("write", loop.time() - start)
+            scheduler.on_write(loop.time() - start)
+            stats.count("written", inserted)
+            record_written(INGESTION_MODE, (inserted, other))
+            if INGESTION_MODE == "insert":
+                stats.count("duplicates", other)
+
+            now = datetime.now().strftime("%H:%M:%S")
+            print(
+                f"[{now}] Cycle #{cycle_count} | {inserted} nouveaux | {other} {label} | {stats.summary()}",
+                flush=True,
+            )
+        except Exception as e:
+            stats.count("write_errors")
+            print(f"Erreur écriture: {e}", flush=True)
+        finally:
+            queue.task_done()
+
+
+async def run_async_ingestion():
+    await asyncio.to_thread(init_collection)
+    start_metrics_server(METRICS_PORT)
+    print(
+        f"Démarrage de l'ingestion asynchrone (file: {QUEUE_SIZE}, writers: {WRITERS})",
+        flush=True,
+    )
+
+    client = AsyncMongoClient(MONGO_URI)
+    target = client[MONGO_DB][MONGO_COLLECTION]
+    queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    stats = EngineStats()
+
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        writers = [
+            asyncio.create_task(consume(target, queue, stats)) for _ in range(WRITERS)
+        ]
+        try:
+            await produce(session, queue, stats)
+        finally:
+            for writer in writers:
+                writer.cancel()
+            await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_async_ingestion())
@@ -0,0 +1,797 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import bson
+from prometheus_client.parser import text_string_to_metric_families
+from psycopg2.extras import execute_values
+from pymongo import ASCENDING
+
+import arrow_batches
+from avion import prepare_documents
+from dim_cache import LastSeenAccumulator
+from etl_pipeline import (
+    CHECKPOINT_ROWS,
+    CHUNK_SIZE,
+    FACT_PROJECTION,
+    FACT_TYPES,
+    FACT_WRITERS,
+    MONGO_DATABASE,
+    QUEUE_SIZE,
+    READ_FORMAT,
+    TRANSFORM_PROCESSES,
+    build_fact_rows,
+    fact_rows,
+    get_or_create_aircraft_batch,
+    get_or_create_country_batch,
+    init_schema,
+    key_order,
+    mongo_db,
+    write_last_seen,
+)
+from fleet_simulator import FleetSimulator
+from opensky import decode_states
+from pg_config import get_pg_connection
+from pgcopy import encode_rows
+
+# Positions datées de 2001 (api_timestamp) pour ne jamais croiser de vraies
+# données; elles sont supprimées à la fin du benchmark
+START_TIME = 1_000_000_000
+
+
+def legacy_insert_facts(cursor, rows, deltas):
+    # Chemin execute_values d'origine (page de 100, ON CONFLICT sans condition)
+    execute_values(
+        cursor,
+        """
+        INSERT INTO fact_flight_positions (
+            aircraft_id, country_id, callsign, longitude, latitude,
+            geo_altitude, velocity, true_track, on_ground,
+            api_timestamp, ingestion_time
+        ) VALUES %s
+        ON CONFLICT (aircraft_id, api_timestamp)
+        DO UPDATE SET
+            country_id = EXCLUDED.country_id,
+            callsign = EXCLUDED.callsign,
+            longitude = EXCLUDED.longitude,
+            latitude = EXCLUDED.latitude,
+            geo_altitude = EXCLUDED.geo_altitude,
+            velocity = EXCLUDED.velocity,
+            true_track = EXCLUDED.true_track,
+            on_ground = EXCLUDED.on_ground,
+            ingestion_time = EXCLUDED.ingestion_time,
+            processed_time = NOW()
+        """,
+        rows,
+    )
+    return len(rows)
+
+
+WRITERS = {"execute_values (origine)": legacy_insert_facts}
+WRITERS.update(FACT_WRITERS)
+
+
+def wal_lsn(cursor):
+    cursor.execute("SELECT pg_current_wal_lsn()")
+    return cursor.fetchone()[0]
+
+
+def timed_write(conn, writer, rows):
+    with conn.cursor() as cursor:
+        before = wal_lsn(cursor)
+        start = time.perf_counter()
+        writer(cursor, rows, [])
+        conn.commit()
+        duration = time.perf_counter() - start
+        cursor.execute("SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), %s)", (before,))
+        wal_bytes = cursor.fetchone()[0]
+    conn.commit()
+    return duration, int(wal_bytes)
+
+
+def make_batches(conn, size, count):
+    # Un snapshot de `size` avions par lot, api_timestamp différent à chaque lot,
+    # daté de 2001 jusqu'à ingestion_time (hors des vraies données); les
+    # dimensions sont créées ici, hors mesure
+    simulator = FleetSimulator(size, start_time=START_TIME)
+    batches = []
+    with conn.cursor() as cursor:
+        for _ in range(count):
+            simulator.step(10)
+            snapshot = decode_states(simulator.payload())
+            documents = snapshot.documents(datetime.fromtimestamp(snapshot.time))
+            batches.append(build_fact_rows(cursor, documents))
+    conn.commit()
+    return batches
+
+
+def run_write_benchmark(args):
+    init_schema()
+    conn = get_pg_connection()
+    try:
+        for size in args.sizes:
+            batches = make_batches(conn, size, len(WRITERS) * args.repeat)
+            print(f"Lots de {size} lignes ({args.repeat} lots par chemin)")
+
+            for i, (name, writer) in enumerate(WRITERS.items()):
+                own = batches[i * args.repeat : (i + 1) * args.repeat]
+                # Insertion de nouvelles positions, puis rejeu des mêmes lots
+                for phase in ("insertion", "rejeu"):
+                    rows = durations = wal = 0
+                    for batch in own:
+                        duration, wal_bytes = timed_write(conn, writer, batch)
+                        rows += len(batch)
+                        durations += duration
+                        wal += wal_bytes
+                    print(
+                        f"  {name:<26} {phase:<9} {rows / durations:10.0f} lignes/s | "
+                        f"{wal / rows:6.0f} octets WAL/ligne"
+                    )
+            print()
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM fact_flight_positions WHERE api_timestamp < %s",
+                (START_TIME + 10**6,),
+            )
+        conn.commit()
+        conn.close()
+
+
+def make_raw_batches(size, count):
+    # Lots BSON tels que renvoyés par find_raw_batches (champs projetés)
+    simulator = FleetSimulator(size, start_time=START_TIME)
+    batches = []
+    for _ in range(count):
+        simulator.step(10)
+        snapshot = decode_states(simulator.payload())
+        documents = []
+        for doc in snapshot.documents(datetime.now()):
+            doc["_id"] = f"{doc['icao24']}-{doc['api_timestamp']}"
+            documents.append(
+                bson.encode({field: doc.get(field) for field in FACT_PROJECTION})
+            )
+        batches.append(b"".join(documents))
+    return batches
+
+
+def transform_dict(batch, aircraft_map, country_map):
+    # Documents pymongo -> tuples -> COPY binaire
+    rows = fact_rows(bson.decode_all(batch), aircraft_map, country_map)
+    return encode_rows([(1,) + row for row in rows], ("int8",) + FACT_TYPES)
+
+
+def transform_arrow(batch, aircraft_map, country_map):
+    # Colonnes Arrow -> COPY csv
+    table = arrow_batches.decode_batch(batch, arrow_batches.fact_schema())
+    table = arrow_batches.fact_table(table, aircraft_map, country_map)
+    return arrow_batches.to_csv(table, 1)
+
+
+TRANSFORMS = {"dict": transform_dict, "arrow": transform_arrow}
+
+
+def same_rows(batch, aircraft_map, country_map):
+    table = arrow_batches.decode_batch(batch, arrow_batches.fact_schema())
+    table = arrow_batches.fact_table(table, aircraft_map, country_map)
+    documents = bson.decode_all(batch)
+    return arrow_batches.table_rows(table) == fact_rows(
+        documents, aircraft_map, country_map
+    )
+
+
+def run_transform_benchmark(args):
+    # Lot brut -> flux COPY prêt à envoyer, dimensions déjà connues: seul le
+    # coût CPU du décodage et de la construction des lignes est mesuré
+    arrow_batches.require_arrow()
+    for size in args.sizes:
+        batches = make_raw_batches(size, args.repeat)
+        documents = bson.decode_all(batches[0])
+        aircraft_map = {doc["icao24"]: i for i, doc in enumerate(documents)}
+        countries = {doc["origin_country"] for doc in documents}
+        country_map = {country: i for i, country in enumerate(sorted(countries))}
+
+        assert same_rows(batches[0], aircraft_map, country_map)
+        print(f"Lots de {size} documents ({args.repeat} lots par chemin)")
+        for name, transform in TRANSFORMS.items():
+            start = time.perf_counter()
+            for batch in batches:
+                transform(batch, aircraft_map, country_map)
+            duration = time.perf_counter() - start
+            print(
+                f"  {name:<6} {size * len(batches) / duration:12.0f} documents/s | "
+                f"{duration / len(batches) * 1000:8.1f} ms/lot"
+            )
+        print()
+
+
+def decode_in_process(batches, pool):
+    # Lot brut -> table Arrow dans l'ETL (pool None) ou dans les processus,
+    # dans l'ordre des lots comme le lecteur de l'ETL
+    if pool is None:
+        schema = arrow_batches.fact_schema()
+        return (arrow_batches.decode_batch(batch, schema) for batch in batches)
+    futures = [pool.submit(arrow_batches.decode_fact_batch, batch) for batch in batches]
+    return (arrow_batches.read_fact_batch(future.result()) for future in futures)
+
+
+def run_processes_benchmark(args):
+    # Lot brut -> flux COPY csv, décodage BSON dans 0..N processus; la
+    # jointure des dimensions et l'écriture CSV restent dans le processus ETL
+    arrow_batches.require_arrow()
+    batches = make_raw_batches(args.size, args.repeat)
+    documents = bson.decode_all(batches[0])
+    aircraft_map = {doc["icao24"]: i for i, doc in enumerate(documents)}
+    countries = {doc["origin_country"] for doc in documents}
+    country_map = {country: i for i, country in enumerate(sorted(countries))}
+
+    print(f"{os.cpu_count()} coeurs | {args.repeat} lots de {args.size} documents\n")
+    baseline = None
+    for processes in args.processes:
+        pool = None
+        if processes:
+            pool = ProcessPoolExecutor(
+                processes, mp_context=multiprocessing.get_context("spawn")
+            )
+            # Démarrage des processus hors mesure
+            list(decode_in_process(batches[:processes], pool))
+
+        start = time.perf_counter()
+        for table in decode_in_process(batches, pool):
+            table = arrow_batches.fact_table(table, aircraft_map, country_map)
+            arrow_batches.to_csv(table, 1)
+        duration = time.perf_counter() - start
+        if pool is not None:
+            pool.shutdown()
+
+        rate = args.size * len(batches) / duration
+        baseline = baseline or rate
+        label = f"{processes} processus" if processes else "sans processus"
+        print(f"  {label:<14} {rate:12.0f} documents/s | x{rate / baseline:.2f}")
+
+
+def dim_aircraft_activity(conn):
+    # Versions de lignes créées par UPDATE (chacune laisse un tuple mort),
+    # dont HOT, et position courante du WAL
+    # pg_stat_force_next_flush() prend effet à la fin de la transaction
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_stat_force_next_flush()")
+        conn.commit()
+        cursor.execute(
+            "SELECT n_tup_upd, n_tup_hot_upd, pg_current_wal_lsn() "
+            "FROM pg_stat_user_tables WHERE relname = 'dim_aircraft'"
+        )
+        activity = cursor.fetchone()
+    conn.commit()
+    return activity
+
+
+def update_per_chunk(conn, cycles, chunks, flush_every):
+    # Chemin d'origine: un UPDATE ... = ANY(...) par chunk et par cycle
+    for _, icao24_list in cycles:
+        for i in range(chunks):
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "UPDATE dim_aircraft SET last_seen = NOW() WHERE icao24 = ANY(%s)",
+                    (icao24_list[i::chunks],),
+                )
+            conn.commit()
+
+
+def update_accumulated(conn, cycles, chunks, flush_every):
+    # Accumulateur en mémoire, un UPDATE ... FROM (VALUES ...) tous les
+    # `flush_every` cycles
+    accumulator = LastSeenAccumulator()
+    for count, (pairs, _) in enumerate(cycles, start=1):
+        accumulator.add(pairs)
+        if count % flush_every == 0 or count == len(cycles):
+            with conn.cursor() as cursor:
+                write_last_seen(cursor, accumulator.drain())
+            conn.commit()
+
+
+LAST_SEEN_STRATEGIES = {
+    "UPDATE par chunk (origine)": update_per_chunk,
+    "accumulé + flush": update_accumulated,
+}
+
+
+def run_last_seen_benchmark(args):
+    # Même flotte pour les deux stratégies, un snapshot toutes les 10 s
+    # simulées; ingestion_time avance de 10 s par cycle
+    init_schema()
+    conn = get_pg_connection()
+    conn.autocommit = False
+    try:
+        simulator = FleetSimulator(args.aircraft, start_time=START_TIME)
+        with conn.cursor() as cursor:
+            aircraft_map = get_or_create_aircraft_batch(
+                cursor, [state[0] for state in simulator.payload()["states"]]
+            )
+        conn.commit()
+
+        flush_every = max(1, args.flush_interval // 10)
+        print(
+            f"{args.aircraft} avions | {args.cycles} cycles de 10 s | {args.chunks} chunks "
+            f"par cycle | flush toutes les {args.flush_interval} s\n"
+        )
+        for name, strategy in LAST_SEEN_STRATEGIES.items():
+            start_time = datetime.now() + timedelta(minutes=1)
+            cycles = []
+            for cycle in range(args.cycles):
+                seen = start_time + timedelta(seconds=10 * cycle)
+                cycles.append(
+                    (
+                        [(aircraft_id, seen) for aircraft_id in aircraft_map.values()],
+                        list(aircraft_map),
+                    )
+                )
+
+            updates, hot, lsn = dim_aircraft_activity(conn)
+            start = time.perf_counter()
+            strategy(conn, cycles, args.chunks, flush_every)
+            duration = time.perf_counter() - start
+            after_updates, after_hot, _ = dim_aircraft_activity(conn)
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), %s)", (lsn,)
+                )
+                wal_bytes = int(cursor.fetchone()[0])
+            conn.commit()
+
+            print(
+                f"  {name:<28} {after_updates - updates:9d} tuples morts "
+                f"({after_hot - hot} HOT) | {wal_bytes / 1024 / 1024:7.1f} Mo WAL | "
+                f"{duration:6.2f}s"
+            )
+    finally:
+        conn.close()
+
+
+# ETL complet (etl_pipeline.py dans un processus) sur une collection Mongo
+# dédiée; les faits, stats horaires et checkpoint du benchmark sont supprimés
+# à la fin
+E2E_COLLECTION = "etl_benchmark"
+E2E_CHECKPOINT = f"{MONGO_DATABASE}.{E2E_COLLECTION}:ingestion_time"
+# Comparaison à la référence: (métrique, plus grand = mieux)
+E2E_METRICS = (
+    ("rows_per_s", True),
+    ("latency_p50_s", False),
+    ("latency_p99_s", False),
+    ("wal_bytes_per_row", False),
+    ("peak_rss_mb", False),
+)
+# Ce qui doit être identique à la référence pour la comparer: la charge et
+# la machine (sinon les écarts peuvent venir d'elle)
+E2E_WORKLOAD = (
+    "documents",
+    "aircraft",
+    "chunk_size",
+    "queue_size",
+    "read_format",
+    "transform_processes",
+)
+E2E_MACHINE = ("cpus", "platform", "python", "postgresql", "mongodb")
+
+
+def seed_collection(documents, aircraft):
+    # Snapshots de la flotte simulée toutes les 10 s, datés de 2001
+    # (ingestion_time = api_timestamp); les dimensions sont créées ici, hors
+    # mesure. Retourne la dernière clé du curseur de l'ETL
+    target = mongo_db[E2E_COLLECTION]
+    target.drop()
+    target.create_index([("ingestion_time", ASCENDING), ("_id", ASCENDING)])
+
+    simulator = FleetSimulator(aircraft, start_time=START_TIME)
+    conn = get_pg_connection()
+    seeded = 0
+    try:
+        while seeded < documents:
+            simulator.step(10)
+            snapshot = decode_states(simulator.payload())
+            docs = snapshot.documents(datetime.fromtimestamp(snapshot.time))
+            docs = prepare_documents(
+                snapshot.time, docs[: documents - seeded], backend="collection"
+            )
+            if not seeded:
+                with conn.cursor() as cursor:
+                    get_or_create_aircraft_batch(cursor, [d["icao24"] for d in docs])
+                    get_or_create_country_batch(
+                        cursor, [d["origin_country"] for d in docs]
+                    )
+                conn.commit()
+            target.insert_many(docs, ordered=False)
+            seeded += len(docs)
+    finally:
+        conn.close()
+    return max((doc["ingestion_time"], doc["_id"]) for doc in docs)
+
+
+def e2e_cleanup(conn):
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM fact_flight_positions WHERE api_timestamp < %s",
+            (START_TIME + 10**6,),
+        )
+        cursor.execute(
+            "DELETE FROM agg_hourly_stats WHERE hour_timestamp < %s",
+            (datetime.fromtimestamp(START_TIME + 10**6),),
+        )
+        cursor.execute(
+            "DELETE FROM etl_checkpoint WHERE name = %s OR starts_with(name, %s)",
+            (E2E_CHECKPOINT, E2E_CHECKPOINT + "/"),
+        )
+    conn.commit()
+
+
+def reset_run(conn):
+    # Chaque combinaison insère les mêmes N positions dans une table sans
+    # tuples morts, en relisant la collection depuis le début
+    e2e_cleanup(conn)
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute("VACUUM fact_flight_positions")
+    conn.autocommit = False
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO etl_checkpoint (name, cursor_time, cursor_id) VALUES (%s, %s, %s)",
+            (
+                E2E_CHECKPOINT,
+                datetime.fromtimestamp(START_TIME),
+                bson.encode({"_id": None}),
+            ),
+        )
+    conn.commit()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("", 0))
+        return sock.getsockname()[1]
+
+
+def histogram_quantile(quantile, buckets):
+    # Interpolation linéaire dans le bucket, comme histogram_quantile de
+    # Prometheus; buckets: [(borne, effectif cumulé)] triés
+    total = buckets[-1][1]
+    if not total:
+        return None
+    rank = quantile * total
+    lower, below = 0.0, 0
+    for upper, count in buckets:
+        if count >= rank:
+            if math.isinf(upper):
+                return lower
+            return lower + (upper - lower) * (rank - below) / (count - below)
+        lower, below = upper, count
+    return lower
+
+
+def chunk_latencies(port):
+    with urllib.request.urlopen(f"http://localhost:{port}/metrics") as response:
+        text = response.read().decode()
+    for family in text_string_to_metric_families(text):
+        if family.name == "etl_chunk_seconds":
+            buckets = sorted(
+                (float(sample.labels["le"]), sample.value)
+                for sample in family.samples
+                if sample.name.endswith("_bucket")
+            )
+            return [histogram_quantile(q, buckets) for q in (0.5, 0.99)]
+    return [None, None]
+
+
+def wait_checkpoint(conn, proc, last_key, timeout):
+    # -> (premier commit du checkpoint, dernier document chargé), en secondes
+    # monotones; chaque écrivain valide son checkpoint avec ses faits, la
+    # progression est le plus petit d'entre eux
+    start = time.monotonic()
+    first = None
+    while time.monotonic() - start < timeout:
+        if proc.poll() is not None:
+            raise RuntimeError(f"ETL arrêté (code {proc.returncode})")
+        with conn.cursor() as cursor:
+            cursor.execute(CHECKPOINT_ROWS, ([E2E_CHECKPOINT],))
+            cursor_time, cursor_id = min(
+                (
+                    (cursor_time, bson.decode(bytes(cursor_id))["_id"])
+                    for _, cursor_time, cursor_id in cursor.fetchall()
+                ),
+                key=key_order,
+            )
+        conn.commit()
+        now = time.monotonic()
+        if first is None and cursor_time > datetime.fromtimestamp(START_TIME):
+            first = now
+        if (cursor_time, cursor_id) == last_key:
+            return first, now
+        time.sleep(0.05)
+    raise RuntimeError(f"ETL incomplet après {timeout}s")
+
+
+def run_etl_process(conn, documents, last_key, batch_size, workers, strategy, timeout):
+    reset_run(conn)
+    port = free_port()
+    env = {
+        **os.environ,
+        "MONGO_COLLECTION": E2E_COLLECTION,
+        "MONGO_BACKEND": "collection",
+        "ETL_BATCH_SIZE": str(batch_size),
+        "ETL_WORKERS": str(workers),
+        "ETL_WRITE_STRATEGY": strategy,
+        "ETL_SHARDING": "false",
+        "ETL_INTERVAL": "1",
+        "ETL_METRICS_PORT": str(port),
+        "PG_POOL_SIZE": str(workers + 1),
+    }
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_current_wal_lsn()")
+        lsn = cursor.fetchone()[0]
+    conn.commit()
+
+    with tempfile.TemporaryFile("w+") as log:
+        launched = time.monotonic()
+        proc = subprocess.Popen(
+            [sys.executable, "-u", "etl_pipeline.py"],
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+        try:
+            first, done = wait_checkpoint(conn, proc, last_key, timeout)
+            p50, p99 = chunk_latencies(port)
+        except Exception:
+            log.seek(0)
+            print(log.read()[-2000:])
+            raise
+        finally:
+            # Pic de mémoire de ce processus seul (ru_maxrss en Ko sous Linux)
+            if proc.poll() is None:
+                proc.send_signal(signal.SIGINT)
+            _, status, usage = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), %s)", (lsn,))
+        wal_bytes = int(cursor.fetchone()[0])
+    conn.commit()
+
+    # Débit mesuré hors démarrage (schéma, cache des dimensions, pool),
+    # sauf si tout a été chargé entre deux relevés du checkpoint
+    seconds = done - first if done > first else done - launched
+    return {
+        "batch_size": batch_size,
+        "workers": workers,
+        "strategy": strategy,
+        "rows": documents,
+        "startup_s": round(first - launched, 3),
+        "seconds": round(seconds, 3),
+        "rows_per_s": round(documents / seconds),
+        "latency_p50_s": p50 and round(p50, 4),
+        "latency_p99_s": p99 and round(p99, 4),
+        "wal_bytes": wal_bytes,
+        "wal_bytes_per_row": round(wal_bytes / documents),
+        "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),
+    }
+
+
+def run_key(result):
+    return result["batch_size"], result["workers"], result["strategy"]
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    # Régression: écart défavorable de plus de `tolerance` sur une métrique
+    reference = {run_key(result): result for result in baseline["results"]}
+    regressions = 0
+    print(f"\nComparaison à la référence (tolérance {tolerance:.0%})")
+    for result in results:
+        before = reference.get(run_key(result))
+        if before is None:
+            continue
+        changes = []
+        for metric, higher_is_better in E2E_METRICS:
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = new / old - 1
+            worse = -change if higher_is_better else change
+            flag = " RÉGRESSION" if worse > tolerance else ""
+            regressions += bool(flag)
+            changes.append(f"{metric} {change:+.0%}{flag}")
+        batch_size, workers, strategy = run_key(result)
+        print(
+            f"  {batch_size:>6} | {workers} écrivains | {strategy:<6} | {', '.join(changes)}"
+        )
+    return regressions
+
+
+def baseline_differences(report, baseline, keys):
+    return [
+        f"{key}: {baseline.get(key)} -> {report.get(key)}"
+        for key in keys
+        if baseline.get(key) != report.get(key)
+    ]
+
+
+def run_e2e_benchmark(args):
+    # Balayage ETL_BATCH_SIZE x ETL_WORKERS x stratégie d'écriture; résultats
+    # en JSON, comparés à une exécution de référence (--baseline)
+    init_schema()
+    print(f"Insertion de {args.documents} documents dans {E2E_COLLECTION}...")
+    last_key = seed_collection(args.documents, args.aircraft)
+    conn = get_pg_connection()
+    server_version = conn.server_version
+    mongo_version = mongo_db.client.server_info()["version"]
+    results = []
+    try:
+        for batch_size in args.batch_sizes:
+            for workers in args.workers:
+                for strategy in args.strategies:
+                    result = run_etl_process(
+                        conn,
+                        args.documents,
+                        last_key,
+                        batch_size,
+                        workers,
+                        strategy,
+                        args.timeout,
+                    )
+                    results.append(result)
+                    print(
+                        f"  {batch_size:>6} | {workers} écrivains | {strategy:<6} | "
+                        f"{result['rows_per_s']:8d} lignes/s | p50 {result['latency_p50_s']}s "
+                        f"p99 {result['latency_p99_s']}s | "
+                        f"{result['wal_bytes_per_row']:5d} octets WAL/ligne | "
+                        f"{result['peak_rss_mb']:7.1f} Mo RSS"
+                    )
+    finally:
+        e2e_cleanup(conn)
+        conn.close()
+        mongo_db[E2E_COLLECTION].drop()
+
+    report = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "cpus": os.cpu_count(),
+        "documents": args.documents,
+        "aircraft": args.aircraft,
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "postgresql": server_version,
+        "mongodb": mongo_version,
+        "chunk_size": CHUNK_SIZE,
+        "queue_size": QUEUE_SIZE,
+        "read_format": READ_FORMAT,
+        "transform_processes": TRANSFORM_PROCESSES,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nRésultats: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        workload = baseline_differences(report, baseline, E2E_WORKLOAD)
+        if workload:
+            print(
+                f"\nCharge différente de la référence, pas de comparaison: {workload}"
+            )
+            return
+        machine = baseline_differences(report, baseline, E2E_MACHINE)
+        if machine:
+            print(
+                f"\nMachine différente de la référence, pas de comparaison: {machine}"
+            )
+            return
+        if compare_to_baseline(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de l'ETL PostgreSQL")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    write = subparsers.add_parser(
+        "write", help="Chargement des faits: execute_values vs COPY + fusion"
+    )
+    write.add_argument(
+        "--sizes",
+        type=lambda value: [int(v) for v in value.split(",")],
+        default=[1000, 10000, 100000],
+        help="Tailles de lot, séparées par des virgules",
+    )
+    write.add_argument("--repeat", type=int, default=3)
+    write.set_defaults(func=run_write_benchmark)
+
+    transform = subparsers.add_parser(
+        "transform", help="Lot BSON -> flux COPY: dict pymongo vs Arrow"
+    )
+    transform.add_argument(
+        "--sizes",
+        type=lambda value: [int(v) for v in value.split(",")],
+        default=[1000, 10000, 100000],
+        help="Tailles de lot, séparées par des virgules",
+    )
+    transform.add_argument("--repeat", type=int, default=5)
+    transform.set_defaults(func=run_transform_benchmark)
+
+    processes = subparsers.add_parser(
+        "processes",
+        help="Lot BSON -> flux COPY (Arrow), décodage dans 0..N processus",
+    )
+    processes.add_argument(
+        "--processes",
+        type=lambda value: [int(v) for v in value.split(",")],
+        default=[0, 1, 2, 4],
+        help="Nombres de processus, séparés par des virgules (0: sans processus)",
+    )
+    processes.add_argument("--size", type=int, default=10000)
+    processes.add_argument("--repeat", type=int, default=40)
+    processes.set_defaults(func=run_processes_benchmark)
+
+    last_seen = subparsers.add_parser(
+        "last-seen", help="dim_aircraft.last_seen: UPDATE par chunk vs accumulé"
+    )
+    last_seen.add_argument("--aircraft", type=int, default=10000)
+    last_seen.add_argument("--cycles", type=int, default=30)
+    last_seen.add_argument("--chunks", type=int, default=4)
+    last_seen.add_argument(
+        "--flush-interval", type=int, default=60, help="Secondes entre deux flush"
+    )
+    last_seen.set_defaults(func=run_last_seen_benchmark)
+
+    e2e = subparsers.add_parser(
+        "e2e", help="etl_pipeline.py complet: Mongo local -> PostgreSQL local"
+    )
+    e2e.add_argument("--documents", type=int, default=200000)
+    e2e.add_argument("--aircraft", type=int, default=10000)
+    e2e.add_argument(
+        "--batch-sizes",
+        type=lambda value: [int(v) for v in value.split(",")],
+        default=[1000, 5000],
+        help="Valeurs de ETL_BATCH_SIZE, séparées par des virgules",
+    )
+    e2e.add_argument(
+        "--workers",
+        type=lambda value: [int(v) for v in value.split(",")],
+        default=[1, 4],
+        help="Valeurs de ETL_WORKERS, séparées par des virgules",
+    )
+    e2e.add_argument(
+        "--strategies",
+        type=lambda value: value.split(","),
+        default=["values", "copy"],
+        help="Stratégies d'écriture, séparées par des virgules",
+    )
+    e2e.add_argument("--timeout", type=int, default=600, help="Secondes par exécution")
+    e2e.add_argument("--output", default="benchmark_etl_e2e.json")
+    e2e.add_argument(
+        "--baseline",
+        help="JSON d'une exécution de référence (même charge, même machine)",
+    )
+    e2e.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Écart défavorable toléré avant de signaler une régression",
+    )
+    e2e.set_defaults(func=run_e2e_benchmark)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
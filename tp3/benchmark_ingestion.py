@@ -0,0 +1,262 @@
+import argparse
+import json
+import time
+from datetime import datetime
+
+import bson
+from pymongo import UpdateOne
+
+from avion import (
+    build_documents,
+    build_operations,
+    db,
+    init_collection,
+    insert_documents,
+)
+from fleet_simulator import FleetSimulator
+from opensky import decode_states
+from recordings import iter_recordings
+from trajectory import DeadReckoningFilter
+
+
+def legacy_build_documents(data):
+    # Boucle dict-par-ligne d'origine de run_ingestion(), conservée comme référence
+    states = data.get("states", [])
+    timestamp = data["time"]
+
+    documents = []
+    if states:
+        for state in states:
+            if state[5] and state[6]:
+                documents.append(
+                    {
+                        "icao24": state[0],
+                        "callsign": state[1].strip() if state[1] else "N/A",
+                        "origin_country": state[2],
+                        "longitude": state[5],
+                        "latitude": state[6],
+                        "geo_altitude": state[13],
+                        "velocity": state[9],
+                        "true_track": state[10],
+                        "on_ground": state[8],
+                        "ingestion_time": datetime.now(),
+                        "api_timestamp": timestamp,
+                    }
+                )
+    return documents
+
+
+def legacy_build_operations(data):
+    return [
+        UpdateOne(
+            {"icao24": doc["icao24"], "api_timestamp": doc["api_timestamp"]},
+            {"$set": doc},
+            upsert=True,
+        )
+        for doc in legacy_build_documents(data)
+    ]
+
+
+def snapshot_build_documents(data):
+    return decode_states(data).documents(datetime.now())
+
+
+def measure_cycles(name, func, data, cycles):
+    func(data)
+
+    start = time.perf_counter()
+    for _ in range(cycles):
+        rows = func(data)
+    duration = time.perf_counter() - start
+
+    rate = cycles / duration
+    print(
+        f"  {name:<12} {rate:10.1f} cycles/s | {duration / cycles * 1000:8.2f} ms/cycle | {len(rows)} lignes"
+    )
+    return rate
+
+
+def load_payload(args):
+    if args.payload:
+        with open(args.payload, "r") as f:
+            data = json.load(f)
+        source = args.payload
+    else:
+        data = FleetSimulator(args.aircraft).payload()
+        source = f"flotte simulée ({args.aircraft} avions)"
+
+    print(f"Payload: {source} | {len(data.get('states') or [])} états")
+    return data
+
+
+def run_decode_benchmark(args):
+    data = load_payload(args)
+    print(f"Cycles: {args.cycles}\n")
+
+    print("Décodage seul (payload -> documents)")
+    legacy = measure_cycles("dict/ligne", legacy_build_documents, data, args.cycles)
+    current = measure_cycles("Snapshot", snapshot_build_documents, data, args.cycles)
+    print(f"Gain: x{current / legacy:.2f}\n")
+
+    print("Cycle complet (payload -> UpdateOne)")
+    legacy = measure_cycles("dict/ligne", legacy_build_operations, data, args.cycles)
+    current = measure_cycles("Snapshot", build_operations, data, args.cycles)
+    print(f"Gain: x{current / legacy:.2f}")
+
+
+def write_cycles(target, mode, data, cycles, backend="collection"):
+    # Chaque cycle simule un nouveau snapshot (api_timestamp différent), le
+    # dernier est rejoué pour mesurer le coût des doublons
+    snapshots = [dict(data, time=data["time"] + i * 10) for i in range(cycles)]
+    snapshots.append(snapshots[-1])
+
+    if mode == "upsert":
+        batches = [build_operations(snapshot) for snapshot in snapshots]
+    else:
+        batches = [build_documents(snapshot, backend) for snapshot in snapshots]
+
+    written = 0
+    start = time.perf_counter()
+    for batch in batches:
+        if mode == "upsert":
+            target.bulk_write(batch, ordered=False)
+        else:
+            insert_documents(target, batch)
+        written += len(batch)
+    return written, time.perf_counter() - start
+
+
+def run_write_benchmark(args):
+    data = load_payload(args)
+    print(f"Cycles: {args.cycles} (+1 rejoué)\n")
+
+    variants = [
+        ("upsert", "upsert", False, "collection"),
+        ("insert", "insert", False, "collection"),
+        ("insert sans index", "insert", True, "collection"),
+        ("time-series", "insert", False, "timeseries"),
+    ]
+
+    rates = {}
+    storage = {}
+    for name, mode, drop_unique_index, backend in variants:
+        target = db[f"{args.collection}_{mode}_{backend}"]
+        target.drop()
+        init_collection(target, mode, drop_unique_index, backend)
+
+        written, duration = write_cycles(target, mode, data, args.cycles, backend)
+        stats = collection_stats(target)
+        rates[name] = written / duration
+        storage[name] = stats["storageSize"] + stats["totalIndexSize"]
+
+        print(
+            f"  {name:<18} {rates[name]:10.0f} docs/s | {stats['count']} documents | "
+            f"index: {stats['totalIndexSize'] / 1024 / 1024:.1f} Mo | "
+            f"stockage: {stats['storageSize'] / 1024 / 1024:.1f} Mo | "
+            f"cache: {stats['cacheBytes'] / 1024 / 1024:.1f} Mo"
+        )
+        target.drop()
+
+    print(f"\nGain insert vs upsert: x{rates['insert'] / rates['upsert']:.2f}")
+    print(
+        f"Gain insert sans index vs upsert: x{rates['insert sans index'] / rates['upsert']:.2f}"
+    )
+    print(
+        f"Time-series vs insert: débit x{rates['time-series'] / rates['insert']:.2f} | "
+        f"disque (données + index) /{storage['insert'] / storage['time-series']:.1f}"
+    )
+
+
+def collection_stats(target):
+    # collStats sur une time-series décrit la collection de buckets sous-jacente
+    stats = db.command("collStats", target.name)
+    if "timeseries" in stats:
+        stats["count"] = target.count_documents({})
+    cache = stats.get("wiredTiger", {}).get("cache", {})
+    stats["cacheBytes"] = cache.get("bytes currently in the cache", 0)
+    return stats
+
+
+def load_snapshots(args):
+    if args.replay:
+        print(f"Snapshots: enregistrements {args.replay}")
+        return list(iter_recordings(args.replay))
+
+    print(
+        f"Snapshots: flotte simulée de {args.aircraft} avions, "
+        f"{args.snapshots} x {args.step:g}s"
+    )
+    simulator = FleetSimulator(args.aircraft)
+    snapshots = []
+    for _ in range(args.snapshots):
+        simulator.step(args.step)
+        snapshots.append(simulator.payload())
+    return snapshots
+
+
+def run_compress_benchmark(args):
+    snapshots = load_snapshots(args)
+    print()
+
+    # Tolérances (distance m, altitude m, cap °, écart max s)
+    tolerances = [(100, 50, 2, 120), (500, 100, 5, 300), (1000, 200, 10, 600)]
+    for distance, altitude, heading, max_gap in tolerances:
+        trajectory_filter = DeadReckoningFilter(distance, altitude, heading, max_gap)
+        stored_bytes = 0
+        start = time.perf_counter()
+        for data in snapshots:
+            snapshot = trajectory_filter.apply(decode_states(data))
+            stored_bytes += sum(
+                len(bson.encode(doc)) for doc in snapshot.documents(datetime.now())
+            )
+        duration = time.perf_counter() - start
+
+        print(
+            f"  {distance:>5} m {altitude:>4} m {heading:>3}° {max_gap:>4}s | "
+            f"{trajectory_filter.summary()} | {stored_bytes / 1024 / 1024:.1f} Mo BSON | "
+            f"{duration / len(snapshots) * 1000:.1f} ms/snapshot"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de l'ingestion OpenSky")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    decode = subparsers.add_parser(
+        "decode", help="Décodage d'un snapshot: boucle dict/ligne vs colonnes"
+    )
+    decode.add_argument("--payload", help="Réponse /states/all enregistrée (JSON)")
+    decode.add_argument("--aircraft", type=int, default=10000)
+    decode.add_argument("--cycles", type=int, default=50)
+    decode.set_defaults(func=run_decode_benchmark)
+
+    write = subparsers.add_parser(
+        "write", help="Débit d'écriture Mongo: upsert vs insert_many avec _id naturel"
+    )
+    write.add_argument("--payload", help="Réponse /states/all enregistrée (JSON)")
+    write.add_argument("--aircraft", type=int, default=10000)
+    write.add_argument("--cycles", type=int, default=20)
+    write.add_argument(
+        "--collection",
+        default="bench_positions",
+        help="Préfixe des collections temporaires (supprimées à la fin)",
+    )
+    write.set_defaults(func=run_write_benchmark)
+
+    compress = subparsers.add_parser(
+        "compress", help="Compression de trajectoire: points gardés par tolérance"
+    )
+    compress.add_argument(
+        "--replay", help="Enregistrements NDJSON (fichier ou dossier)"
+    )
+    compress.add_argument("--aircraft", type=int, default=10000)
+    compress.add_argument("--snapshots", type=int, default=60)
+    compress.add_argument("--step", type=float, default=10.0, help="Secondes simulées")
+    compress.set_defaults(func=run_compress_benchmark)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
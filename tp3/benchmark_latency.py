@@ -0,0 +1,148 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from pg_config import get_pg_connection
+
+SCRIPT_DIR = Path(__file__).parent
+
+# Processus lancés pour chaque mode (le faux serveur OpenSky est commun)
+MODES = {
+    "mongo": ["avion.py", "etl_pipeline.py"],
+    "direct": ["direct_ingestion.py"],
+}
+
+
+def start(script, env):
+    return subprocess.Popen(
+        [sys.executable, "-u", script],
+        cwd=SCRIPT_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.STDOUT,
+    )
+
+
+def stop(processes):
+    for proc in processes:
+        proc.terminate()
+    for proc in processes:
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def observe_visibility(duration, warmup, poll):
+    # Pour chaque api_timestamp: instant où la première ligne devient visible
+    # dans fact_flight_positions, et instant où le nombre de lignes cesse de
+    # croître (snapshot complet). Pas v_latest_positions: avec
+    # optimizations.sql c'est une vue matérialisée, rafraîchie seulement par
+    # maintenance.py, et la mesure serait celle de son planning
+    first_seen = {}
+    complete_at = {}
+    counts = {}
+    since = int(time.time()) + warmup
+    deadline = time.time() + warmup + duration
+
+    conn = get_pg_connection()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            while time.time() < deadline:
+                cursor.execute(
+                    "SELECT fp.api_timestamp, COUNT(*) FROM fact_flight_positions fp "
+                    "JOIN dim_aircraft da ON da.aircraft_id = fp.aircraft_id "
+                    "WHERE fp.api_timestamp >= %s GROUP BY fp.api_timestamp",
+                    (since,),
+                )
+                now = time.time()
+                for api_timestamp, count in cursor.fetchall():
+                    first_seen.setdefault(api_timestamp, now)
+                    if count > counts.get(api_timestamp, 0):
+                        counts[api_timestamp] = count
+                        complete_at[api_timestamp] = now
+                time.sleep(poll)
+    finally:
+        conn.close()
+
+    first = np.array([seen - ts for ts, seen in first_seen.items()])
+    complete = np.array([complete_at[ts] - ts for ts in first_seen])
+    return first, complete
+
+
+def describe(name, latencies):
+    if not len(latencies):
+        return f"  {name:<22} aucune ligne visible"
+    p50, p95 = np.percentile(latencies, [50, 95])
+    return (
+        f"  {name:<22} p50 {p50:6.1f}s | p95 {p95:6.1f}s | max {latencies.max():6.1f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Latence bout en bout: api_timestamp -> ligne visible dans fact_flight_positions"
+    )
+    parser.add_argument("--modes", default="mongo,direct")
+    parser.add_argument("--aircraft", type=int, default=2000)
+    parser.add_argument("--duration", type=float, default=120, help="Secondes mesurées")
+    parser.add_argument("--warmup", type=float, default=20, help="Secondes ignorées")
+    parser.add_argument("--scrape-interval", type=int, default=10)
+    parser.add_argument("--etl-interval", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--poll", type=float, default=0.25)
+    args = parser.parse_args()
+
+    env = dict(
+        os.environ,
+        OPENSKY_URL=f"http://127.0.0.1:{args.port}/api/states/all",
+        OPENSKY_TILES="",
+        OPENSKY_REPLAY_PATH="",
+        SYNTHETIC_AIRCRAFT="0",
+        SCRAPE_INTERVAL=str(args.scrape_interval),
+        ETL_INTERVAL=str(args.etl_interval),
+        INGESTION_METRICS_PORT="0",
+        ETL_METRICS_PORT="0",
+    )
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "fake_opensky.py",
+            "--port",
+            str(args.port),
+            "--aircraft",
+            str(args.aircraft),
+        ],
+        cwd=SCRIPT_DIR,
+        stdout=subprocess.DEVNULL,
+    )
+
+    print(
+        f"Flotte simulée: {args.aircraft} avions | scraping {args.scrape_interval}s | "
+        f"ETL {args.etl_interval}s | mesure {args.duration:g}s (+{args.warmup:g}s de chauffe)\n"
+    )
+    try:
+        for mode in args.modes.split(","):
+            processes = [start(script, env) for script in MODES[mode]]
+            try:
+                first, complete = observe_visibility(
+                    args.duration, args.warmup, args.poll
+                )
+            finally:
+                stop(processes)
+
+            print(f"Mode {mode} ({' + '.join(MODES[mode])}): {len(first)} snapshots")
+            print(describe("première ligne visible", first))
+            print(describe("snapshot complet", complete))
+    finally:
+        stop([server])
+
+
+if __name__ == "__main__":
+    main()
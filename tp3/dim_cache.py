@@ -0,0 +1,185 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from prometheus_client import Counter, Gauge
+
+CACHE_HITS = Counter(
+    "etl_dim_cache_hits_total",
+    "Clés trouvées dans le cache de dimension",
+    ["dimension"],
+)
+CACHE_MISSES = Counter(
+    "etl_dim_cache_misses_total",
+    "Clés absentes du cache (lues ou créées dans PostgreSQL)",
+    ["dimension"],
+)
+CACHE_EVICTIONS = Counter(
+    "etl_dim_cache_evictions_total",
+    "Clés évincées du cache (moins récemment utilisées)",
+    ["dimension"],
+)
+CACHE_SIZE = Gauge(
+    "etl_dim_cache_entries", "Entrées du cache de dimension", ["dimension"]
+)
+
+
+class DimensionCache:
+    # Clé naturelle (icao24, nom de pays) -> id de dimension.
+    # Découpé en `stripes` segments ayant chacun leur verrou: les workers qui
+    # consultent des clés différentes ne se bloquent pas entre eux. Avec
+    # max_size, chaque segment est un LRU borné à max_size / stripes entrées.
+
+    def __init__(self, name, max_size=None, stripes=16):
+        self.name = name
+        self.capacity = None if max_size is None else max(1, max_size // stripes)
+        self.segments = [OrderedDict() for _ in range(stripes)]
+        self.locks = [threading.Lock() for _ in range(stripes)]
+
+        self.hits = CACHE_HITS.labels(name)
+        self.misses = CACHE_MISSES.labels(name)
+        self.evictions = CACHE_EVICTIONS.labels(name)
+        CACHE_SIZE.labels(name).set_function(lambda: len(self))
+
+    def __len__(self):
+        return sum(len(segment) for segment in self.segments)
+
+    def _by_segment(self, keys):
+        groups = defaultdict(list)
+        for key in keys:
+            groups[hash(key) % len(self.segments)].append(key)
+        return groups.items()
+
+    def lookup(self, keys):
+        # -> (clés trouvées avec leur id, clés manquantes), un verrou par segment
+        found = {}
+        missing = []
+        for index, segment_keys in self._by_segment(set(keys)):
+            segment = self.segments[index]
+            with self.locks[index]:
+                for key in segment_keys:
+                    value = segment.get(key)
+                    if value is None:
+                        missing.append(key)
+                    else:
+                        segment.move_to_end(key)
+                        found[key] = value
+
+        self.hits.inc(len(found))
+        self.misses.inc(len(missing))
+        return found, missing
+
+    def update(self, mapping):
+        evicted = 0
+        for index, segment_keys in self._by_segment(mapping):
+            segment = self.segments[index]
+            with self.locks[index]:
+                for key in segment_keys:
+                    segment[key] = mapping[key]
+                    segment.move_to_end(key)
+                if self.capacity is not None:
+                    while len(segment) > self.capacity:
+                        segment.popitem(last=False)
+                        evicted += 1
+        if evicted:
+            self.evictions.inc(evicted)
+
+    def warm(self, cursor, query, params=()):
+        # Chargement en masse au démarrage: `query` renvoie (clé, id), du moins
+        # au plus récemment utilisé pour que l'ordre LRU soit respecté
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        self.update(dict(rows))
+        return len(rows)
+
+
+class LastSeenAccumulator:
+    # Dernière position vue par avion (aircraft_id -> ingestion_time), en
+    # mémoire entre deux écritures groupées de dim_aircraft.last_seen
+
+    def __init__(self):
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, pairs):
+        with self.lock:
+            pending = self.pending
+            for aircraft_id, seen in pairs:
+                if seen is None:
+                    continue
+                current = pending.get(aircraft_id)
+                if current is None or seen > current:
+                    pending[aircraft_id] = seen
+
+    def drain(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        return pending
+
+    def restore(self, pending):
+        # Écriture échouée: les valeurs reviennent pour la prochaine tentative
+        self.add(pending.items())
+
+
+def add_hourly_deltas(pending, deltas):
+    # Deltas renvoyés par les requêtes de faits (une ligne par page ou par
+    # lot) additionnés dans {(heure, pays): [positions, somme et nombre
+    # d'altitudes, somme et nombre de vitesses, au sol, en vol]}
+    for hour, country_id, *values in deltas:
+        current = pending.get((hour, country_id))
+        if current is None:
+            pending[(hour, country_id)] = list(values)
+        else:
+            for i, value in enumerate(values):
+                current[i] += value
+    return pending
+
+
+class HourlyStatsBuffer:
+    # Deltas des positions validées par un seul écrivain (sans verrou), pas
+    # encore ajoutés à agg_hourly_stats: les écrivains ne réécrivent plus les
+    # mêmes lignes de stats à chaque transaction, chacun les ajoute en un
+    # upsert toutes les `interval` secondes
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.pending = {}
+        self.next_flush = time.monotonic() + interval
+
+    def __len__(self):
+        return len(self.pending)
+
+    def with_deltas(self, deltas):
+        # Copie: la transaction qui a produit `deltas` peut encore échouer
+        pending = {key: list(values) for key, values in self.pending.items()}
+        return add_hourly_deltas(pending, deltas)
+
+    def due(self):
+        return time.monotonic() >= self.next_flush
+
+    def wait(self):
+        # Attente maximale avant le prochain flush (None: rien en attente)
+        if not self.pending:
+            return None
+        return max(0.0, self.next_flush - time.monotonic())
+
+    def commit(self, pending, flushed):
+        # Transaction validée: `pending` ajouté à agg_hourly_stats (flushed)
+        # ou gardé pour le prochain flush
+        if flushed:
+            self.pending = {}
+            self.next_flush = time.monotonic() + self.interval
+        else:
+            self.pending = pending
+
+    def postpone(self):
+        # Flush échoué: nouvel essai à l'échéance suivante
+        self.next_flush = time.monotonic() + self.interval
+
+
+def stats_since(pending):
+    # Première heure dont des deltas ne sont pas encore dans agg_hourly_stats
+    return min((hour for hour, _ in pending), default=None)
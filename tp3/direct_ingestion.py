@@ -0,0 +1,158 @@
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import psycopg2
+
+from avion import (
+    METRICS_PORT,
+    SCRAPE_INTERVAL,
+    collection,
+    decode_snapshot,
+    error_type,
+    fetch_snapshot,
+    init_collection,
+    insert_documents,
+    prepare_documents,
+    scheduler,
+)
+from dim_cache import add_hourly_deltas
+from etl_pipeline import (
+    LAST_SEEN_FLUSH_INTERVAL,
+    flush_last_seen,
+    init_schema,
+    pg_pool,
+    warm_dimension_caches,
+    write_hourly_stats,
+    write_positions,
+)
+from ingestion_metrics import (
+    DECODE_SECONDS,
+    ERRORS,
+    SCRAPE_PERIOD,
+    SNAPSHOTS_DROPPED,
+    SNAPSHOTS_SKIPPED,
+    WRITE_SECONDS,
+    record_written,
+    start_metrics_server,
+)
+
+# Copie brute dans MongoDB en tâche de fond (facultative, hors chemin critique)
+MONGO_ARCHIVE = os.getenv("DIRECT_MONGO_ARCHIVE", "false").lower() == "true"
+ARCHIVE_QUEUE_SIZE = int(os.getenv("DIRECT_ARCHIVE_QUEUE_SIZE", "4"))
+
+
+class MongoArchiver:
+    # Écrit les snapshots déjà chargés dans PostgreSQL vers MongoDB (insert
+    # avec _id naturel). File bornée: si Mongo ne suit pas, le snapshot le
+    # plus ancien est abandonné plutôt que de ralentir PostgreSQL.
+
+    def __init__(self, target, queue_size):
+        self.target = target
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, api_timestamp, documents):
+        while True:
+            try:
+                self.queue.put_nowait((api_timestamp, documents))
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    SNAPSHOTS_DROPPED.inc()
+                except queue.Empty:
+                    pass
+
+    def _run(self):
+        while True:
+            api_timestamp, documents = self.queue.get()
+            try:
+                insert_documents(
+                    self.target, prepare_documents(api_timestamp, documents)
+                )
+            except Exception as e:
+                ERRORS.labels("archive").inc()
+                print(f"Erreur archivage Mongo: {e}", flush=True)
+
+
+def write_snapshot(conn, documents):
+    # Un seul écrivain, une transaction par snapshot: les stats horaires sont
+    # ajoutées avec les faits
+    deltas = []
+    with WRITE_SECONDS.time():
+        with conn.cursor() as cursor:
+            written = write_positions(cursor, documents, deltas)
+            write_hourly_stats(cursor, add_hourly_deltas({}, deltas))
+        conn.commit()
+    return written
+
+
+def run_direct_ingestion():
+    init_schema()
+    warm_dimension_caches()
+    archiver = None
+    if MONGO_ARCHIVE:
+        init_collection(mode="insert")
+        archiver = MongoArchiver(collection, ARCHIVE_QUEUE_SIZE)
+    start_metrics_server(METRICS_PORT)
+
+    print(
+        f"Démarrage de l'ingestion directe OpenSky -> PostgreSQL "
+        f"(intervalle: {SCRAPE_INTERVAL}s, archive Mongo: {'oui' if archiver else 'non'})",
+        flush=True,
+    )
+
+    cycle_count = 0
+    next_flush = time.monotonic() + LAST_SEEN_FLUSH_INTERVAL
+
+    while True:
+        cycle_start = time.monotonic()
+        try:
+            data = fetch_snapshot(cycle_count)
+
+            if data is not None and not scheduler.is_new(data):
+                SNAPSHOTS_SKIPPED.inc()
+            elif data is not None:
+                start = time.monotonic()
+                with DECODE_SECONDS.time():
+                    snapshot = decode_snapshot(data)
+                    documents = snapshot.documents(datetime.now())
+                # Le pool garde la connexion ouverte d'un cycle à l'autre et
+                # la remplace si elle est morte ou trop ancienne
+                with pg_pool.connection() as conn:
+                    written = write_snapshot(conn, documents)
+                scheduler.on_write(time.monotonic() - start)
+                record_written("upsert", (written, 0))
+
+                if archiver:
+                    archiver.submit(snapshot.time, documents)
+
+                now = datetime.now().strftime("%H:%M:%S")
+                print(
+                    f"[{now}] Cycle #{cycle_count} | {written} positions écrites dans PostgreSQL "
+                    f"({time.monotonic() - start:.2f}s)",
+                    flush=True,
+                )
+
+            if time.monotonic() >= next_flush:
+                flush_last_seen()
+                next_flush = time.monotonic() + LAST_SEEN_FLUSH_INTERVAL
+
+        except Exception as e:
+            if isinstance(e, psycopg2.Error):
+                ERRORS.labels("write").inc()
+            else:
+                ERRORS.labels(error_type(e)).inc()
+            print(f"Erreur: {e}", flush=True)
+
+        cycle_count += 1
+        SCRAPE_PERIOD.set(scheduler.interval)
+        scheduler.sleep(cycle_start)
+
+
+if __name__ == "__main__":
+    run_direct_ingestion()
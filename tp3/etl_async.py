@@ -0,0 +1,400 @@
+import asyncio
+import os
+import time
+from collections import deque
+from datetime import datetime
+
+import bson
+from prometheus_client import start_http_server
+from pymongo import AsyncMongoClient
+
+from dim_cache import HourlyStatsBuffer, add_hourly_deltas, stats_since
+from etl_pipeline import (
+    BATCH_SIZE,
+    CHUNK_SIZE,
+    CURSOR_FIELD,
+    ETL_INTERVAL,
+    FACT_COLUMNS,
+    FACT_PROJECTION,
+    FACT_TYPES,
+    HOURLY_STATS_UPSERT,
+    LAST_SEEN_FLUSH_INTERVAL,
+    MERGE_STAGED,
+    METRICS_PORT,
+    MONGO_COLLECTION,
+    MONGO_DATABASE,
+    MONGO_URI,
+    QUEUE_SIZE,
+    SHARDING,
+    STATS_FLUSH_INTERVAL,
+    advance,
+    aircraft_cache,
+    checkpoint_name,
+    country_cache,
+    cursor_key,
+    fact_rows,
+    hourly_stats_columns,
+    init_schema,
+    key_order,
+    last_seen,
+    load_checkpoints,
+    positions_query,
+    reset_checkpoints,
+    warm_dimension_caches,
+)
+from pg_config import PG_CONFIG, PG_POOL_MAX_LIFETIME, PG_POOL_TIMEOUT
+
+try:
+    from psycopg_pool import AsyncConnectionPool
+except ImportError:
+    AsyncConnectionPool = None
+
+# Chunks traités en même temps (dimensions, COPY, fusion), sur un pool de
+# ETL_ASYNC_POOL_SIZE connexions psycopg 3 en autocommit
+CONCURRENCY = int(os.getenv("ETL_ASYNC_CONCURRENCY", "8"))
+POOL_SIZE = int(os.getenv("ETL_ASYNC_POOL_SIZE", "4"))
+
+STAGING_COLUMNS = ("batch_id",) + FACT_COLUMNS
+STAGING_TYPES = ("int8",) + FACT_TYPES
+
+
+def pg_conninfo():
+    config = dict(PG_CONFIG)
+    config["dbname"] = config.pop("database")
+    return config
+
+
+async def resolve_dimensions(conn, documents):
+    # Avions et pays absents du cache créés puis relus, et id de lot de
+    # staging: un seul aller-retour en mode pipeline. Chaque requête est sa
+    # propre transaction (autocommit); les INSERT triés prennent leurs
+    # verrous dans le même ordre d'un chunk à l'autre
+    aircraft_map, missing_aircraft = aircraft_cache.lookup(
+        doc["icao24"] for doc in documents if doc.get("icao24")
+    )
+    country_map, missing_countries = country_cache.lookup(
+        doc["origin_country"] for doc in documents if doc.get("origin_country")
+    )
+
+    lookups = []
+    async with conn.pipeline():
+        for table, column, key, missing in (
+            ("dim_aircraft", "aircraft_id", "icao24", missing_aircraft),
+            ("dim_country", "country_id", "country_name", missing_countries),
+        ):
+            if not missing:
+                lookups.append(None)
+                continue
+            await conn.execute(
+                f"INSERT INTO {table} ({key}) SELECT unnest(%s::text[]) ORDER BY 1 "
+                f"ON CONFLICT ({key}) DO NOTHING",
+                (sorted(missing),),
+            )
+            lookups.append(
+                await conn.execute(
+                    f"SELECT {key}, {column} FROM {table} WHERE {key} = ANY(%s)",
+                    (missing,),
+                )
+            )
+        batch = await conn.execute("SELECT nextval('staging_batch_seq')")
+
+    for cache, mapping, lookup in (
+        (aircraft_cache, aircraft_map, lookups[0]),
+        (country_cache, country_map, lookups[1]),
+    ):
+        if lookup is not None:
+            found = dict(await lookup.fetchall())
+            cache.update(found)
+            mapping.update(found)
+
+    return aircraft_map, country_map, (await batch.fetchone())[0]
+
+
+async def copy_staged(conn, batch_id, rows):
+    # COPY binaire: valeurs encodées par psycopg (C), sans passer par du texte
+    async with conn.cursor() as cursor:
+        async with cursor.copy(
+            f"COPY staging_flight_positions ({', '.join(STAGING_COLUMNS)}) "
+            "FROM STDIN (FORMAT BINARY)"
+        ) as copy:
+            copy.set_types(STAGING_TYPES)
+            for row in rows:
+                await copy.write_row((batch_id,) + row)
+
+
+async def save_checkpoints(conn, positions, slot, since=None):
+    # since: première heure des deltas du slot pas encore dans agg_hourly_stats
+    async with conn.cursor() as cursor:
+        await cursor.executemany(
+            """
+            INSERT INTO etl_checkpoint (name, cursor_time, cursor_id, stats_since)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (name) DO UPDATE SET
+                cursor_time = EXCLUDED.cursor_time,
+                cursor_id = EXCLUDED.cursor_id,
+                stats_since = EXCLUDED.stats_since,
+                updated_at = NOW()
+            """,
+            [
+                (
+                    checkpoint_name(shard, slot),
+                    last_time,
+                    bson.encode({"_id": last_id}),
+                    since,
+                )
+                for shard, (last_time, last_id) in positions.items()
+            ],
+        )
+
+
+async def write_hourly_stats(conn, pending):
+    if pending:
+        await conn.execute(HOURLY_STATS_UPSERT, hourly_stats_columns(pending))
+
+
+async def process_chunk(pool, documents, earlier, slot, positions, stats):
+    # dimensions -> COPY en staging -> fusion. La fusion attend les chunks
+    # antérieurs qui partagent une position (ordre du curseur conservé); le
+    # COPY, la fusion et le checkpoint du slot (position du chunk) partagent
+    # une transaction: un échec ou une annulation ne laisse aucun lot en
+    # staging, et le checkpoint n'avance qu'avec les faits. Les deltas de
+    # stats restent dans le buffer du slot jusqu'à l'échéance du flush
+    # (etl_pipeline.write_group), marqués dans son checkpoint
+    async with pool.connection() as conn:
+        aircraft_map, country_map, batch_id = await resolve_dimensions(conn, documents)
+    rows = fact_rows(documents, aircraft_map, country_map)
+    last_seen.add((row[0], row[10]) for row in rows)
+
+    for task in earlier:
+        await task
+
+    flush = stats.due()
+    deltas = []
+    async with pool.connection() as conn:
+        async with conn.transaction():
+            if rows:
+                await copy_staged(conn, batch_id, rows)
+                merged = await conn.execute(MERGE_STAGED, (batch_id,))
+                deltas = await merged.fetchall()
+            pending = stats.with_deltas(deltas)
+            if flush:
+                await write_hourly_stats(conn, pending)
+            await save_checkpoints(
+                conn, positions, slot, None if flush else stats_since(pending)
+            )
+    stats.commit(pending, flush)
+    return len({(row[0], row[9]) for row in rows})
+
+
+async def sync_slots(pool, positions, buffers, flush):
+    # Tous les slots à `positions` en une transaction; flush: leurs deltas
+    # en attente ajoutés en un seul upsert
+    pending = {}
+    if flush:
+        for stats in buffers:
+            add_hourly_deltas(
+                pending, (key + tuple(values) for key, values in stats.pending.items())
+            )
+    async with pool.connection() as conn:
+        async with conn.transaction():
+            await write_hourly_stats(conn, pending)
+            for slot, stats in enumerate(buffers):
+                await save_checkpoints(
+                    conn, positions, slot, None if flush else stats_since(stats.pending)
+                )
+    if flush:
+        for stats in buffers:
+            stats.commit({}, True)
+
+
+async def flush_last_seen(pool):
+    pending = last_seen.drain()
+    if not pending:
+        return 0
+
+    aircraft_ids, seen = zip(*sorted(pending.items()))
+    try:
+        async with pool.connection() as conn:
+            result = await conn.execute(
+                """
+                UPDATE dim_aircraft AS d SET last_seen = v.last_seen
+                FROM unnest(%s::int[], %s::timestamp[]) AS v(aircraft_id, last_seen)
+                WHERE d.aircraft_id = v.aircraft_id
+                  AND d.last_seen < v.last_seen
+                """,
+                (list(aircraft_ids), list(seen)),
+            )
+    except Exception:
+        last_seen.restore(pending)
+        raise
+    return result.rowcount
+
+
+async def read_chunks(collection, positions, chunks):
+    # Curseur Mongo asynchrone trié sur (CURSOR_FIELD, _id); épuisé: nouvelle
+    # requête après ETL_INTERVAL
+    while True:
+        try:
+            cursor = (
+                collection.find(positions_query(positions), FACT_PROJECTION)
+                .sort([(CURSOR_FIELD, 1), ("_id", 1)])
+                .batch_size(BATCH_SIZE)
+            )
+            chunk = []
+            async for doc in cursor:
+                chunk.append(doc)
+                if len(chunk) == CHUNK_SIZE:
+                    await chunks.put((chunk, cursor_key(chunk[-1])))
+                    positions = advance(positions, cursor_key(chunk[-1]))
+                    chunk = []
+            if chunk:
+                await chunks.put((chunk, cursor_key(chunk[-1])))
+                positions = advance(positions, cursor_key(chunk[-1]))
+        except Exception as e:
+            print(f"Erreur lecture Mongo: {e}", flush=True)
+        await asyncio.sleep(ETL_INTERVAL)
+
+
+async def run_pipeline(pool, collection, positions):
+    # Au plus CONCURRENCY chunks en cours, le chunk n dans le slot
+    # n % CONCURRENCY: il ne part qu'une fois le chunk n - CONCURRENCY
+    # terminé, les checkpoints d'un slot sont donc validés dans l'ordre du
+    # curseur et la reprise part du plus petit (comme les écrivains de
+    # etl_pipeline.py). Deltas de stats encore en attente à l'arrêt: leurs
+    # heures, marquées dans les checkpoints, sont recalculées au redémarrage
+    # (reset_checkpoints)
+    chunks = asyncio.Queue(maxsize=QUEUE_SIZE)
+    reader = asyncio.create_task(read_chunks(collection, positions, chunks))
+    in_flight = deque()
+    dispatched = 0
+    saved = positions
+    buffers = [HourlyStatsBuffer(STATS_FLUSH_INTERVAL) for _ in range(CONCURRENCY)]
+    written = 0
+    report_count = 0
+    next_report = time.monotonic() + ETL_INTERVAL
+    next_flush = time.monotonic() + LAST_SEEN_FLUSH_INTERVAL
+
+    try:
+        while True:
+            while in_flight and (
+                in_flight[0][0].done() or len(in_flight) >= CONCURRENCY
+            ):
+                task, _ = in_flight.popleft()
+                written += await task
+
+            # Plus rien en cours: tous les slots rejoignent le dernier chunk
+            # (un slot sans chunk récent garderait une position ancienne), et
+            # leurs deltas sont ajoutés à l'échéance
+            if not in_flight:
+                flush = any(stats.pending and stats.due() for stats in buffers)
+                if flush or positions != saved:
+                    await sync_slots(pool, positions, buffers, flush)
+                    saved = positions
+
+            if time.monotonic() >= next_report:
+                now = datetime.now().strftime("%H:%M:%S")
+                if written:
+                    print(
+                        f"[{now}] Cycle #{report_count} | {written} positions traitées "
+                        f"| file: {chunks.qsize()}/{QUEUE_SIZE} | en cours: {len(in_flight)}",
+                        flush=True,
+                    )
+                else:
+                    print(
+                        f"[{now}] Cycle #{report_count} | Aucune nouvelle donnée",
+                        flush=True,
+                    )
+                written = 0
+                report_count += 1
+                next_report = time.monotonic() + ETL_INTERVAL
+
+            if time.monotonic() >= next_flush:
+                await flush_last_seen(pool)
+                next_flush = time.monotonic() + LAST_SEEN_FLUSH_INTERVAL
+
+            try:
+                documents, chunk_key = await asyncio.wait_for(chunks.get(), 1)
+            except asyncio.TimeoutError:
+                continue
+
+            keys = {(doc.get("icao24"), doc.get("api_timestamp")) for doc in documents}
+            earlier = [task for task, other in in_flight if not keys.isdisjoint(other)]
+            positions = advance(positions, chunk_key)
+            task = asyncio.create_task(
+                process_chunk(
+                    pool,
+                    documents,
+                    earlier,
+                    dispatched % CONCURRENCY,
+                    positions,
+                    buffers[dispatched % CONCURRENCY],
+                )
+            )
+            in_flight.append((task, keys))
+            dispatched += 1
+
+    except Exception as e:
+        print(f"Erreur ETL: {e}", flush=True)
+    finally:
+        reader.cancel()
+        for task, _ in in_flight:
+            task.cancel()
+        await asyncio.gather(
+            reader, *(task for task, _ in in_flight), return_exceptions=True
+        )
+
+
+async def run_async_etl():
+    if SHARDING:
+        raise RuntimeError("ETL_SHARDING n'est géré que par etl_pipeline.py")
+    if AsyncConnectionPool is None:
+        raise RuntimeError(
+            "psycopg 3 non installé: pip install -r requirements-optional.txt"
+        )
+
+    print(
+        "Démarrage du pipeline ETL asynchrone MongoDB -> PostgreSQL (psycopg 3, pipeline + COPY binaire)"
+    )
+    print(
+        f"Intervalle: {ETL_INTERVAL}s | Lots Mongo: {BATCH_SIZE} | Chunks: {CHUNK_SIZE} "
+        f"| File: {QUEUE_SIZE} | Chunks en cours: {CONCURRENCY} | Pool PostgreSQL: {POOL_SIZE} connexions\n"
+    )
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
+
+    # Démarrage (schéma, cache, checkpoint) par le chemin synchrone existant
+    await asyncio.to_thread(init_schema)
+    await asyncio.to_thread(warm_dimension_caches)
+
+    client = AsyncMongoClient(MONGO_URI)
+    collection = client[MONGO_DATABASE][MONGO_COLLECTION]
+    pool = AsyncConnectionPool(
+        kwargs={**pg_conninfo(), "autocommit": True},
+        min_size=1,
+        max_size=POOL_SIZE,
+        max_lifetime=PG_POOL_MAX_LIFETIME,
+        timeout=PG_POOL_TIMEOUT,
+        check=AsyncConnectionPool.check_connection,
+        open=False,
+    )
+    await pool.open()
+
+    try:
+        while True:
+            positions = await asyncio.to_thread(load_checkpoints, [None])
+            # Un checkpoint par slot, à la position de départ (ceux des
+            # écrivains de l'ETL synchrone ou d'un autre nombre de slots compris)
+            await asyncio.to_thread(reset_checkpoints, positions, range(CONCURRENCY))
+            last_time, last_id = min(positions.values(), key=key_order)
+            print(
+                f"Lecture après {CURSOR_FIELD}={last_time} _id={last_id}\n", flush=True
+            )
+            await run_pipeline(pool, collection, positions)
+            await asyncio.sleep(ETL_INTERVAL)
+    finally:
+        await pool.close()
+        await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_async_etl())
@@ -1,88 +1,300 @@
+import multiprocessing
 import os
+import queue
+import socket
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from datetime import datetime, timedelta
-from threading import Lock
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
 
-import psycopg2
+import bson
+from bson import ObjectId
 from dotenv import load_dotenv
+from prometheus_client import Histogram, start_http_server
 from psycopg2.extras import execute_values
 from pymongo import MongoClient
 
+import arrow_batches
+from dim_cache import (
+    DimensionCache,
+    HourlyStatsBuffer,
+    LastSeenAccumulator,
+    stats_since,
+)
+from pg_config import (
+    PG_CONFIG,
+    PG_POOL_HEALTH_CHECK_AFTER,
+    PG_POOL_MAX_LIFETIME,
+    PG_POOL_TIMEOUT,
+    get_pg_connection,
+)
+from pg_pool import ConnectionPool
+from pgcopy import copy_rows
+from shards import SHARD_COUNT, ShardLeases
+
 load_dotenv()
 
 MONGO_HOST = os.getenv("MONGO_HOST")
 MONGO_PORT = os.getenv("MONGO_PORT")
 MONGO_URI = f"mongodb://{os.getenv('MONGO_ROOT_USERNAME')}:{os.getenv('MONGO_ROOT_PASSWORD')}@{MONGO_HOST}:{MONGO_PORT}/"
 
-PG_CONFIG = {
-    "host": os.getenv("POSTGRES_HOST"),
-    "port": int(os.getenv("POSTGRES_PORT")),
-    "database": os.getenv("POSTGRES_DB"),
-    "user": os.getenv("POSTGRES_USER"),
-    "password": os.getenv("POSTGRES_PASSWORD"),
-}
-
 ETL_INTERVAL = int(os.getenv("ETL_INTERVAL"))
+# Documents par aller-retour du curseur Mongo (batch_size)
 BATCH_SIZE = int(os.getenv("ETL_BATCH_SIZE"))
+# Documents par transaction d'écriture, et chunks lus d'avance
+CHUNK_SIZE = int(os.getenv("ETL_CHUNK_SIZE", "1000"))
+QUEUE_SIZE = int(os.getenv("ETL_QUEUE_SIZE", "4"))
 NUM_WORKERS = int(os.getenv("ETL_WORKERS", "4"))
+# dict: documents pymongo | arrow: lots BSON bruts décodés en colonnes
+# (pymongoarrow), dimensions jointes en vectoriel
+READ_FORMAT = os.getenv("ETL_READ_FORMAT", "dict")
+# Lecture arrow: lots BSON décodés dans N processus (0 = dans le thread de
+# lecture), hors du GIL du processus ETL
+TRANSFORM_PROCESSES = int(os.getenv("ETL_TRANSFORM_PROCESSES", "0"))
+# values: execute_values + ON CONFLICT | copy: COPY binaire en staging + fusion SQL
+WRITE_STRATEGY = os.getenv("ETL_WRITE_STRATEGY", "values")
 MONGO_DATABASE = os.getenv("MONGO_DATABASE")
 MONGO_COLLECTION = os.getenv("MONGO_COLLECTION")
+MONGO_BACKEND = os.getenv("MONGO_BACKEND", "collection")
+
+# Les time-series sont lues sur leur timeField (élagage par bucket)
+CURSOR_FIELD = "position_time" if MONGO_BACKEND == "timeseries" else "ingestion_time"
+CHECKPOINT_NAME = f"{MONGO_DATABASE}.{MONGO_COLLECTION}:{CURSOR_FIELD}"
+# Seuls les documents insérés depuis plus de N secondes (ingestion_time, posé
+# à l'écriture quel que soit le backend) sont lus: les ex aequo d'un même
+# instant (insert_many non ordonné, écrivains parallèles) ne sont pas
+# visibles dans l'ordre de leur _id, un _id plus petit encore en cours
+# d'écriture serait sauté une fois le checkpoint passé. En time-series,
+# position_time (heure de l'API) est déjà plus vieux que ce délai à
+# l'insertion: la borne ne peut pas porter sur le champ du curseur
+SETTLE_SECONDS = float(os.getenv("ETL_SETTLE_SECONDS", "5"))
+
+# Types d'_id possibles dans l'ordre de tri BSON (string: _id naturel du mode
+# insert, objectId: mode upsert et time-series). Une comparaison $lte ne porte
+# que sur les _id du même type: les types triés avant sont exclus à part
+ID_TYPES = {str: "string", ObjectId: "objectId"}
+ID_TYPE_ORDER = ["string", "objectId"]
+
+# Seuls les champs chargés dans PostgreSQL sont lus (_id est toujours renvoyé)
+FACT_PROJECTION = {
+    field: 1
+    for field in (
+        "icao24",
+        "origin_country",
+        "callsign",
+        "longitude",
+        "latitude",
+        "geo_altitude",
+        "velocity",
+        "true_track",
+        "on_ground",
+        "api_timestamp",
+        "ingestion_time",
+        CURSOR_FIELD,
+    )
+}
+
+# Plusieurs instances ETL se partagent les shards d'icao24 (champ `shard`
+# écrit par avion.py) par baux dans PostgreSQL, prolongés toutes les TTL / 3 s
+SHARDING = os.getenv("ETL_SHARDING", "false").lower() == "true"
+LEASE_TTL = int(os.getenv("ETL_LEASE_TTL", "30"))
+INSTANCE_ID = os.getenv("ETL_INSTANCE_ID", f"{socket.gethostname()}-{os.getpid()}")
+
+# Pool de connexions: un worker par connexion, plus une pour le checkpoint
+# et last_seen (et une pour le heartbeat des baux)
+PG_POOL_SIZE = int(os.getenv("PG_POOL_SIZE", str(NUM_WORKERS + 1 + SHARDING)))
+METRICS_PORT = int(os.getenv("ETL_METRICS_PORT", "8001"))
+AIRCRAFT_CACHE_SIZE = int(os.getenv("ETL_AIRCRAFT_CACHE_SIZE", "200000"))
+# dim_aircraft.last_seen écrit en une requête toutes les N secondes
+LAST_SEEN_FLUSH_INTERVAL = int(os.getenv("ETL_LAST_SEEN_FLUSH_INTERVAL", "60"))
+# Deltas de agg_hourly_stats ajoutés par chaque écrivain toutes les N secondes
+STATS_FLUSH_INTERVAL = int(os.getenv("ETL_STATS_FLUSH_INTERVAL", "60"))
 
 mongo_client = MongoClient(MONGO_URI)
 mongo_db = mongo_client[MONGO_DATABASE]
 mongo_collection = mongo_db[MONGO_COLLECTION]
 
-aircraft_cache = {}
-country_cache = {}
-cache_lock = Lock()
+# Les avions vus il y a longtemps sont évincés (LRU); les pays sont peu nombreux
+aircraft_cache = DimensionCache("aircraft", max_size=AIRCRAFT_CACHE_SIZE)
+country_cache = DimensionCache("country")
+last_seen = LastSeenAccumulator()
+transform_pool = None
 
+pg_pool = ConnectionPool(
+    PG_CONFIG,
+    max_size=PG_POOL_SIZE,
+    max_lifetime=PG_POOL_MAX_LIFETIME,
+    health_check_after=PG_POOL_HEALTH_CHECK_AFTER,
+    timeout=PG_POOL_TIMEOUT,
+)
 
-def get_pg_connection():
-    return psycopg2.connect(**PG_CONFIG)
+CHUNK_SECONDS = Histogram(
+    "etl_chunk_seconds",
+    "Latence d'un chunk: sortie de la file -> dernière partition validée",
+    buckets=(
+        0.005,
+        0.01,
+        0.025,
+        0.05,
+        0.075,
+        0.1,
+        0.15,
+        0.25,
+        0.5,
+        0.75,
+        1,
+        2.5,
+        5,
+        10,
+    ),
+)
+
+
+def warm_dimension_caches():
+    # Au démarrage: pays et avions les plus récemment vus chargés en une
+    # requête chacun, au lieu d'un aller-retour par nouvel avion
+    with pg_pool.connection() as conn:
+        with conn.cursor() as cursor:
+            countries = country_cache.warm(
+                cursor, "SELECT country_name, country_id FROM dim_country"
+            )
+            aircraft = aircraft_cache.warm(
+                cursor,
+                """
+                SELECT icao24, aircraft_id FROM (
+                    SELECT icao24, aircraft_id, last_seen FROM dim_aircraft
+                    ORDER BY last_seen DESC LIMIT %s
+                ) recent
+                ORDER BY last_seen
+                """,
+                (AIRCRAFT_CACHE_SIZE,),
+            )
+        conn.commit()
+    print(f"Cache des dimensions: {aircraft} avions, {countries} pays\n", flush=True)
 
 
 def get_or_create_aircraft_batch(cursor, icao24_list):
     if not icao24_list:
         return {}
 
-    with cache_lock:
-        cached = {
-            icao: aircraft_cache[icao] for icao in icao24_list if icao in aircraft_cache
-        }
-        missing = [icao for icao in icao24_list if icao not in aircraft_cache]
-
-    result = cached.copy()
+    result, missing = aircraft_cache.lookup(icao24_list)
 
     if missing:
         cursor.execute(
             "SELECT aircraft_id, icao24 FROM dim_aircraft WHERE icao24 = ANY(%s)",
             (missing,),
         )
-        existing = {row[1]: row[0] for row in cursor.fetchall()}
-        result.update(existing)
+        found = {row[1]: row[0] for row in cursor.fetchall()}
 
-        new_icao24 = list(set(missing) - set(existing.keys()))
+        new_icao24 = list(set(missing) - set(found.keys()))
 
         if new_icao24:
-            execute_values(
+            # fetch=True: sans lui, seule la dernière page (100 lignes) du
+            # RETURNING serait lue
+            rows = execute_values(
                 cursor,
                 "INSERT INTO dim_aircraft (icao24) VALUES %s ON CONFLICT (icao24) DO NOTHING RETURNING aircraft_id, icao24",
                 [(icao,) for icao in new_icao24],
+                fetch=True,
             )
-            for row in cursor.fetchall():
-                result[row[1]] = row[0]
+            for row in rows:
+                found[row[1]] = row[0]
 
-        with cache_lock:
-            aircraft_cache.update(result)
+        aircraft_cache.update(found)
+        result.update(found)
 
-    if icao24_list:
-        cursor.execute(
-            "UPDATE dim_aircraft SET last_seen = NOW() WHERE icao24 = ANY(%s)",
-            (icao24_list,),
+    return result
+
+
+def write_last_seen(cursor, pending):
+    # Un seul UPDATE ... FROM (VALUES ...), trié par aircraft_id (ordre de
+    # verrouillage constant); les lignes dont last_seen n'avance pas ne sont
+    # pas réécrites
+    execute_values(
+        cursor,
+        """
+        UPDATE dim_aircraft AS d SET last_seen = v.last_seen
+        FROM (VALUES %s) AS v(aircraft_id, last_seen)
+        WHERE d.aircraft_id = v.aircraft_id
+          AND d.last_seen < v.last_seen
+        """,
+        sorted(pending.items()),
+        page_size=len(pending),
+    )
+    return cursor.rowcount
+
+
+def flush_last_seen():
+    # Avions vus depuis le dernier flush; en cas d'échec, ils sont remis dans
+    # l'accumulateur pour le flush suivant
+    pending = last_seen.drain()
+    if not pending:
+        return 0
+
+    try:
+        with pg_pool.connection() as conn:
+            with conn.cursor() as cursor:
+                updated = write_last_seen(cursor, pending)
+            conn.commit()
+    except Exception:
+        last_seen.restore(pending)
+        raise
+    return updated
+
+
+# Deltas additionnés aux lignes existantes, dans l'ordre de la clé (ordre de
+# verrouillage constant entre instances)
+HOURLY_STATS_UPSERT = """
+    INSERT INTO agg_hourly_stats AS s (
+        hour_timestamp, country_id, total_flights, altitude_sum, altitude_count,
+        velocity_sum, velocity_count, flights_on_ground, flights_airborne,
+        avg_altitude, avg_velocity
+    )
+    SELECT v.*,
+        v.altitude_sum / NULLIF(v.altitude_count, 0),
+        v.velocity_sum / NULLIF(v.velocity_count, 0)
+    FROM unnest(
+        %s::timestamp[], %s::int[], %s::int[], %s::float8[], %s::int[],
+        %s::float8[], %s::int[], %s::int[], %s::int[]
+    ) AS v(
+        hour_timestamp, country_id, total_flights, altitude_sum, altitude_count,
+        velocity_sum, velocity_count, flights_on_ground, flights_airborne
+    )
+    ORDER BY 1, 2
+    ON CONFLICT (hour_timestamp, country_id) DO UPDATE SET
+        total_flights = s.total_flights + EXCLUDED.total_flights,
+        altitude_sum = s.altitude_sum + EXCLUDED.altitude_sum,
+        altitude_count = s.altitude_count + EXCLUDED.altitude_count,
+        velocity_sum = s.velocity_sum + EXCLUDED.velocity_sum,
+        velocity_count = s.velocity_count + EXCLUDED.velocity_count,
+        flights_on_ground = s.flights_on_ground + EXCLUDED.flights_on_ground,
+        flights_airborne = s.flights_airborne + EXCLUDED.flights_airborne,
+        avg_altitude = (s.altitude_sum + EXCLUDED.altitude_sum)
+            / NULLIF(s.altitude_count + EXCLUDED.altitude_count, 0),
+        avg_velocity = (s.velocity_sum + EXCLUDED.velocity_sum)
+            / NULLIF(s.velocity_count + EXCLUDED.velocity_count, 0)
+"""
+
+
+def hourly_stats_columns(pending):
+    # {(heure, pays): deltas} -> une liste par colonne (paramètres de unnest)
+    return [
+        list(column)
+        for column in zip(
+            *(
+                (hour, country_id, *values)
+                for (hour, country_id), values in pending.items()
+            )
         )
+    ]
 
-    return result
+
+def write_hourly_stats(cursor, pending):
+    # Un seul upsert trié pour tous les deltas en attente (ordre des verrous
+    # constant entre écrivains et instances)
+    if pending:
+        cursor.execute(HOURLY_STATS_UPSERT, hourly_stats_columns(pending))
 
 
 def get_or_create_country_batch(cursor, country_list):
@@ -91,199 +303,839 @@ def get_or_create_country_batch(cursor, country_list):
 
     country_list = [c for c in country_list if c]
 
-    with cache_lock:
-        cached = {
-            country: country_cache[country]
-            for country in country_list
-            if country in country_cache
-        }
-        missing = [country for country in country_list if country not in country_cache]
-
-    result = cached.copy()
+    result, missing = country_cache.lookup(country_list)
 
     if missing:
         cursor.execute(
             "SELECT country_id, country_name FROM dim_country WHERE country_name = ANY(%s)",
             (missing,),
         )
-        existing = {row[1]: row[0] for row in cursor.fetchall()}
-        result.update(existing)
+        found = {row[1]: row[0] for row in cursor.fetchall()}
 
-        new_countries = list(set(missing) - set(existing.keys()))
+        new_countries = list(set(missing) - set(found.keys()))
 
         if new_countries:
-            execute_values(
+            rows = execute_values(
                 cursor,
                 "INSERT INTO dim_country (country_name) VALUES %s ON CONFLICT (country_name) DO NOTHING RETURNING country_id, country_name",
                 [(country,) for country in new_countries],
+                fetch=True,
             )
-            for row in cursor.fetchall():
-                result[row[1]] = row[0]
+            for row in rows:
+                found[row[1]] = row[0]
 
-        with cache_lock:
-            country_cache.update(result)
+        country_cache.update(found)
+        result.update(found)
 
     return result
 
 
-def process_chunk(chunk):
-    if not chunk:
+FACT_COLUMNS = (
+    "aircraft_id",
+    "country_id",
+    "callsign",
+    "longitude",
+    "latitude",
+    "geo_altitude",
+    "velocity",
+    "true_track",
+    "on_ground",
+    "api_timestamp",
+    "ingestion_time",
+)
+FACT_TYPES = (
+    "int4",
+    "int4",
+    "text",
+    "float8",
+    "float8",
+    "float8",
+    "float8",
+    "float8",
+    "bool",
+    "int4",
+    "timestamp",
+)
+
+# Mise à jour d'une position déjà chargée (rejeu): seulement si elle a changé,
+# pour ne pas réécrire (ni journaliser) des lignes identiques
+FACT_UPSERT = """
+    ON CONFLICT (aircraft_id, api_timestamp)
+    DO UPDATE SET
+        country_id = EXCLUDED.country_id,
+        callsign = EXCLUDED.callsign,
+        longitude = EXCLUDED.longitude,
+        latitude = EXCLUDED.latitude,
+        geo_altitude = EXCLUDED.geo_altitude,
+        velocity = EXCLUDED.velocity,
+        true_track = EXCLUDED.true_track,
+        on_ground = EXCLUDED.on_ground,
+        ingestion_time = EXCLUDED.ingestion_time,
+        processed_time = NOW()
+    WHERE (
+        fact_flight_positions.country_id, fact_flight_positions.callsign,
+        fact_flight_positions.longitude, fact_flight_positions.latitude,
+        fact_flight_positions.geo_altitude, fact_flight_positions.velocity,
+        fact_flight_positions.true_track, fact_flight_positions.on_ground,
+        fact_flight_positions.ingestion_time
+    ) IS DISTINCT FROM (
+        EXCLUDED.country_id, EXCLUDED.callsign, EXCLUDED.longitude,
+        EXCLUDED.latitude, EXCLUDED.geo_altitude, EXCLUDED.velocity,
+        EXCLUDED.true_track, EXCLUDED.on_ground, EXCLUDED.ingestion_time
+    )
+"""
+
+
+# Positions réellement insérées (xmax = 0: ni mises à jour ni rejouées à
+# l'identique), agrégées par (heure, pays) dans la requête qui les écrit
+FACT_RETURNING = """
+    RETURNING (xmax = 0) AS inserted, country_id, ingestion_time,
+        geo_altitude, velocity, on_ground
+"""
+HOURLY_DELTAS = """
+    SELECT date_trunc('hour', ingestion_time), country_id, count(*),
+        COALESCE(sum(geo_altitude), 0), count(geo_altitude),
+        COALESCE(sum(velocity), 0), count(velocity),
+        count(*) FILTER (WHERE on_ground), count(*) FILTER (WHERE NOT on_ground)
+    FROM merged
+    WHERE inserted
+    GROUP BY 1, 2
+"""
+
+
+def resolve_dimensions(cursor, documents):
+    icao24_list = [doc.get("icao24") for doc in documents if doc.get("icao24")]
+    country_list = [
+        doc.get("origin_country") for doc in documents if doc.get("origin_country")
+    ]
+
+    aircraft_map = get_or_create_aircraft_batch(cursor, icao24_list)
+    country_map = get_or_create_country_batch(cursor, country_list)
+    return aircraft_map, country_map
+
+
+def fact_rows(documents, aircraft_map, country_map):
+    rows = []
+    for doc in documents:
+        icao24 = doc.get("icao24")
+        if not icao24 or icao24 not in aircraft_map:
+            continue
+
+        rows.append(
+            (
+                aircraft_map[icao24],
+                country_map.get(doc.get("origin_country")),
+                doc.get("callsign"),
+                doc.get("longitude"),
+                doc.get("latitude"),
+                doc.get("geo_altitude"),
+                doc.get("velocity"),
+                doc.get("true_track"),
+                doc.get("on_ground"),
+                doc.get("api_timestamp"),
+                doc.get("ingestion_time"),
+            )
+        )
+    return rows
+
+
+def build_fact_rows(cursor, documents):
+    # Documents au format Mongo (avion.py) -> dimensions + lignes de faits
+    rows = fact_rows(documents, *resolve_dimensions(cursor, documents))
+    last_seen.add((row[0], row[10]) for row in rows)
+    return rows
+
+
+def insert_facts_values(cursor, rows, deltas):
+    # Un ON CONFLICT DO UPDATE ne peut pas toucher deux fois la même ligne:
+    # on garde la dernière occurrence de chaque (aircraft_id, api_timestamp).
+    # Les deltas de stats horaires des positions insérées sont ajoutés à
+    # `deltas`, écrits par l'appelant
+    rows = list({(row[0], row[9]): row for row in rows}.values())
+    inserted = execute_values(
+        cursor,
+        "WITH merged AS ("
+        f"INSERT INTO fact_flight_positions ({', '.join(FACT_COLUMNS)}) VALUES %s"
+        + FACT_UPSERT
+        + FACT_RETURNING
+        + ")"
+        + HOURLY_DELTAS,
+        rows,
+        page_size=1000,
+        fetch=True,
+    )
+    deltas.extend(inserted)
+    return len(rows)
+
+
+def next_batch_id(cursor):
+    cursor.execute("SELECT nextval('staging_batch_seq')")
+    return cursor.fetchone()[0]
+
+
+# Un seul INSERT ... SELECT qui vide le lot, dédoublonne et fusionne
+MERGE_STAGED = f"""
+    WITH batch AS (
+        DELETE FROM staging_flight_positions
+        WHERE batch_id = %s
+        RETURNING {", ".join(FACT_COLUMNS)}
+    ), merged AS (
+        INSERT INTO fact_flight_positions ({", ".join(FACT_COLUMNS)})
+        SELECT DISTINCT ON (aircraft_id, api_timestamp) {", ".join(FACT_COLUMNS)}
+        FROM batch
+        ORDER BY aircraft_id, api_timestamp, ingestion_time DESC
+    """ + FACT_UPSERT + FACT_RETURNING + ")" + HOURLY_DELTAS
+
+
+def merge_staged_batch(cursor, batch_id, deltas):
+    cursor.execute(MERGE_STAGED, (batch_id,))
+    deltas.extend(cursor.fetchall())
+
+
+def insert_facts_copy(cursor, rows, deltas):
+    # COPY binaire dans la table de staging UNLOGGED (sans WAL), puis fusion
+    batch_id = next_batch_id(cursor)
+    copy_rows(
+        cursor,
+        "staging_flight_positions",
+        ("batch_id",) + FACT_COLUMNS,
+        ("int8",) + FACT_TYPES,
+        [(batch_id,) + row for row in rows],
+    )
+    merge_staged_batch(cursor, batch_id, deltas)
+    return len({(row[0], row[9]) for row in rows})
+
+
+def insert_facts_values_arrow(cursor, table, deltas):
+    return insert_facts_values(cursor, arrow_batches.table_rows(table), deltas)
+
+
+def insert_facts_copy_arrow(cursor, table, deltas):
+    # Table Arrow -> COPY csv en staging, sans repasser par des tuples Python
+    batch_id = next_batch_id(cursor)
+    cursor.copy_expert(
+        f"COPY staging_flight_positions (batch_id, {', '.join(FACT_COLUMNS)}) "
+        "FROM STDIN WITH (FORMAT csv)",
+        arrow_batches.to_csv(table, batch_id),
+    )
+    merge_staged_batch(cursor, batch_id, deltas)
+    return len(arrow_batches.fact_keys(table))
+
+
+FACT_WRITERS = {"values": insert_facts_values, "copy": insert_facts_copy}
+ARROW_WRITERS = {"values": insert_facts_values_arrow, "copy": insert_facts_copy_arrow}
+
+
+def write_positions(cursor, documents, deltas, strategy=None):
+    rows = build_fact_rows(cursor, documents)
+    if not rows:
         return 0
+    return FACT_WRITERS[strategy or WRITE_STRATEGY](cursor, rows, deltas)
 
-    conn = get_pg_connection()
-    try:
+
+def cursor_key(doc):
+    return doc[CURSOR_FIELD], doc["_id"]
+
+
+def cursor_query(last_time, last_id, settled):
+    # Documents strictement après (last_time, last_id) dans l'ordre
+    # (CURSOR_FIELD, _id), et insérés avant `settled`: les ex aequo sur
+    # CURSOR_FIELD ne sont plus sautés. Suppose qu'un snapshot est écrit en
+    # entier avant le suivant (position_time croissant d'un snapshot à
+    # l'autre)
+    if last_id is None:
+        return settled_query({CURSOR_FIELD: {"$gt": last_time}}, settled)
+
+    already_read = [{"_id": {"$lte": last_id}}]
+    id_type = ID_TYPES.get(type(last_id))
+    if id_type in ID_TYPE_ORDER:
+        for earlier_type in ID_TYPE_ORDER[: ID_TYPE_ORDER.index(id_type)]:
+            already_read.append({"_id": {"$type": earlier_type}})
+
+    return settled_query(
+        {
+            CURSOR_FIELD: {"$gte": last_time},
+            "$nor": [{CURSOR_FIELD: last_time, "$or": already_read}],
+        },
+        settled,
+    )
+
+
+def settled_query(query, settled):
+    # Borne d'insertion sur ingestion_time (heure locale naïve), fusionnée
+    # avec la borne du curseur quand c'est le même champ
+    if CURSOR_FIELD == "ingestion_time":
+        query[CURSOR_FIELD]["$lt"] = settled
+    else:
+        query["ingestion_time"] = {"$lt": settled}
+    return query
+
+
+def key_order(key):
+    # Ordre de tri MongoDB d'une clé (CURSOR_FIELD, _id); _id None (premier
+    # lancement) se place après tous les documents de cet instant
+    last_time, last_id = key
+    if last_id is None:
+        return last_time, len(ID_TYPE_ORDER), ""
+    id_type = ID_TYPES.get(type(last_id))
+    rank = ID_TYPE_ORDER.index(id_type) if id_type in ID_TYPE_ORDER else -1
+    return last_time, rank, last_id
+
+
+def checkpoint_name(shard, writer=None):
+    # Un checkpoint par shard (None: toute la collection) et par écrivain de
+    # l'ETL synchrone: "<base>/<écrivain>"
+    name = CHECKPOINT_NAME if shard is None else f"{CHECKPOINT_NAME}#{shard}"
+    return name if writer is None else f"{name}/{writer}"
+
+
+def positions_query(positions):
+    # positions: shard -> dernière clé lue (shard None: toute la collection).
+    # Les shards à la même position sont lus par une seule branche
+    settled = datetime.now() - timedelta(seconds=SETTLE_SECONDS)
+    groups = {}
+    for shard, key in positions.items():
+        groups.setdefault(key, []).append(shard)
+
+    branches = []
+    for key, group in groups.items():
+        query = cursor_query(*key, settled)
+        if group != [None]:
+            query["shard"] = {"$in": sorted(group)}
+        branches.append(query)
+    return branches[0] if len(branches) == 1 else {"$or": branches}
+
+
+def advance(positions, key):
+    # Le curseur fusionne les shards dans l'ordre (CURSOR_FIELD, _id): tout
+    # document jusqu'à `key` est lu, quel que soit son shard
+    return {
+        shard: max(current, key, key=key_order) for shard, current in positions.items()
+    }
+
+
+CHECKPOINT_ROWS = """
+    SELECT base.name, c.cursor_time, c.cursor_id
+    FROM etl_checkpoint c
+    JOIN unnest(%s::text[]) AS base(name)
+      ON c.name = base.name OR starts_with(c.name, base.name || '/')
+"""
+
+
+def load_checkpoints(shards):
+    # Chaque écrivain valide son checkpoint avec ses faits: un shard reprend
+    # au plus petit checkpoint de ses écrivains, tout ce qui le précède est
+    # écrit par chacun d'eux
+    names = {checkpoint_name(shard): shard for shard in shards}
+    with pg_pool.connection() as conn:
         with conn.cursor() as cursor:
-            icao24_list = [doc.get("icao24") for doc in chunk if doc.get("icao24")]
-            country_list = [
-                doc.get("origin_country") for doc in chunk if doc.get("origin_country")
-            ]
-
-            aircraft_map = get_or_create_aircraft_batch(cursor, icao24_list)
-            country_map = get_or_create_country_batch(cursor, country_list)
-
-            values = []
-            for doc in chunk:
-                icao24 = doc.get("icao24")
-                if not icao24 or icao24 not in aircraft_map:
-                    continue
+            cursor.execute(CHECKPOINT_ROWS, (list(names),))
+            rows = cursor.fetchall()
+        conn.commit()
 
-                values.append(
-                    (
-                        aircraft_map[icao24],
-                        country_map.get(doc.get("origin_country")),
-                        doc.get("callsign"),
-                        doc.get("longitude"),
-                        doc.get("latitude"),
-                        doc.get("geo_altitude"),
-                        doc.get("velocity"),
-                        doc.get("true_track"),
-                        doc.get("on_ground"),
-                        doc.get("api_timestamp"),
-                        doc.get("ingestion_time"),
-                    )
-                )
+    found = {}
+    for name, cursor_time, cursor_id in rows:
+        key = cursor_time, bson.decode(bytes(cursor_id))["_id"]
+        found.setdefault(names[name], []).append(key)
+
+    start = initial_watermark(), None
+    return {
+        shard: min(found[shard], key=key_order) if shard in found else start
+        for shard in shards
+    }
 
-            if values:
-                execute_values(
-                    cursor,
-                    """
-                    INSERT INTO fact_flight_positions (
-                        aircraft_id, country_id, callsign, longitude, latitude,
-                        geo_altitude, velocity, true_track, on_ground,
-                        api_timestamp, ingestion_time
-                    ) VALUES %s
-                    ON CONFLICT (aircraft_id, api_timestamp)
-                    DO UPDATE SET
-                        country_id = EXCLUDED.country_id,
-                        callsign = EXCLUDED.callsign,
-                        longitude = EXCLUDED.longitude,
-                        latitude = EXCLUDED.latitude,
-                        geo_altitude = EXCLUDED.geo_altitude,
-                        velocity = EXCLUDED.velocity,
-                        true_track = EXCLUDED.true_track,
-                        on_ground = EXCLUDED.on_ground,
-                        ingestion_time = EXCLUDED.ingestion_time,
-                        processed_time = NOW()
-                    """,
-                    values,
-                )
 
+def reset_checkpoints(positions, writers):
+    # Au (re)démarrage, les checkpoints des shards repris (anciens écrivains
+    # compris, leur nombre a pu changer) sont remplacés par la position de
+    # départ de chaque écrivain: le minimum chargé, aucun document n'est sauté.
+    # Les deltas de stats que les anciens écrivains n'avaient pas encore
+    # ajoutés (arrêt brutal) sont perdus: leurs heures sont recalculées depuis
+    # les faits, dans la même transaction
+    if not positions:
+        return
+    with pg_pool.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM etl_checkpoint c USING unnest(%s::text[]) AS base(name) "
+                "WHERE c.name = base.name OR starts_with(c.name, base.name || '/') "
+                "RETURNING c.stats_since",
+                ([checkpoint_name(shard) for shard in sorted(positions, key=str)],),
+            )
+            since = min(
+                (row[0] for row in cursor.fetchall() if row[0] is not None),
+                default=None,
+            )
+            for writer in writers:
+                save_checkpoints(cursor, positions, writer)
+            if since is not None:
+                cursor.execute("SELECT backfill_hourly_stats(%s, 'infinity')", (since,))
+                print(
+                    f"Stats horaires recalculées depuis {since} "
+                    f"({cursor.fetchone()[0]} lignes corrigées)",
+                    flush=True,
+                )
         conn.commit()
-        return len(values)
-    except Exception as e:
-        conn.rollback()
-        print(f"Erreur chunk: {e}", flush=True)
-        return 0
-    finally:
-        conn.close()
 
 
-def run_etl():
-    print("Démarrage du pipeline ETL MongoDB -> PostgreSQL (multi-thread)")
-    print(
-        f"Intervalle: {ETL_INTERVAL}s | Batch size: {BATCH_SIZE} | Workers: {NUM_WORKERS}\n"
+def save_checkpoints(cursor, positions, writer=None, since=None):
+    # since: première heure des deltas de stats de l'écrivain pas encore
+    # ajoutés à agg_hourly_stats (None: aucun)
+    execute_values(
+        cursor,
+        """
+        INSERT INTO etl_checkpoint (name, cursor_time, cursor_id, stats_since)
+        VALUES %s
+        ON CONFLICT (name) DO UPDATE SET
+            cursor_time = EXCLUDED.cursor_time,
+            cursor_id = EXCLUDED.cursor_id,
+            stats_since = EXCLUDED.stats_since,
+            updated_at = NOW()
+        """,
+        [
+            (
+                checkpoint_name(shard, writer),
+                last_time,
+                bson.encode({"_id": last_id}),
+                since,
+            )
+            for shard, (last_time, last_id) in sorted(
+                positions.items(), key=lambda item: checkpoint_name(item[0], writer)
+            )
+        ],
     )
 
-    last_processed_time = datetime.now() - timedelta(hours=1)
 
-    conn = get_pg_connection()
+def owned_positions(positions, leases):
+    # Seuls les shards encore détenus avancent: un shard rendu est repris par
+    # une autre instance depuis son propre checkpoint
+    if leases is None:
+        return positions
+    return {shard: key for shard, key in positions.items() if shard in leases.owned}
 
+
+def write_group(writer, group, leases, stats):
+    # Parts en attente chez un écrivain, écrites dans une même transaction
+    # avec son checkpoint: la position du dernier chunk du groupe, que ses
+    # parts soient vides ou non. Les deltas de stats restent dans le buffer
+    # de l'écrivain, ajoutés à agg_hourly_stats à l'échéance du flush (ou
+    # sans checkpoint pour marquer les heures en attente)
+    futures = [future for _, _, future in group]
+    parts = [part for part, _, _ in group if len(part)]
+    positions = owned_positions(group[-1][1], leases)
+    flush = stats.due() or not positions
+    count = 0
+    deltas = []
     try:
-        with conn.cursor() as cursor:
-            with open("schema.sql", "r") as f:
-                cursor.execute(f.read())
+        with pg_pool.connection() as conn:
+            with conn.cursor() as cursor:
+                if parts:
+                    rows = CHUNK_MERGES[READ_FORMAT](parts)
+                    count = CHUNK_WRITERS[READ_FORMAT][WRITE_STRATEGY](
+                        cursor, rows, deltas
+                    )
+                pending = stats.with_deltas(deltas)
+                if flush:
+                    write_hourly_stats(cursor, pending)
+                if positions:
+                    save_checkpoints(
+                        cursor,
+                        positions,
+                        writer,
+                        None if flush else stats_since(pending),
+                    )
             conn.commit()
-            print("Schéma PostgreSQL initialisé\n")
     except Exception as e:
-        print(f"Schéma déjà existant ou erreur: {e}\n")
-        conn.rollback()
-    finally:
-        conn.close()
+        for future in futures:
+            future.set_exception(e)
+        return e
+    stats.commit(pending, flush)
+    # Positions comptées une fois pour le groupe
+    for future in futures[:-1]:
+        future.set_result(0)
+    futures[-1].set_result(count)
+    return None
+
 
-    cycle_count = 0
+def flush_writer_stats(writer, stats, positions, leases):
+    # Écrivain inactif ou arrêté: ses deltas en attente sont ajoutés et ses
+    # checkpoints (position inchangée) ne marquent plus d'heure en attente
+    positions = owned_positions(positions, leases)
+    try:
+        with pg_pool.connection() as conn:
+            with conn.cursor() as cursor:
+                write_hourly_stats(cursor, stats.pending)
+                if positions:
+                    save_checkpoints(cursor, positions, writer)
+            conn.commit()
+    except Exception as e:
+        # Les deltas restent marqués dans le checkpoint: recalculés au
+        # prochain démarrage si aucun flush ne réussit d'ici là
+        print(f"Erreur stats horaires (écrivain {writer}): {e}", flush=True)
+        stats.postpone()
+        return
+    stats.commit({}, True)
 
+
+def write_partitions(writer, pending, leases):
+    # Écrivain d'une partition d'avions: (lignes, positions, future) lus dans
+    # l'ordre du curseur. Tout ce qui attend dans la file part dans la même
+    # transaction: moins de commits quand l'écrivain prend du retard. Après
+    # un échec, plus rien n'est validé (son checkpoint ne doit pas dépasser
+    # la part perdue): les parts suivantes échouent jusqu'à l'arrêt. None:
+    # arrêt. Ses deltas de stats sont ajoutés à l'échéance, même sans chunk
+    stats = HourlyStatsBuffer(STATS_FLUSH_INTERVAL)
+    positions = None
+    error = None
     while True:
         try:
-            query = {"ingestion_time": {"$gt": last_processed_time}}
+            group = [pending.get(timeout=stats.wait())]
+        except queue.Empty:
+            flush_writer_stats(writer, stats, positions, leases)
+            continue
+        while group[-1] is not None:
+            try:
+                group.append(pending.get_nowait())
+            except queue.Empty:
+                break
+        stopping = group[-1] is None
+        if stopping:
+            group.pop()
+        if group and error is not None:
+            for _, _, future in group:
+                future.set_exception(error)
+        elif group:
+            error = write_group(writer, group, leases, stats)
+            if error is None:
+                positions = group[-1][1]
+        if stopping:
+            if stats.pending:
+                flush_writer_stats(writer, stats, positions, leases)
+            return
+
+
+def put_until_stopped(target, item, stop):
+    while not stop.is_set():
+        try:
+            target.put(item, timeout=1)
+            return True
+        except queue.Full:
+            pass
+    return False
 
-            documents = list(
-                mongo_collection.find(query).sort("ingestion_time", 1).limit(BATCH_SIZE)
-            )
 
-            if documents:
-                chunk_size = len(documents) // NUM_WORKERS
-                if chunk_size == 0:
-                    chunk_size = len(documents)
+def document_chunks(positions):
+    # Documents décodés en dict par pymongo, lus par lots de BATCH_SIZE et
+    # regroupés en chunks de CHUNK_SIZE
+    cursor = (
+        mongo_collection.find(positions_query(positions), FACT_PROJECTION)
+        .sort([(CURSOR_FIELD, 1), ("_id", 1)])
+        .batch_size(BATCH_SIZE)
+    )
+    chunk = []
+    for doc in cursor:
+        chunk.append(doc)
+        if len(chunk) == CHUNK_SIZE:
+            yield chunk, cursor_key(chunk[-1])
+            chunk = []
+    if chunk:
+        yield chunk, cursor_key(chunk[-1])
 
-                chunks = [
-                    documents[i : i + chunk_size]
-                    for i in range(0, len(documents), chunk_size)
-                ]
 
-                total_processed = 0
-                with ThreadPoolExecutor(max_workers=NUM_WORKERS) as executor:
-                    futures = [
-                        executor.submit(process_chunk, chunk) for chunk in chunks
-                    ]
-                    for future in as_completed(futures):
-                        total_processed += future.result()
+def arrow_chunks(positions):
+    # Lots BSON bruts du serveur (un chunk = un lot de CHUNK_SIZE documents)
+    # décodés en colonnes Arrow; seul le dernier document est décodé en dict
+    schema = arrow_batches.fact_schema()
+    batches = mongo_collection.find_raw_batches(
+        positions_query(positions),
+        FACT_PROJECTION,
+        sort=[(CURSOR_FIELD, 1), ("_id", 1)],
+        batch_size=CHUNK_SIZE,
+    )
+    for batch in batches:
+        key = cursor_key(arrow_batches.last_document(batch))
+        if transform_pool is None:
+            yield arrow_batches.decode_batch(batch, schema), key
+        else:
+            # Le lot part décoder dans un processus; la file garde l'ordre
+            yield transform_pool.submit(arrow_batches.decode_fact_batch, batch), key
 
-                last_processed_time = max(doc["ingestion_time"] for doc in documents)
 
-                now = datetime.now().strftime("%H:%M:%S")
+def build_fact_rows_arrow(cursor, table):
+    aircraft_map = get_or_create_aircraft_batch(
+        cursor, arrow_batches.unique_values(table["icao24"])
+    )
+    country_map = get_or_create_country_batch(
+        cursor, arrow_batches.unique_values(table["origin_country"])
+    )
+    table = arrow_batches.fact_table(table, aircraft_map, country_map)
+    last_seen.add(arrow_batches.last_seen(table))
+    return table
+
+
+def partition_rows(rows, partitions):
+    # aircraft_id % partitions: un avion est toujours écrit par le même écrivain
+    parts = [[] for _ in range(partitions)]
+    for row in rows:
+        parts[row[0] % partitions].append(row)
+    return parts
+
+
+def merge_rows(parts):
+    # Tri stable par (aircraft_id, api_timestamp): les verrous sont pris dans
+    # l'ordre de l'index, les doublons restent dans l'ordre du curseur
+    return sorted(
+        (row for part in parts for row in part), key=lambda row: (row[0], row[9])
+    )
+
+
+# Par format de lecture: lecture des chunks, construction des faits (lignes
+# ou table Arrow), découpage par avion, regroupement avant écriture et écrivains
+CHUNK_READERS = {"dict": document_chunks, "arrow": arrow_chunks}
+FACT_BUILDERS = {"dict": build_fact_rows, "arrow": build_fact_rows_arrow}
+CHUNK_PARTITIONS = {"dict": partition_rows, "arrow": arrow_batches.partition_table}
+CHUNK_MERGES = {"dict": merge_rows, "arrow": arrow_batches.merge_tables}
+CHUNK_WRITERS = {"dict": FACT_WRITERS, "arrow": ARROW_WRITERS}
+
+
+def read_chunks(positions, chunks, stop):
+    # Étape 1: curseur Mongo trié sur (CURSOR_FIELD, _id), projeté sur les
+    # champs utiles. Curseur épuisé: nouvelle requête après ETL_INTERVAL
+    while not stop.is_set():
+        try:
+            for chunk in CHUNK_READERS[READ_FORMAT](positions):
+                if not put_until_stopped(chunks, chunk, stop):
+                    return
+                positions = advance(positions, chunk[1])
+        except Exception as e:
+            # Reprise après le dernier chunk transmis (CursorNotFound, réseau...)
+            print(f"Erreur lecture Mongo: {e}", flush=True)
+        stop.wait(ETL_INTERVAL)
+
+
+def observe_chunk(futures, started):
+    # Observée par l'écrivain qui valide la dernière partition du chunk (sans
+    # attendre que la boucle principale repasse sur la tête de in_flight)
+    pending = [len(futures)]
+    lock = threading.Lock()
+
+    def done(_):
+        with lock:
+            pending[0] -= 1
+            last = pending[0] == 0
+        if last:
+            CHUNK_SECONDS.observe(time.monotonic() - started)
+
+    for future in futures:
+        future.add_done_callback(done)
+
+
+def run_pipeline(positions, workers, leases=None):
+    # lecteur Mongo -> file -> transformation (dimensions) -> écrivains
+    # PostgreSQL en parallèle. Au plus QUEUE_SIZE chunks lus d'avance (au
+    # moins un par processus de transformation, pour les occuper tous) et
+    # workers + QUEUE_SIZE chunks en cours d'écriture: mémoire bornée.
+    # Chaque chunk est découpé par avion entre les écrivains: un écrivain
+    # (un thread, ses partitions dans l'ordre du curseur) possède seul ses
+    # avions, deux écrivains ne verrouillent jamais la même position.
+    # Retourne à la première erreur ou quand les shards détenus changent,
+    # après arrêt des étapes; l'appelant repart du checkpoint validé
+    reset_checkpoints(owned_positions(positions, leases), range(workers))
+    stop = threading.Event()
+    chunks = queue.Queue(maxsize=max(QUEUE_SIZE, TRANSFORM_PROCESSES))
+    reader = threading.Thread(
+        target=read_chunks, args=(positions, chunks, stop), daemon=True
+    )
+    reader.start()
+
+    writer_queues = [queue.Queue() for _ in range(workers)]
+    writers = [
+        threading.Thread(
+            target=write_partitions, args=(writer, pending, leases), daemon=True
+        )
+        for writer, pending in enumerate(writer_queues)
+    ]
+    for writer in writers:
+        writer.start()
+    in_flight = deque()
+    max_in_flight = workers + QUEUE_SIZE
+    written = 0
+    report_count = 0
+    next_report = time.monotonic() + ETL_INTERVAL
+    next_flush = time.monotonic() + LAST_SEEN_FLUSH_INTERVAL
+
+    try:
+        while True:
+            # Chunks écrits par tous leurs écrivains (chacun a validé son
+            # checkpoint avec ses faits); au-delà de max_in_flight, attente du
+            # plus ancien. Le premier échec arrête le flux
+            while in_flight and (
+                all(future.done() for future in in_flight[0])
+                or len(in_flight) >= max_in_flight
+            ):
+                written += sum(future.result() for future in in_flight.popleft())
+
+            if leases is not None and leases.changed.is_set():
                 print(
-                    f"[{now}] Cycle #{cycle_count} | {total_processed} positions traitées ({NUM_WORKERS} threads)",
+                    f"Shards détenus: {len(leases.owned)}/{SHARD_COUNT}, reprise",
                     flush=True,
                 )
+                return
 
-                if cycle_count % 60 == 0 and cycle_count > 0:
-                    conn = get_pg_connection()
-                    try:
-                        with conn.cursor() as cursor:
-                            cursor.execute("SELECT refresh_latest_positions()")
-                            cursor.execute("SELECT aggregate_hourly_stats()")
-                            stats_count = cursor.fetchone()[0]
-                            cursor.execute("SELECT cleanup_old_positions(48)")
-                            deleted = cursor.fetchone()[0]
-                        conn.commit()
-                        print(
-                            f"   Vue matérialisée rafraîchie | {stats_count} stats horaires | {deleted} anciennes positions supprimées",
-                            flush=True,
-                        )
-                    finally:
-                        conn.close()
-
-            else:
+            if time.monotonic() >= next_report:
                 now = datetime.now().strftime("%H:%M:%S")
-                print(
-                    f"[{now}] Cycle #{cycle_count} | Aucune nouvelle donnée", flush=True
-                )
+                if written:
+                    print(
+                        f"[{now}] Cycle #{report_count} | {written} positions traitées "
+                        f"| file: {chunks.qsize()}/{QUEUE_SIZE} | en écriture: {len(in_flight)}",
+                        flush=True,
+                    )
+                else:
+                    print(
+                        f"[{now}] Cycle #{report_count} | Aucune nouvelle donnée",
+                        flush=True,
+                    )
+                written = 0
+                report_count += 1
+                next_report = time.monotonic() + ETL_INTERVAL
+
+            if time.monotonic() >= next_flush:
+                flush_last_seen()
+                next_flush = time.monotonic() + LAST_SEEN_FLUSH_INTERVAL
+
+            try:
+                documents, chunk_last_key = chunks.get(timeout=1)
+            except queue.Empty:
+                continue
+            started = time.monotonic()
+            if isinstance(documents, Future):
+                documents = arrow_batches.read_fact_batch(documents.result())
+
+            # Étape 2: dimensions résolues et validées avant l'écriture des
+            # faits, qui ne verrouille donc que des lignes de faits
+            with pg_pool.connection() as conn:
+                with conn.cursor() as cursor:
+                    rows = FACT_BUILDERS[READ_FORMAT](cursor, documents)
+                conn.commit()
+
+            # Étape 3: une partition par écrivain, avec la position du chunk.
+            # Les parts vides sont transmises aussi: l'écrivain avance son
+            # checkpoint même sans ligne à écrire
+            positions = advance(positions, chunk_last_key)
+            futures = []
+            parts = CHUNK_PARTITIONS[READ_FORMAT](rows, workers)
+            for pending, part in zip(writer_queues, parts):
+                futures.append(Future())
+                pending.put((part, positions, futures[-1]))
+            observe_chunk(futures, started)
+            in_flight.append(futures)
+
+    except Exception as e:
+        print(f"Erreur ETL: {e}", flush=True)
+    finally:
+        stop.set()
+        for pending in writer_queues:
+            pending.put(None)
+        for writer in writers:
+            writer.join()
+        reader.join()
+
 
+def init_schema():
+    with pg_pool.connection() as conn:
+        try:
+            with conn.cursor() as cursor:
+                with open("schema.sql", "r") as f:
+                    cursor.execute(f.read())
+                conn.commit()
+                print("Schéma PostgreSQL initialisé\n")
         except Exception as e:
-            print(f"Erreur ETL: {e}", flush=True)
+            print(f"Schéma déjà existant ou erreur: {e}\n")
+            conn.rollback()
+
+
+def cursor_now():
+    # ingestion_time est stocké en heure locale naïve, position_time en UTC
+    if MONGO_BACKEND == "timeseries":
+        return datetime.now(timezone.utc).replace(tzinfo=None)
+    return datetime.now()
+
+
+def initial_watermark():
+    return cursor_now() - timedelta(hours=1)
+
+
+def start_transform_pool(processes):
+    # spawn: les processus ne sont pas forkés depuis un processus qui a déjà
+    # des threads (lecteur, écrivains, métriques) et des sockets ouvertes
+    global transform_pool
+    transform_pool = ProcessPoolExecutor(
+        processes, mp_context=multiprocessing.get_context("spawn")
+    )
+    print(f"Décodage BSON -> Arrow dans {processes} processus\n", flush=True)
+
+
+def run_etl():
+    # Une connexion par écrivain, plus une pour la transformation et le
+    # checkpoint (et une pour le heartbeat des baux)
+    workers = max(1, min(NUM_WORKERS, PG_POOL_SIZE - 1 - SHARDING))
+
+    print(
+        "Démarrage du pipeline ETL MongoDB -> PostgreSQL (lecture, transformation et écriture en parallèle)"
+    )
+    print(
+        f"Intervalle: {ETL_INTERVAL}s | Lecture: {READ_FORMAT} | Lots Mongo: {BATCH_SIZE} | Chunks: {CHUNK_SIZE} "
+        f"| File: {QUEUE_SIZE} | Écrivains: {workers} | Pool PostgreSQL: {PG_POOL_SIZE} connexions\n"
+    )
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
+        print(f"Métriques Prometheus sur http://0.0.0.0:{METRICS_PORT}/metrics\n")
+
+    if READ_FORMAT == "arrow":
+        arrow_batches.require_arrow()
+    if TRANSFORM_PROCESSES:
+        if READ_FORMAT != "arrow":
+            raise RuntimeError("ETL_TRANSFORM_PROCESSES requiert ETL_READ_FORMAT=arrow")
+        start_transform_pool(TRANSFORM_PROCESSES)
+
+    init_schema()
+    warm_dimension_caches()
 
-        cycle_count += 1
-        time.sleep(ETL_INTERVAL)
+    leases = None
+    if SHARDING:
+        leases = ShardLeases(pg_pool, INSTANCE_ID, LEASE_TTL)
+        leases.start()
+        print(f"Instance {INSTANCE_ID} (bail de {LEASE_TTL}s)\n", flush=True)
+
+    try:
+        while True:
+            try:
+                if leases is None:
+                    shards = [None]
+                else:
+                    leases.changed.clear()
+                    shards = sorted(leases.owned)
+
+                if shards:
+                    positions = load_checkpoints(shards)
+                    oldest = min(positions.values(), key=key_order)
+                    scope = f" | {len(shards)}/{SHARD_COUNT} shards" if leases else ""
+                    print(
+                        f"Lecture après {CURSOR_FIELD}={oldest[0]} _id={oldest[1]}{scope}\n",
+                        flush=True,
+                    )
+                    run_pipeline(positions, workers, leases)
+                else:
+                    print("Aucun shard détenu, en attente\n", flush=True)
+                    leases.changed.wait(ETL_INTERVAL)
+                    continue
+            except Exception as e:
+                print(f"Erreur ETL: {e}", flush=True)
+            if leases is None or not leases.changed.is_set():
+                time.sleep(ETL_INTERVAL)
+    finally:
+        if leases is not None:
+            leases.release()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,167 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from fleet_simulator import FleetSimulator
+from opensky import LATITUDE, LONGITUDE
+from recordings import Replay, parse_speed
+
+
+def in_bbox(state, bbox):
+    lamin, lamax, lomin, lomax = bbox
+    latitude, longitude = state[LATITUDE], state[LONGITUDE]
+    return (
+        latitude is not None
+        and longitude is not None
+        and lamin <= latitude <= lamax
+        and lomin <= longitude <= lomax
+    )
+
+
+class FakeOpenSkyServer(ThreadingHTTPServer):
+    # Remplaçant local de /api/states/all: filtre bbox comme l'API réelle, avec
+    # latence et taux d'erreur simulés pour tester les retries du mode tuiles
+
+    def __init__(self, address, source, latency=0.0, error_rate=0.0):
+        super().__init__(address, FakeOpenSkyHandler)
+        self.source = source
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests_served = 0
+
+
+class FakeOpenSkyHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != "/api/states/all":
+            self.send_error(404)
+            return
+
+        self.server.requests_served += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if random.random() < self.server.error_rate:
+            self.send_error(503)
+            return
+
+        data = self.server.source()
+        if data is None:
+            self.send_error(410, "Fin du rejeu")
+            return
+        query = parse_qs(url.query)
+        if all(key in query for key in ("lamin", "lamax", "lomin", "lomax")):
+            bbox = [
+                float(query[key][0]) for key in ("lamin", "lamax", "lomin", "lomax")
+            ]
+            states = [s for s in data.get("states") or [] if in_bbox(s, bbox)]
+            data = {"time": data["time"], "states": states or None}
+
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def static_source(payload):
+    def source():
+        return dict(payload, time=int(time.time()))
+
+    return source
+
+
+def fleet_source(n_aircraft, speed, step=10.0):
+    simulator = FleetSimulator(n_aircraft)
+    lock = threading.Lock()
+    state = {"last": time.monotonic()}
+
+    # La flotte avance du temps écoulé x speed entre deux requêtes, ou d'un pas
+    # fixe par requête en vitesse max
+    def source():
+        with lock:
+            now = time.monotonic()
+            dt = step if speed is None else (now - state["last"]) * speed
+            state["last"] = now
+            if dt > 0:
+                simulator.step(dt)
+            return simulator.payload()
+
+    return source
+
+
+def replay_source(path, speed, loop):
+    replay = iter(Replay(path, speed, loop))
+
+    # Vitesse max: chaque requête reçoit le snapshot suivant
+    if speed is None:
+        lock = threading.Lock()
+
+        def next_snapshot():
+            with lock:
+                return next(replay, None)
+
+        return next_snapshot
+
+    # Sinon le rejeu avance en arrière-plan au rythme enregistré x speed
+    current = {"data": next(replay)}
+
+    def advance():
+        for data in replay:
+            current["data"] = data
+        current["data"] = None
+
+    threading.Thread(target=advance, daemon=True).start()
+    return lambda: current["data"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Faux serveur OpenSky local")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--payload", help="Réponse /states/all enregistrée (JSON)")
+    parser.add_argument(
+        "--aircraft", type=int, default=10000, help="Taille de la flotte simulée"
+    )
+    parser.add_argument("--replay", help="Enregistrements NDJSON (fichier ou dossier)")
+    parser.add_argument("--speed", default="1", help="1, 10, ... ou max")
+    parser.add_argument("--loop", action="store_true", help="Rejouer en boucle")
+    parser.add_argument("--latency", type=float, default=0.0, help="Secondes")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Part de 503")
+    args = parser.parse_args()
+
+    if args.replay:
+        source = replay_source(args.replay, parse_speed(args.speed), args.loop)
+        description = f"rejeu de {args.replay} (vitesse: {args.speed})"
+    elif args.payload:
+        with open(args.payload, "r") as f:
+            payload = json.load(f)
+        source = static_source(payload)
+        description = f"{len(payload.get('states') or [])} avions"
+    else:
+        source = fleet_source(args.aircraft, parse_speed(args.speed))
+        description = (
+            f"flotte simulée de {args.aircraft} avions (vitesse: {args.speed})"
+        )
+
+    server = FakeOpenSkyServer(
+        ("127.0.0.1", args.port), source, args.latency, args.error_rate
+    )
+    print(
+        f"Faux OpenSky sur http://127.0.0.1:{args.port}/api/states/all ({description})"
+    )
+    print(f"OPENSKY_URL=http://127.0.0.1:{args.port}/api/states/all")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+from geo import destination_point, haversine, initial_bearing
+
+# (pays, latitude, longitude, poids) - grands aéroports, pondérés par trafic
+AIRPORTS = [
+    ("United States", 33.64, -84.43, 9),
+    ("United States", 32.90, -97.04, 8),
+    ("United States", 39.86, -104.67, 7),
+    ("United States", 41.98, -87.90, 8),
+    ("United States", 33.94, -118.41, 7),
+    ("United States", 40.64, -73.78, 6),
+    ("United States", 25.80, -80.29, 4),
+    ("United States", 47.45, -122.31, 4),
+    ("Canada", 43.68, -79.63, 4),
+    ("Mexico", 19.44, -99.07, 3),
+    ("Brazil", -23.43, -46.47, 3),
+    ("United Kingdom", 51.47, -0.45, 6),
+    ("France", 49.01, 2.55, 5),
+    ("Germany", 50.04, 8.56, 5),
+    ("Germany", 48.35, 11.79, 3),
+    ("Netherlands", 52.31, 4.76, 5),
+    ("Spain", 40.47, -3.57, 4),
+    ("Italy", 41.80, 12.25, 3),
+    ("Switzerland", 47.46, 8.55, 2),
+    ("Turkey", 41.26, 28.74, 5),
+    ("Russian Federation", 55.97, 37.41, 3),
+    ("United Arab Emirates", 25.25, 55.36, 5),
+    ("Qatar", 25.27, 51.61, 3),
+    ("India", 28.56, 77.10, 4),
+    ("India", 19.09, 72.87, 3),
+    ("China", 40.08, 116.58, 6),
+    ("China", 31.14, 121.81, 5),
+    ("China", 23.39, 113.30, 5),
+    ("Japan", 35.55, 139.78, 4),
+    ("Republic of Korea", 37.46, 126.44, 3),
+    ("Singapore", 1.36, 103.99, 3),
+    ("Thailand", 13.69, 100.75, 3),
+    ("Australia", -33.95, 151.18, 3),
+    ("South Africa", -26.14, 28.24, 2),
+    ("Egypt", 30.12, 31.41, 2),
+    ("Ireland", 53.42, -6.27, 2),
+]
+
+# Pays d'immatriculation (origin_country), indépendant de la position
+COUNTRY_MIX = {
+    "United States": 0.34,
+    "China": 0.08,
+    "United Kingdom": 0.05,
+    "Germany": 0.05,
+    "Ireland": 0.04,
+    "France": 0.04,
+    "Canada": 0.04,
+    "Turkey": 0.03,
+    "United Arab Emirates": 0.03,
+    "Spain": 0.03,
+    "India": 0.03,
+    "Brazil": 0.03,
+    "Japan": 0.03,
+    "Australia": 0.02,
+    "Netherlands": 0.02,
+    "Switzerland": 0.02,
+    "Mexico": 0.02,
+    "Russian Federation": 0.02,
+    "Republic of Korea": 0.02,
+    "Italy": 0.02,
+    "Qatar": 0.01,
+    "Malta": 0.01,
+    "Austria": 0.01,
+    "Singapore": 0.01,
+    "Thailand": 0.01,
+}
+
+AIRLINES = [
+    "AAL",
+    "DAL",
+    "UAL",
+    "SWA",
+    "BAW",
+    "AFR",
+    "DLH",
+    "RYR",
+    "EZY",
+    "UAE",
+    "CES",
+    "CSN",
+    "ANA",
+    "KLM",
+    "THY",
+    "QTR",
+    "SIA",
+    "QFA",
+    "IBE",
+    "ACA",
+]
+
+CLIMB_RATE = 12.0
+DESCENT_RATE = 15.0
+ACCELERATION = 2.0
+# Règle des 3 pour 1: 3 NM de descente par 1000 ft, soit ~18 m au sol par m d'altitude
+GLIDE_RATIO = 18.0
+APPROACH_SPEED = 75.0
+TAXI_SPEED = 8.0
+MISSING_POSITION_RATE = 0.02
+
+
+class FleetSimulator:
+    # Flotte de N avions simulée par colonnes NumPy: vols en grand cercle entre
+    # aéroports, montée / croisière / descente, escale au sol puis redécollage.
+    # payload() renvoie un snapshot au format /api/states/all d'OpenSky.
+
+    def __init__(self, n_aircraft, seed=42, start_time=None):
+        self.n = n_aircraft
+        self.rng = np.random.default_rng(seed)
+        self.time = float(start_time if start_time is not None else time.time())
+
+        rng = self.rng
+        self.icao24 = self._unique_icao24(n_aircraft)
+        airlines = rng.choice(AIRLINES, n_aircraft)
+        numbers = rng.integers(1, 9999, n_aircraft)
+        self.callsign = np.array(
+            [f"{a}{n}".ljust(8) for a, n in zip(airlines, numbers.tolist())],
+            dtype=object,
+        )
+        countries = list(COUNTRY_MIX)
+        weights = np.array(list(COUNTRY_MIX.values()))
+        self.country = rng.choice(
+            np.array(countries, dtype=object), n_aircraft, p=weights / weights.sum()
+        )
+
+        self.airport_lat = np.array([a[1] for a in AIRPORTS])
+        self.airport_lon = np.array([a[2] for a in AIRPORTS])
+        airport_weights = np.array([a[3] for a in AIRPORTS], dtype=np.float64)
+        self.airport_p = airport_weights / airport_weights.sum()
+
+        origin = rng.choice(len(AIRPORTS), n_aircraft, p=self.airport_p)
+        self.destination = self._pick_destinations(origin)
+        self.cruise_altitude = rng.uniform(9000, 12000, n_aircraft)
+        self.cruise_speed = rng.uniform(220, 255, n_aircraft)
+
+        # Départ "en régime": chaque avion est déjà à une fraction de son vol
+        origin_lat = self.airport_lat[origin] + rng.normal(0, 0.01, n_aircraft)
+        origin_lon = self.airport_lon[origin] + rng.normal(0, 0.01, n_aircraft)
+        dest_lat, dest_lon = self._destination_coords()
+        total = haversine(origin_lat, origin_lon, dest_lat, dest_lon)
+        progress = rng.uniform(0, 1, n_aircraft)
+        bearing = initial_bearing(origin_lat, origin_lon, dest_lat, dest_lon)
+        self.latitude, self.longitude = destination_point(
+            origin_lat, origin_lon, bearing, total * progress
+        )
+
+        flown = total * progress
+        remaining = total - flown
+        self.altitude = np.minimum(
+            self.cruise_altitude, np.minimum(flown, remaining) / GLIDE_RATIO
+        )
+        self.velocity = self._target_speed()
+        self.on_ground = rng.uniform(0, 1, n_aircraft) < 0.12
+        self.ground_until = self.time + rng.uniform(0, 5400, n_aircraft)
+        self.altitude[self.on_ground] = 0.0
+        self.velocity[self.on_ground] = 0.0
+        self.track = initial_bearing(self.latitude, self.longitude, dest_lat, dest_lon)
+        self.vertical_rate = np.zeros(n_aircraft)
+
+    def _unique_icao24(self, n):
+        codes = np.unique(self.rng.integers(0, 2**24, int(n * 1.2) + 16))
+        while len(codes) < n:
+            extra = self.rng.integers(0, 2**24, n)
+            codes = np.unique(np.concatenate([codes, extra]))
+        codes = self.rng.permutation(codes)[:n]
+        return np.array([f"{code:06x}" for code in codes.tolist()], dtype=object)
+
+    def _pick_destinations(self, current):
+        destination = self.rng.choice(len(AIRPORTS), len(current), p=self.airport_p)
+        same = destination == current
+        destination[same] = (destination[same] + 1) % len(AIRPORTS)
+        return destination
+
+    def _destination_coords(self):
+        return self.airport_lat[self.destination], self.airport_lon[self.destination]
+
+    def _target_speed(self):
+        # Vitesse d'approche à basse altitude, vitesse de croisière au-dessus de 3000 m
+        ratio = np.clip(self.altitude / 3000.0, 0, 1)
+        return APPROACH_SPEED + (self.cruise_speed - APPROACH_SPEED) * ratio
+
+    def step(self, dt):
+        self.time += dt
+        rng = self.rng
+        airborne = ~self.on_ground
+        previous_altitude = self.altitude.copy()
+
+        dest_lat, dest_lon = self._destination_coords()
+        remaining = haversine(self.latitude, self.longitude, dest_lat, dest_lon)
+        bearing = initial_bearing(self.latitude, self.longitude, dest_lat, dest_lon)
+
+        target_altitude = np.minimum(self.cruise_altitude, remaining / GLIDE_RATIO)
+        altitude = self.altitude + np.clip(
+            target_altitude - self.altitude, -DESCENT_RATE * dt, CLIMB_RATE * dt
+        )
+        self.altitude = np.where(airborne, np.maximum(altitude, 0), 0.0)
+
+        speed = self.velocity + np.clip(
+            self._target_speed() - self.velocity, -ACCELERATION * dt, ACCELERATION * dt
+        )
+        distance = np.minimum(speed * dt, remaining)
+        lat, lon = destination_point(self.latitude, self.longitude, bearing, distance)
+
+        self.latitude = np.where(airborne, lat, self.latitude)
+        self.longitude = np.where(airborne, lon, self.longitude)
+        self.track = np.where(airborne, bearing, self.track)
+        self.velocity = np.where(
+            airborne, speed, TAXI_SPEED * (rng.uniform(0, 1, self.n) < 0.2)
+        )
+
+        # Atterrissage: arrivé à destination, escale de 30 min à 2 h
+        landed = airborne & (remaining - distance < 1000)
+        if landed.any():
+            self.on_ground[landed] = True
+            self.latitude[landed] = dest_lat[landed]
+            self.longitude[landed] = dest_lon[landed]
+            self.altitude[landed] = 0.0
+            self.velocity[landed] = 0.0
+            self.ground_until[landed] = self.time + rng.uniform(
+                1800, 7200, landed.sum()
+            )
+
+        # Décollage: fin d'escale, nouvelle destination
+        departing = self.on_ground & ~landed & (self.time >= self.ground_until)
+        if departing.any():
+            self.destination[departing] = self._pick_destinations(
+                self.destination[departing]
+            )
+            self.on_ground[departing] = False
+            self.velocity[departing] = APPROACH_SPEED
+
+        if dt:
+            self.vertical_rate = (self.altitude - previous_altitude) / dt
+        else:
+            self.vertical_rate = np.zeros_like(self.altitude)
+
+    def payload(self):
+        now = int(self.time)
+        n = self.n
+        missing = self.rng.uniform(0, 1, n) < MISSING_POSITION_RATE
+
+        def nullable(values, decimals):
+            values = np.round(values, decimals).astype(object)
+            values[missing] = None
+            return values.tolist()
+
+        altitude = np.round(self.altitude, 2).tolist()
+        constant_now = [now] * n
+        states = list(
+            zip(
+                self.icao24.tolist(),
+                self.callsign.tolist(),
+                self.country.tolist(),
+                constant_now,
+                constant_now,
+                nullable(self.longitude, 4),
+                nullable(self.latitude, 4),
+                altitude,
+                self.on_ground.tolist(),
+                np.round(self.velocity, 2).tolist(),
+                np.round(self.track, 2).tolist(),
+                np.round(self.vertical_rate, 2).tolist(),
+                [None] * n,
+                altitude,
+                [None] * n,
+                [False] * n,
+                [0] * n,
+            )
+        )
+        return {"time": now, "states": states}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Génère des snapshots OpenSky synthétiques (NDJSON sur stdout)"
+    )
+    parser.add_argument("--aircraft", type=int, default=100000)
+    parser.add_argument("--snapshots", type=int, default=10)
+    parser.add_argument("--step", type=float, default=10.0, help="Secondes simulées")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    simulator = FleetSimulator(args.aircraft, args.seed)
+    for _ in range(args.snapshots):
+        simulator.step(args.step)
+        print(json.dumps(simulator.payload(), separators=(",", ":")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import numpy as np
+
+EARTH_RADIUS = 6371000.0
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def initial_bearing(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    y = np.sin(lon2 - lon1) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(lon2 - lon1)
+    return np.degrees(np.arctan2(y, x)) % 360
+
+
+def destination_point(lat, lon, bearing, distance):
+    lat, lon, bearing = map(np.radians, (lat, lon, bearing))
+    delta = distance / EARTH_RADIUS
+    lat2 = np.arcsin(
+        np.sin(lat) * np.cos(delta) + np.cos(lat) * np.sin(delta) * np.cos(bearing)
+    )
+    lon2 = lon + np.arctan2(
+        np.sin(bearing) * np.sin(delta) * np.cos(lat),
+        np.cos(delta) - np.sin(lat) * np.sin(lat2),
+    )
+    return np.degrees(lat2), (np.degrees(lon2) + 540) % 360 - 180
+
+
+def heading_difference(a, b):
+    # Écart angulaire en degrés, dans [0, 180]
+    return np.abs((a - b + 180) % 360 - 180)
@@ -0,0 +1,85 @@
+import time
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+API_LATENCY = Histogram(
+    "opensky_api_latency_seconds",
+    "Durée d'un fetch /states/all (toutes tuiles comprises)",
+    buckets=LATENCY_BUCKETS,
+)
+DECODE_SECONDS = Histogram(
+    "ingestion_decode_seconds",
+    "Décodage d'un snapshot en documents / opérations Mongo",
+    buckets=LATENCY_BUCKETS,
+)
+WRITE_SECONDS = Histogram(
+    "ingestion_bulk_write_seconds",
+    "Durée du bulk_write / insert_many d'un snapshot",
+    buckets=LATENCY_BUCKETS,
+)
+
+STATES_RECEIVED = Counter(
+    "ingestion_states_received_total", "États reçus de l'API OpenSky"
+)
+STATES_FILTERED = Counter(
+    "ingestion_states_filtered_total",
+    "États écartés avant écriture",
+    ["reason"],
+)
+DOCUMENTS = Counter(
+    "ingestion_documents_total",
+    "Documents écrits dans MongoDB par résultat",
+    ["result"],
+)
+ERRORS = Counter("ingestion_errors_total", "Erreurs d'ingestion par type", ["type"])
+
+SNAPSHOTS_SKIPPED = Counter(
+    "ingestion_snapshots_skipped_total",
+    "Snapshots ignorés car `time` n'a pas avancé depuis le précédent",
+)
+SCRAPE_PERIOD = Gauge(
+    "ingestion_scrape_interval_seconds", "Période de scraping courante (adaptative)"
+)
+SNAPSHOTS_DROPPED = Counter(
+    "ingestion_snapshots_dropped_total",
+    "Snapshots abandonnés, file d'écriture pleine (moteur async)",
+)
+QUEUE_DEPTH = Gauge(
+    "ingestion_queue_depth", "Snapshots en attente d'écriture (moteur async)"
+)
+
+_last_snapshot = {"time": None}
+
+
+def _last_snapshot_age():
+    last = _last_snapshot["time"]
+    return time.time() - last if last else float("nan")
+
+
+LAST_SNAPSHOT_AGE = Gauge(
+    "ingestion_last_snapshot_age_seconds",
+    "Secondes écoulées depuis le dernier snapshot écrit avec succès",
+)
+LAST_SNAPSHOT_AGE.set_function(_last_snapshot_age)
+
+
+def record_written(mode, written):
+    # written: (insérés, doublons) en insert, (upserts, modifiés) en upsert
+    _last_snapshot["time"] = time.time()
+    if not written:
+        return
+    first, second = written
+    if mode == "insert":
+        DOCUMENTS.labels("inserted").inc(first)
+        DOCUMENTS.labels("duplicate").inc(second)
+    else:
+        DOCUMENTS.labels("upserted").inc(first)
+        DOCUMENTS.labels("modified").inc(second)
+
+
+def start_metrics_server(port):
+    if port:
+        start_http_server(port)
+        print(f"Métriques Prometheus sur http://0.0.0.0:{port}/metrics", flush=True)
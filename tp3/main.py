@@ -137,12 +137,13 @@ def print_output(name, proc, prefix_color):
     proc.stdout.close()
 
 
-def start_process(name, script, color):
+def start_process(name, script, color, env=None):
     print(f"\nDémarrage de {name}...")
 
     proc = subprocess.Popen(
         [sys.executable, "-u", script],
         cwd=SCRIPT_DIR,
+        env={**os.environ, **env} if env else None,
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
         text=True,
@@ -193,10 +194,40 @@ def main():
 
     BLUE = "\033[94m"
     GREEN = "\033[92m"
-
-    start_process("Ingestion MongoDB", "avion.py", BLUE)
-    time.sleep(2)
-    start_process("ETL PostgreSQL", "etl_pipeline.py", GREEN)
+    MAGENTA = "\033[95m"
+
+    engine = os.getenv("INGESTION_ENGINE", "sync")
+    if engine == "direct":
+        # OpenSky -> PostgreSQL en un seul processus, sans passer par Mongo
+        start_process("Ingestion directe PostgreSQL", "direct_ingestion.py", GREEN)
+    else:
+        ingestion_script = "avion_async.py" if engine == "async" else "avion.py"
+        start_process("Ingestion MongoDB", ingestion_script, BLUE)
+        time.sleep(2)
+        instances = int(os.getenv("ETL_INSTANCES", "1"))
+        if os.getenv("ETL_ENGINE", "sync") == "async":
+            # ETL asyncio + psycopg 3, une seule instance
+            start_process("ETL PostgreSQL", "etl_async.py", GREEN)
+        elif instances == 1:
+            start_process("ETL PostgreSQL", "etl_pipeline.py", GREEN)
+        else:
+            # Instances ETL qui se partagent les shards d'icao24 par baux
+            metrics_port = int(os.getenv("ETL_METRICS_PORT", "8001"))
+            for i in range(instances):
+                start_process(
+                    f"ETL PostgreSQL {i + 1}/{instances}",
+                    "etl_pipeline.py",
+                    GREEN,
+                    {
+                        "ETL_SHARDING": "true",
+                        "ETL_METRICS_PORT": str(
+                            metrics_port + i if metrics_port else 0
+                        ),
+                    },
+                )
+
+    # Vue matérialisée, stats horaires et purge sur leurs propres créneaux
+    start_process("Maintenance PostgreSQL", "maintenance.py", MAGENTA)
 
     try:
         monitor_processes()
@@ -0,0 +1,234 @@
+import argparse
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+from pg_config import (
+    PG_CONFIG,
+    PG_POOL_HEALTH_CHECK_AFTER,
+    PG_POOL_MAX_LIFETIME,
+    PG_POOL_TIMEOUT,
+)
+from pg_pool import ConnectionPool
+
+# Chaque tâche tourne sur des créneaux alignés sur l'horloge (toutes les N
+# secondes depuis l'epoch), dans ce processus séparé: l'ETL ne l'attend plus
+REFRESH_INTERVAL = int(os.getenv("MAINTENANCE_REFRESH_INTERVAL", "60"))
+CLEANUP_INTERVAL = int(os.getenv("MAINTENANCE_CLEANUP_INTERVAL", "3600"))
+RETENTION_HOURS = int(os.getenv("MAINTENANCE_RETENTION_HOURS", "48"))
+METRICS_PORT = int(os.getenv("MAINTENANCE_METRICS_PORT", "8010"))
+
+# Premier argument des verrous consultatifs (le second est hashtext(tâche))
+LOCK_NAMESPACE = 7301
+
+JOB_DURATION = Histogram(
+    "maintenance_job_duration_seconds",
+    "Durée d'une tâche de maintenance",
+    ["job"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300),
+)
+JOB_LAG = Gauge(
+    "maintenance_job_lag_seconds",
+    "Retard du dernier lancement sur son créneau",
+    ["job"],
+)
+JOB_RUNS = Counter(
+    "maintenance_job_runs_total",
+    "Lancements par résultat (ok, unchanged, locked, error)",
+    ["job", "result"],
+)
+JOB_LAST_SUCCESS = Gauge(
+    "maintenance_job_last_success_timestamp_seconds",
+    "Dernière exécution réussie (epoch)",
+    ["job"],
+)
+
+pg_pool = ConnectionPool(
+    PG_CONFIG,
+    max_size=1,
+    max_lifetime=PG_POOL_MAX_LIFETIME,
+    health_check_after=PG_POOL_HEALTH_CHECK_AFTER,
+    timeout=PG_POOL_TIMEOUT,
+)
+
+
+def fact_state(cursor):
+    # Dernière position insérée (index de la clé primaire) et compteurs de
+    # mises à jour / suppressions de PostgreSQL: changent à chaque écriture
+    cursor.execute("""
+        SELECT
+            (SELECT max(position_id) FROM fact_flight_positions),
+            (SELECT n_tup_upd + n_tup_del FROM pg_stat_user_tables
+             WHERE relid = 'fact_flight_positions'::regclass)
+        """)
+    return cursor.fetchone()
+
+
+def expired_state(cursor):
+    # Rien à faire tant que la plus ancienne position est dans la rétention
+    cursor.execute(
+        "SELECT min(ingestion_time) FROM fact_flight_positions "
+        "HAVING min(ingestion_time) < NOW() - make_interval(hours => %s)",
+        (RETENTION_HOURS,),
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+class MaintenanceJob:
+    # Requête lancée toutes les `interval` secondes, seulement si `state`
+    # (None: rien à faire) a changé depuis la dernière exécution réussie
+
+    def __init__(self, name, interval, query, params=(), state=None):
+        self.name = name
+        self.interval = interval
+        self.query = query
+        self.params = params
+        self.state = state
+        self.last_state = None
+        self.next_run = self.next_slot(time.time())
+
+    def next_slot(self, now):
+        # Créneaux manqués (tâche plus longue que son intervalle) abandonnés
+        return (now // self.interval + 1) * self.interval
+
+    def run(self, pool):
+        # Verrou consultatif de transaction: deux processus de maintenance
+        # ne lancent jamais la même tâche en même temps
+        with pool.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT pg_try_advisory_xact_lock(%s, hashtext(%s))",
+                    (LOCK_NAMESPACE, self.name),
+                )
+                if not cursor.fetchone()[0]:
+                    conn.rollback()
+                    return "locked", None
+
+                state = self.state(cursor) if self.state else None
+                if self.state and (state is None or state == self.last_state):
+                    conn.rollback()
+                    return "unchanged", None
+
+                cursor.execute(self.query, self.params)
+                result = cursor.fetchone()[0]
+            conn.commit()
+        self.last_state = state
+        return "ok", result
+
+
+JOBS = [
+    MaintenanceJob(
+        "refresh_latest_positions",
+        REFRESH_INTERVAL,
+        "SELECT refresh_latest_positions()",
+        state=fact_state,
+    ),
+    MaintenanceJob(
+        "cleanup_old_positions",
+        CLEANUP_INTERVAL,
+        "SELECT cleanup_old_positions(%s)",
+        (RETENTION_HOURS,),
+        state=expired_state,
+    ),
+]
+
+
+def run_due_job(jobs, stop):
+    # Une tâche à la fois: la plus proche de son créneau
+    job = min(jobs, key=lambda job: job.next_run)
+    if stop.wait(max(job.next_run - time.time(), 0)):
+        return
+
+    lag = time.time() - job.next_run
+    JOB_LAG.labels(job.name).set(lag)
+    start = time.monotonic()
+    try:
+        status, result = job.run(pg_pool)
+    except Exception as e:
+        status, result = "error", e
+    duration = time.monotonic() - start
+    JOB_RUNS.labels(job.name, status).inc()
+    if status == "ok":
+        JOB_DURATION.labels(job.name).observe(duration)
+        JOB_LAST_SUCCESS.labels(job.name).set_to_current_time()
+
+    if status in ("ok", "error"):
+        now = datetime.now().strftime("%H:%M:%S")
+        detail = f" ({result})" if result not in (None, "") else ""
+        print(
+            f"[{now}] {job.name}: {status}{detail} | {duration:.2f}s | retard {lag:.2f}s",
+            flush=True,
+        )
+    job.next_run = job.next_slot(time.time())
+
+
+def run_scheduler(jobs=JOBS, stop=None):
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        run_due_job(jobs, stop)
+
+
+def run_backfill(args):
+    # Heures closes par défaut: l'heure en cours change encore. L'ETL peut
+    # tourner pendant le recalcul, sérialisé avec ses flushs de stats et
+    # arrêté avant les heures qu'un écrivain garde en attente (verrou et
+    # borne pris par backfill_hourly_stats)
+    until = args.until or datetime.now().replace(minute=0, second=0, microsecond=0)
+    since = args.since or until - timedelta(hours=args.hours)
+    print(f"Recalcul des stats horaires de {since} à {until}", flush=True)
+    start = time.monotonic()
+    with pg_pool.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT backfill_hourly_stats(%s, %s)", (since, until))
+            upserted = cursor.fetchone()[0]
+        conn.commit()
+    print(
+        f"{upserted} lignes (heure, pays) corrigées en {time.monotonic() - start:.2f}s"
+    )
+
+
+def run_maintenance(args):
+    print("Démarrage de la maintenance PostgreSQL")
+    for job in JOBS:
+        print(f"  - {job.name}: toutes les {job.interval}s")
+    print()
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
+    try:
+        run_scheduler()
+    except KeyboardInterrupt:
+        print("\nArrêt de la maintenance")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintenance PostgreSQL")
+    parser.set_defaults(func=run_maintenance)
+    subparsers = parser.add_subparsers(dest="command")
+
+    backfill = subparsers.add_parser(
+        "backfill", help="Recalcul exact de agg_hourly_stats depuis les faits"
+    )
+    backfill.add_argument(
+        "--hours", type=int, default=48, help="Heures closes à recalculer"
+    )
+    backfill.add_argument(
+        "--since", type=datetime.fromisoformat, help="Début (heure locale, ISO)"
+    )
+    backfill.add_argument(
+        "--until", type=datetime.fromisoformat, help="Fin exclue (heure locale, ISO)"
+    )
+    backfill.set_defaults(func=run_backfill)
+
+    args = parser.parse_args()
+    try:
+        args.func(args)
+    finally:
+        pg_pool.closeall()
+
+
+if __name__ == "__main__":
+    main()
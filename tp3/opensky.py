@@ -0,0 +1,216 @@
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import compress
+
+import numpy as np
+import requests
+
+URL_OPENSKY = "https://opensky-network.org/api/states/all"
+
+# Position des champs dans un vecteur d'état OpenSky (/states/all)
+ICAO24 = 0
+CALLSIGN = 1
+ORIGIN_COUNTRY = 2
+LAST_CONTACT = 4
+LONGITUDE = 5
+LATITUDE = 6
+ON_GROUND = 8
+VELOCITY = 9
+TRUE_TRACK = 10
+GEO_ALTITUDE = 13
+
+
+class Snapshot:
+    # Snapshot /states/all décodé ligne à ligne: les états sans position sont
+    # écartés (même règle que `if state[5] and state[6]`) et les documents
+    # Mongo construits par une boucle simple. Les colonnes typées du filtre de
+    # trajectoire sont calculées à la demande depuis les états gardés
+
+    def __init__(self, data):
+        self.time = data["time"]
+        states = data.get("states") or []
+        self.received = len(states)
+        self.states = [
+            state for state in states if state[LONGITUDE] and state[LATITUDE]
+        ]
+
+    def __len__(self):
+        return len(self.states)
+
+    @property
+    def longitude(self):
+        return self.column(LONGITUDE)
+
+    @property
+    def latitude(self):
+        return self.column(LATITUDE)
+
+    def column(self, index, dtype=np.float64):
+        # Colonne typée (None -> NaN en float64)
+        return np.array([state[index] for state in self.states], dtype=dtype)
+
+    def select(self, keep):
+        # Ne garde que les états du masque
+        self.states = list(compress(self.states, keep.tolist()))
+        return self
+
+    def documents(self, ingestion_time):
+        timestamp = self.time
+        return [
+            {
+                "icao24": state[ICAO24],
+                "callsign": state[CALLSIGN].strip() if state[CALLSIGN] else "N/A",
+                "origin_country": state[ORIGIN_COUNTRY],
+                "longitude": state[LONGITUDE],
+                "latitude": state[LATITUDE],
+                "geo_altitude": state[GEO_ALTITUDE],
+                "velocity": state[VELOCITY],
+                "true_track": state[TRUE_TRACK],
+                "on_ground": state[ON_GROUND],
+                "ingestion_time": ingestion_time,
+                "api_timestamp": timestamp,
+            }
+            for state in self.states
+        ]
+
+
+def decode_states(data):
+    return Snapshot(data)
+
+
+class Tile(namedtuple("Tile", "lamin lamax lomin lomax every")):
+    @property
+    def params(self):
+        return {
+            "lamin": self.lamin,
+            "lamax": self.lamax,
+            "lomin": self.lomin,
+            "lomax": self.lomax,
+        }
+
+    def is_due(self, cycle_count):
+        return cycle_count % self.every == 0
+
+    def overlaps(self, region):
+        lamin, lamax, lomin, lomax = region
+        return (
+            self.lamin < lamax
+            and lamin < self.lamax
+            and self.lomin < lomax
+            and lomin < self.lomax
+        )
+
+
+def parse_regions(spec):
+    # "lamin:lamax:lomin:lomax,..." -> [(lamin, lamax, lomin, lomax), ...]
+    return [
+        tuple(float(v) for v in region.split(":"))
+        for region in spec.split(",")
+        if region.strip()
+    ]
+
+
+def make_grid(rows, cols, hot_regions=(), cold_every=1):
+    lat_step = 180 / rows
+    lon_step = 360 / cols
+    tiles = []
+    for i in range(rows):
+        for j in range(cols):
+            tile = Tile(
+                -90 + i * lat_step,
+                -90 + (i + 1) * lat_step,
+                -180 + j * lon_step,
+                -180 + (j + 1) * lon_step,
+                1,
+            )
+            # Les tuiles hors zones denses (océans...) sont interrogées moins souvent
+            if not any(tile.overlaps(region) for region in hot_regions):
+                tile = tile._replace(every=cold_every)
+            tiles.append(tile)
+    return tiles
+
+
+def parse_grid(spec, hot_regions=(), cold_every=1):
+    # "4x8" -> grille de 4 bandes de latitude x 8 bandes de longitude
+    if not spec:
+        return []
+    rows, cols = (int(v) for v in spec.lower().split("x"))
+    return make_grid(rows, cols, hot_regions, cold_every)
+
+
+def merge_payloads(payloads):
+    # Les bornes d'une bbox sont inclusives: un avion sur une frontière peut
+    # apparaître dans deux tuiles, on garde le contact le plus récent
+    merged = {}
+    for payload in payloads:
+        for state in payload.get("states") or []:
+            current = merged.get(state[ICAO24])
+            if current is None or (state[LAST_CONTACT] or 0) > (
+                current[LAST_CONTACT] or 0
+            ):
+                merged[state[ICAO24]] = state
+    return {
+        "time": max(payload["time"] for payload in payloads),
+        "states": list(merged.values()),
+    }
+
+
+class FetchError(namedtuple("FetchError", "status message retry_after")):
+    # status: code HTTP, None pour une erreur réseau | retry_after: secondes
+    def __str__(self):
+        return self.message
+
+
+def should_retry(status_code):
+    return status_code == 429 or status_code >= 500
+
+
+def retry_after(headers):
+    # OpenSky indique l'attente imposée par X-Rate-Limit-Retry-After-Seconds
+    value = headers.get("X-Rate-Limit-Retry-After-Seconds") or headers.get(
+        "Retry-After"
+    )
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def fetch_tile(url, tile, timeout, retries, backoff):
+    error = None
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(backoff * 2 ** (attempt - 1))
+        try:
+            response = requests.get(url, params=tile.params, timeout=timeout)
+        except requests.RequestException as e:
+            error = FetchError(None, repr(e), None)
+            continue
+        if response.status_code == 200:
+            return response.json(), None
+        error = FetchError(
+            response.status_code,
+            f"HTTP {response.status_code}",
+            retry_after(response.headers),
+        )
+        # Attente imposée par l'API: réessayer avant ne ferait que consommer du quota
+        if not should_retry(response.status_code) or error.retry_after:
+            break
+    return None, error
+
+
+def fetch_tiles(url, tiles, timeout, retries, backoff, max_workers=8):
+    if not tiles:
+        return None, []
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(tiles))) as executor:
+        results = list(
+            executor.map(
+                lambda tile: fetch_tile(url, tile, timeout, retries, backoff), tiles
+            )
+        )
+
+    payloads = [data for data, _ in results if data]
+    errors = [(tile, error) for tile, (data, error) in zip(tiles, results) if error]
+    return (merge_payloads(payloads) if payloads else None), errors
@@ -39,7 +39,8 @@ WHERE fp.position_id IN (
 CREATE INDEX idx_mv_latest_on_ground ON mv_latest_positions(on_ground);
 CREATE INDEX idx_mv_latest_velocity ON mv_latest_positions(velocity DESC);
 CREATE INDEX idx_mv_latest_geo ON mv_latest_positions(latitude, longitude) WHERE latitude IS NOT NULL AND longitude IS NOT NULL;
-CREATE INDEX idx_mv_latest_icao24 ON mv_latest_positions(icao24);
+-- Unique: requis par REFRESH MATERIALIZED VIEW CONCURRENTLY (une ligne par avion)
+CREATE UNIQUE INDEX idx_mv_latest_icao24 ON mv_latest_positions(icao24);
 
 -- 4. CRÉER UNE VUE SIMPLE QUI POINTE VERS LA VUE MATÉRIALISÉE
 -- Pour garder la compatibilité avec le code existant
@@ -0,0 +1,25 @@
+import os
+
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Connexion PostgreSQL et réglages du pool partagés par l'ETL, la
+# maintenance et les benchmarks. Rien d'autre à l'import: ni client Mongo,
+# ni métriques Prometheus
+PG_CONFIG = {
+    "host": os.getenv("POSTGRES_HOST"),
+    "port": int(os.getenv("POSTGRES_PORT")),
+    "database": os.getenv("POSTGRES_DB"),
+    "user": os.getenv("POSTGRES_USER"),
+    "password": os.getenv("POSTGRES_PASSWORD"),
+}
+
+PG_POOL_MAX_LIFETIME = int(os.getenv("PG_POOL_MAX_LIFETIME", "3600"))
+PG_POOL_HEALTH_CHECK_AFTER = int(os.getenv("PG_POOL_HEALTH_CHECK_AFTER", "30"))
+PG_POOL_TIMEOUT = int(os.getenv("PG_POOL_TIMEOUT", "30"))
+
+
+def get_pg_connection():
+    return psycopg2.connect(**PG_CONFIG)
@@ -0,0 +1,164 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from prometheus_client import Counter, Gauge, Histogram
+
+POOL_WAIT = Histogram(
+    "pg_pool_wait_seconds",
+    "Attente pour obtenir une connexion PostgreSQL du pool",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+POOL_CHECKOUTS = Counter("pg_pool_checkouts_total", "Connexions empruntées au pool")
+POOL_OPENED = Counter("pg_pool_connections_opened_total", "Connexions ouvertes")
+POOL_CLOSED = Counter(
+    "pg_pool_connections_closed_total",
+    "Connexions fermées par le pool",
+    ["reason"],
+)
+POOL_CONNECTIONS = Gauge(
+    "pg_pool_connections", "Connexions ouvertes par état", ["state"]
+)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    # Pool de connexions psycopg2 partagé entre threads:
+    # - au plus `max_size` connexions, ouvertes à la demande
+    # - une connexion restée inactive plus de `health_check_after` secondes est
+    #   vérifiée (SELECT 1) avant d'être prêtée, remplacée si elle est morte
+    # - une connexion plus vieille que `max_lifetime` secondes est remplacée
+    # - au retour, une transaction restée ouverte est annulée (rollback)
+
+    def __init__(
+        self, config, max_size=4, max_lifetime=3600, health_check_after=30, timeout=30
+    ):
+        self.config = config
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self.timeout = timeout
+
+        self._idle = deque()
+        self._created = {}
+        self._size = 0
+        self._cond = threading.Condition()
+
+        POOL_CONNECTIONS.labels("idle").set_function(lambda: len(self._idle))
+        POOL_CONNECTIONS.labels("in_use").set_function(
+            lambda: self._size - len(self._idle)
+        )
+
+    def _open(self):
+        conn = psycopg2.connect(**self.config)
+        POOL_OPENED.inc()
+        with self._cond:
+            self._created[id(conn)] = time.monotonic()
+        return conn
+
+    def _discard(self, conn, reason):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        POOL_CLOSED.labels(reason).inc()
+        with self._cond:
+            self._created.pop(id(conn), None)
+            self._size -= 1
+            self._cond.notify()
+
+    def _is_alive(self, conn, returned_at):
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+
+        while True:
+            conn = None
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(
+                            f"Aucune connexion libre après {self.timeout}s "
+                            f"({self.max_size} connexions)"
+                        )
+                    self._cond.wait(remaining)
+
+                if self._idle:
+                    # LIFO: les connexions les plus récemment utilisées restent chaudes
+                    conn, returned_at = self._idle.pop()
+                    created_at = self._created[id(conn)]
+                else:
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                break
+
+            if time.monotonic() - created_at > self.max_lifetime:
+                self._discard(conn, "lifetime")
+            elif not self._is_alive(conn, returned_at):
+                self._discard(conn, "health_check")
+            else:
+                break
+
+        POOL_WAIT.observe(time.monotonic() - start)
+        POOL_CHECKOUTS.inc()
+        return conn
+
+    def putconn(self, conn):
+        try:
+            status = conn.info.transaction_status if not conn.closed else None
+            if status is None or status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                self._discard(conn, "broken")
+                return
+            if status != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if conn.autocommit:
+                conn.autocommit = False
+        except psycopg2.Error:
+            self._discard(conn, "broken")
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def closeall(self):
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+        for conn, _ in idle:
+            self._discard(conn, "shutdown")
@@ -0,0 +1,59 @@
+import io
+import struct
+from datetime import datetime
+
+# Format binaire de COPY (https://www.postgresql.org/docs/current/sql-copy.html):
+# en-tête, puis pour chaque ligne le nombre de champs (int16) et chaque champ
+# précédé de sa longueur (int32, -1 pour NULL), puis -1 (int16) en fin de flux
+HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+TRAILER = struct.pack("!h", -1)
+NULL = struct.pack("!i", -1)
+POSTGRES_EPOCH = datetime(2000, 1, 1)
+
+_int4 = struct.Struct("!ii").pack
+_int8 = struct.Struct("!iq").pack
+_float8 = struct.Struct("!id").pack
+_bool = struct.Struct("!i?").pack
+_length = struct.Struct("!i").pack
+
+
+def _encode_text(value):
+    data = value.encode("utf-8")
+    return _length(len(data)) + data
+
+
+def _encode_timestamp(value):
+    # timestamp sans fuseau: microsecondes depuis le 2000-01-01
+    delta = value - POSTGRES_EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+    return _int8(8, micros)
+
+
+ENCODERS = {
+    "int4": lambda value: _int4(4, value),
+    "int8": lambda value: _int8(8, value),
+    "float8": lambda value: _float8(8, value),
+    "bool": lambda value: _bool(1, value),
+    "text": _encode_text,
+    "timestamp": _encode_timestamp,
+}
+
+
+def encode_rows(rows, types):
+    encoders = [ENCODERS[t] for t in types]
+    field_count = struct.pack("!h", len(types))
+    parts = [HEADER]
+    append = parts.append
+    for row in rows:
+        append(field_count)
+        for value, encode in zip(row, encoders):
+            append(NULL if value is None else encode(value))
+    append(TRAILER)
+    return b"".join(parts)
+
+
+def copy_rows(cursor, table, columns, types, rows):
+    cursor.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT binary)",
+        io.BytesIO(encode_rows(rows, types)),
+    )
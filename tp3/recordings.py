@@ -0,0 +1,133 @@
+import gzip
+import io
+import json
+import os
+import time
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+EXTENSIONS = {"gzip": ".ndjson.gz", "zstd": ".ndjson.zst"}
+
+
+def default_compression():
+    return "zstd" if zstandard else "gzip"
+
+
+def parse_speed(value):
+    # "1", "10" -> facteur d'accélération | "max" -> aucune attente entre snapshots
+    return None if str(value).lower() == "max" else float(value)
+
+
+class SegmentRecorder:
+    # Enregistre chaque snapshot /states/all sur une ligne NDJSON compressée;
+    # un nouveau segment est ouvert tous les `segment_size` snapshots
+
+    def __init__(self, directory, segment_size=120, compression=None):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.compression = compression or default_compression()
+        if self.compression == "zstd" and zstandard is None:
+            raise RuntimeError("zstandard non installé: pip install zstandard")
+        self.file = None
+        self.count = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _open(self):
+        name = f"opensky-{datetime.now():%Y%m%d-%H%M%S-%f}"
+        path = os.path.join(self.directory, name + EXTENSIONS[self.compression])
+        if self.compression == "zstd":
+            raw = open(path, "wb")
+            self.file = zstandard.ZstdCompressor().stream_writer(raw)
+        else:
+            self.file = gzip.open(path, "wb")
+        self.count = 0
+
+    def record(self, data):
+        if self.file is None:
+            self._open()
+
+        self.file.write(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+        self.file.write(b"\n")
+        # Flush à chaque snapshot: un arrêt brutal ne perd que le snapshot en cours
+        if self.compression == "zstd":
+            self.file.flush(zstandard.FLUSH_FRAME)
+        else:
+            self.file.flush()
+
+        self.count += 1
+        if self.count >= self.segment_size:
+            self.close()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def list_segments(path):
+    if os.path.isfile(path):
+        return [path]
+    return sorted(
+        os.path.join(path, name)
+        for name in os.listdir(path)
+        if name.endswith(tuple(EXTENSIONS.values()))
+    )
+
+
+def open_segment(path):
+    if path.endswith(EXTENSIONS["zstd"]):
+        if zstandard is None:
+            raise RuntimeError("zstandard non installé: pip install zstandard")
+        reader = zstandard.ZstdDecompressor().stream_reader(
+            open(path, "rb"), read_across_frames=True
+        )
+        return io.TextIOWrapper(reader, encoding="utf-8")
+    return gzip.open(path, "rt", encoding="utf-8")
+
+
+def iter_recordings(path):
+    for segment in list_segments(path):
+        with open_segment(segment) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class Replay:
+    # Rejoue des enregistrements au rythme d'origine (écarts entre `time`)
+    # divisé par `speed`, ou sans attente si speed vaut None. En boucle, les
+    # timestamps sont décalés à chaque tour pour rester uniques.
+
+    def __init__(self, path, speed=1.0, loop=False):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+
+    def __iter__(self):
+        offset = 0
+        previous_time = None
+        next_at = time.monotonic()
+
+        while True:
+            first_time = last_time = None
+            for data in iter_recordings(self.path):
+                if first_time is None:
+                    first_time = data["time"]
+                last_time = data["time"]
+                data["time"] += offset
+
+                if self.speed and previous_time is not None:
+                    next_at += max(data["time"] - previous_time, 0) / self.speed
+                    delay = next_at - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                previous_time = data["time"]
+                yield data
+
+            if not self.loop or first_time is None:
+                return
+            offset += last_time - first_time + 1
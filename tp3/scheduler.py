@@ -0,0 +1,53 @@
+import time
+
+
+class AdaptiveScheduler:
+    # Période de scraping adaptative: doublée sur 429 / 5xx / erreur réseau ou
+    # si l'écriture Mongo dépasse son budget, puis divisée par deux à chaque
+    # cycle sain jusqu'à revenir à l'intervalle de base. Un Retry-After de
+    # l'API est toujours respecté.
+
+    def __init__(self, base_interval, max_interval, write_budget=0.0, factor=2.0):
+        self.base_interval = base_interval
+        self.max_interval = max(max_interval, base_interval)
+        self.write_budget = write_budget
+        self.factor = factor
+        self.interval = base_interval
+        self.wait_until = 0.0
+        self.last_time = None
+
+    def _set_interval(self, interval, reason):
+        interval = min(max(interval, self.base_interval), self.max_interval)
+        if interval != self.interval:
+            print(
+                f"Cadence: {self.interval:g}s -> {interval:g}s ({reason})", flush=True
+            )
+            self.interval = interval
+
+    def slow_down(self, reason):
+        # Intervalle de base à 0 (rejeu, flotte simulée): on repart d'1 s
+        self._set_interval(max(self.interval * self.factor, 1.0), reason)
+
+    def on_fetch_error(self, status=None, retry_after=None):
+        if status is None or status == 429 or status >= 500:
+            self.slow_down(f"HTTP {status}" if status else "erreur réseau")
+        if retry_after:
+            self.wait_until = max(self.wait_until, time.monotonic() + retry_after)
+
+    def on_write(self, duration):
+        if self.write_budget and duration > self.write_budget:
+            self.slow_down(f"écriture {duration:.1f}s > budget {self.write_budget:g}s")
+        else:
+            self._set_interval(self.interval / self.factor, "retour à la normale")
+
+    def is_new(self, data):
+        # Tant que `time` n'avance pas, l'API renvoie le même snapshot
+        if self.last_time is not None and data["time"] <= self.last_time:
+            return False
+        self.last_time = data["time"]
+        return True
+
+    def sleep(self, cycle_start):
+        delay = max(cycle_start + self.interval, self.wait_until) - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
@@ -32,7 +32,9 @@ CREATE TABLE IF NOT EXISTS fact_flight_positions (
     UNIQUE(aircraft_id, api_timestamp)
 );
 
--- Table aggregée: Statistiques par heure
+-- Table aggregée: Statistiques par heure, tenue à jour par l'ETL (deltas
+-- additifs des positions insérées); les sommes et effectifs permettent
+-- d'additionner les moyennes
 CREATE TABLE IF NOT EXISTS agg_hourly_stats (
     stat_id SERIAL PRIMARY KEY,
     hour_timestamp TIMESTAMP NOT NULL,
@@ -42,8 +44,74 @@ CREATE TABLE IF NOT EXISTS agg_hourly_stats (
     avg_velocity DOUBLE PRECISION,
     flights_on_ground INTEGER,
     flights_airborne INTEGER,
-    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
-    UNIQUE(hour_timestamp, country_id)
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+ALTER TABLE agg_hourly_stats
+    ADD COLUMN IF NOT EXISTS altitude_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS altitude_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS velocity_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS velocity_count INTEGER NOT NULL DEFAULT 0;
+
+-- Une ligne par (heure, pays), pays inconnu (NULL) compris: l'ancienne
+-- contrainte UNIQUE laissait passer un doublon à chaque agrégation
+DELETE FROM agg_hourly_stats a USING agg_hourly_stats b
+WHERE a.country_id IS NULL AND b.country_id IS NULL
+  AND a.hour_timestamp = b.hour_timestamp AND a.stat_id < b.stat_id;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_hourly_stats_key
+    ON agg_hourly_stats(hour_timestamp, country_id) NULLS NOT DISTINCT;
+ALTER TABLE agg_hourly_stats
+    DROP CONSTRAINT IF EXISTS agg_hourly_stats_hour_timestamp_country_id_key;
+
+-- Table de staging du chargement par COPY (ETL_WRITE_STRATEGY=copy):
+-- UNLOGGED, donc sans WAL; chaque lot est identifié par son batch_id et
+-- supprimé dans la transaction qui le fusionne dans fact_flight_positions
+CREATE SEQUENCE IF NOT EXISTS staging_batch_seq;
+CREATE UNLOGGED TABLE IF NOT EXISTS staging_flight_positions (
+    batch_id BIGINT NOT NULL,
+    aircraft_id INTEGER NOT NULL,
+    country_id INTEGER,
+    callsign VARCHAR(20),
+    longitude DOUBLE PRECISION NOT NULL,
+    latitude DOUBLE PRECISION NOT NULL,
+    geo_altitude DOUBLE PRECISION,
+    velocity DOUBLE PRECISION,
+    true_track DOUBLE PRECISION,
+    on_ground BOOLEAN,
+    api_timestamp INTEGER NOT NULL,
+    ingestion_time TIMESTAMP NOT NULL
+);
+-- Un lot validé sans sa fusion est orphelin (COPY validé seul par une
+-- version antérieure de etl_async.py): purgé au démarrage. Les lots en
+-- cours, non validés, ne sont pas visibles ici
+DELETE FROM staging_flight_positions;
+
+-- Position de lecture de l'ETL dans chaque collection Mongo: dernier
+-- (CURSOR_FIELD, _id) chargé, avancé une fois les faits validés. Une ligne
+-- par shard en ETL multi-instance (name suffixé de #shard).
+-- cursor_id est l'_id encodé en BSON pour en garder le type (string ou ObjectId)
+CREATE TABLE IF NOT EXISTS etl_checkpoint (
+    name VARCHAR(200) PRIMARY KEY,
+    cursor_time TIMESTAMP NOT NULL,
+    cursor_id BYTEA NOT NULL,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+-- Première heure dont l'écrivain garde des deltas de stats en mémoire, pas
+-- encore ajoutés à agg_hourly_stats (NULL: aucun). Validée avec ses faits:
+-- après un arrêt brutal, ces heures sont recalculées au redémarrage
+ALTER TABLE etl_checkpoint ADD COLUMN IF NOT EXISTS stats_since TIMESTAMP;
+
+-- ETL multi-instance (ETL_SHARDING=true): bail de chaque shard d'icao24
+-- (owner NULL ou expires_at dépassé: shard libre) et instances vivantes
+CREATE TABLE IF NOT EXISTS etl_lease (
+    shard INTEGER PRIMARY KEY,
+    owner VARCHAR(200),
+    expires_at TIMESTAMPTZ,
+    acquired_at TIMESTAMPTZ
+);
+
+CREATE TABLE IF NOT EXISTS etl_instance (
+    owner VARCHAR(200) PRIMARY KEY,
+    heartbeat_at TIMESTAMPTZ NOT NULL
 );
 
 -- Index pour performance
@@ -54,6 +122,7 @@ CREATE INDEX IF NOT EXISTS idx_flight_positions_geo ON fact_flight_positions(lat
 CREATE INDEX IF NOT EXISTS idx_aircraft_icao24 ON dim_aircraft(icao24);
 CREATE INDEX IF NOT EXISTS idx_aircraft_last_seen ON dim_aircraft(last_seen);
 CREATE INDEX IF NOT EXISTS idx_hourly_stats_hour ON agg_hourly_stats(hour_timestamp);
+CREATE INDEX IF NOT EXISTS idx_staging_batch ON staging_flight_positions(batch_id);
 
 -- Vue: Dernière position connue de chaque avion
 CREATE OR REPLACE VIEW v_latest_positions AS
@@ -135,42 +204,78 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
--- Fonction pour calculer les statistiques horaires
-CREATE OR REPLACE FUNCTION aggregate_hourly_stats()
+-- Recalcul exact des statistiques des heures [since, until) depuis les
+-- faits (heures chargées avant les stats incrémentales, positions réécrites
+-- avec d'autres valeurs, deltas perdus dans un arrêt brutal); les lignes
+-- déjà justes ne sont pas réécrites. Le verrou SHARE ROW EXCLUSIVE attend
+-- les flushs de deltas en cours et bloque les suivants jusqu'au commit.
+-- until est ramené à la première heure encore en attente chez un écrivain
+-- (etl_checkpoint.stats_since, lu dans le même instantané que les faits):
+-- ses deltas, ajoutés plus tard, seraient sinon comptés deux fois
+DROP FUNCTION IF EXISTS aggregate_hourly_stats();
+CREATE OR REPLACE FUNCTION backfill_hourly_stats(since TIMESTAMP, until TIMESTAMP)
 RETURNS INTEGER AS $$
 DECLARE
-    inserted_count INTEGER;
+    upserted_count INTEGER;
 BEGIN
+    LOCK TABLE agg_hourly_stats IN SHARE ROW EXCLUSIVE MODE;
+
     INSERT INTO agg_hourly_stats (
         hour_timestamp,
         country_id,
         total_flights,
-        avg_altitude,
-        avg_velocity,
+        altitude_sum,
+        altitude_count,
+        velocity_sum,
+        velocity_count,
         flights_on_ground,
-        flights_airborne
+        flights_airborne,
+        avg_altitude,
+        avg_velocity
     )
     SELECT
         date_trunc('hour', fp.ingestion_time) as hour_timestamp,
         fp.country_id,
         COUNT(*) as total_flights,
+        COALESCE(SUM(fp.geo_altitude), 0) as altitude_sum,
+        COUNT(fp.geo_altitude) as altitude_count,
+        COALESCE(SUM(fp.velocity), 0) as velocity_sum,
+        COUNT(fp.velocity) as velocity_count,
+        COUNT(*) FILTER (WHERE fp.on_ground) as flights_on_ground,
+        COUNT(*) FILTER (WHERE NOT fp.on_ground) as flights_airborne,
         AVG(fp.geo_altitude) as avg_altitude,
-        AVG(fp.velocity) as avg_velocity,
-        SUM(CASE WHEN fp.on_ground THEN 1 ELSE 0 END) as flights_on_ground,
-        SUM(CASE WHEN NOT fp.on_ground THEN 1 ELSE 0 END) as flights_airborne
+        AVG(fp.velocity) as avg_velocity
     FROM fact_flight_positions fp
-    WHERE fp.ingestion_time >= date_trunc('hour', NOW() - INTERVAL '1 hour')
-      AND fp.ingestion_time < date_trunc('hour', NOW())
+    WHERE fp.ingestion_time >= date_trunc('hour', since)
+      AND fp.ingestion_time < LEAST(
+          date_trunc('hour', until),
+          (SELECT date_trunc('hour', min(stats_since)) FROM etl_checkpoint)
+      )
     GROUP BY date_trunc('hour', fp.ingestion_time), fp.country_id
+    ORDER BY 1, 2
     ON CONFLICT (hour_timestamp, country_id) DO UPDATE SET
         total_flights = EXCLUDED.total_flights,
-        avg_altitude = EXCLUDED.avg_altitude,
-        avg_velocity = EXCLUDED.avg_velocity,
+        altitude_sum = EXCLUDED.altitude_sum,
+        altitude_count = EXCLUDED.altitude_count,
+        velocity_sum = EXCLUDED.velocity_sum,
+        velocity_count = EXCLUDED.velocity_count,
         flights_on_ground = EXCLUDED.flights_on_ground,
-        flights_airborne = EXCLUDED.flights_airborne;
+        flights_airborne = EXCLUDED.flights_airborne,
+        avg_altitude = EXCLUDED.avg_altitude,
+        avg_velocity = EXCLUDED.avg_velocity
+    WHERE (
+        agg_hourly_stats.total_flights, agg_hourly_stats.altitude_count,
+        agg_hourly_stats.velocity_count, agg_hourly_stats.flights_on_ground,
+        agg_hourly_stats.flights_airborne, agg_hourly_stats.altitude_sum,
+        agg_hourly_stats.velocity_sum
+    ) IS DISTINCT FROM (
+        EXCLUDED.total_flights, EXCLUDED.altitude_count, EXCLUDED.velocity_count,
+        EXCLUDED.flights_on_ground, EXCLUDED.flights_airborne,
+        EXCLUDED.altitude_sum, EXCLUDED.velocity_sum
+    );
 
-    GET DIAGNOSTICS inserted_count = ROW_COUNT;
+    GET DIAGNOSTICS upserted_count = ROW_COUNT;
 
-    RETURN inserted_count;
+    RETURN upserted_count;
 END;
 $$ LANGUAGE plpgsql;
@@ -0,0 +1,158 @@
+import threading
+import time
+import zlib
+
+from prometheus_client import Counter, Gauge
+
+# Espace de hachage fixe des icao24: le champ `shard` est écrit à l'ingestion,
+# les instances ETL se partagent ces SHARD_COUNT shards (au plus autant
+# d'instances utiles)
+SHARD_COUNT = 64
+
+SHARDS_OWNED = Gauge("etl_shards_owned", "Shards détenus par cette instance ETL")
+LIVE_INSTANCES = Gauge("etl_live_instances", "Instances ETL vivantes (heartbeat)")
+SHARD_CHANGES = Counter(
+    "etl_shard_changes_total",
+    "Shards pris ou rendus par cette instance",
+    ["change"],
+)
+HEARTBEAT_FAILURES = Counter(
+    "etl_heartbeat_failures_total", "Heartbeats PostgreSQL en échec"
+)
+
+
+def shard_of(icao24):
+    return zlib.crc32(icao24.encode()) % SHARD_COUNT
+
+
+class ShardLeases:
+    # Baux sur les shards, stockés dans PostgreSQL (etl_lease, etl_instance).
+    # Toutes les ttl / 3 secondes, chaque instance:
+    # - signale qu'elle est vivante et prolonge ses baux de ttl secondes
+    # - vise ceil(SHARD_COUNT / instances vivantes) shards: rend l'excédent,
+    #   prend des shards libres ou dont le bail a expiré (instance morte)
+    # Si les baux ne peuvent plus être prolongés, l'instance les considère
+    # perdus à leur échéance. `changed` est levé à chaque changement.
+
+    def __init__(self, pool, owner, ttl=30):
+        self.pool = pool
+        self.owner = owner
+        self.ttl = ttl
+        self.owned = frozenset()
+        self.changed = threading.Event()
+        self.valid_until = 0.0
+        self.stop = threading.Event()
+        self.thread = None
+
+        SHARDS_OWNED.set_function(lambda: len(self.owned))
+
+    def _set_owned(self, owned):
+        owned = frozenset(owned)
+        if owned != self.owned:
+            SHARD_CHANGES.labels("acquired").inc(len(owned - self.owned))
+            SHARD_CHANGES.labels("released").inc(len(self.owned - owned))
+            self.owned = owned
+            self.changed.set()
+
+    def heartbeat(self):
+        started = time.monotonic()
+        with self.pool.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "INSERT INTO etl_lease (shard) SELECT generate_series(0, %s) "
+                    "ON CONFLICT (shard) DO NOTHING",
+                    (SHARD_COUNT - 1,),
+                )
+                cursor.execute(
+                    """
+                    INSERT INTO etl_instance (owner, heartbeat_at) VALUES (%s, NOW())
+                    ON CONFLICT (owner) DO UPDATE SET heartbeat_at = NOW()
+                    """,
+                    (self.owner,),
+                )
+                cursor.execute(
+                    "DELETE FROM etl_instance "
+                    "WHERE heartbeat_at < NOW() - make_interval(secs => %s)",
+                    (self.ttl,),
+                )
+                cursor.execute("SELECT count(*) FROM etl_instance")
+                live = cursor.fetchone()[0]
+                target = -(-SHARD_COUNT // live)
+
+                cursor.execute(
+                    """
+                    UPDATE etl_lease SET expires_at = NOW() + make_interval(secs => %s)
+                    WHERE owner = %s
+                    RETURNING shard
+                    """,
+                    (self.ttl, self.owner),
+                )
+                owned = sorted(row[0] for row in cursor.fetchall())
+
+                if len(owned) > target:
+                    cursor.execute(
+                        "UPDATE etl_lease SET owner = NULL, expires_at = NULL "
+                        "WHERE owner = %s AND shard = ANY(%s)",
+                        (self.owner, owned[target:]),
+                    )
+                    owned = owned[:target]
+                elif len(owned) < target:
+                    # SKIP LOCKED: deux instances qui démarrent ensemble ne
+                    # se disputent pas les mêmes shards
+                    cursor.execute(
+                        """
+                        UPDATE etl_lease SET
+                            owner = %s,
+                            expires_at = NOW() + make_interval(secs => %s),
+                            acquired_at = NOW()
+                        WHERE shard IN (
+                            SELECT shard FROM etl_lease
+                            WHERE owner IS NULL OR expires_at < NOW()
+                            ORDER BY shard
+                            LIMIT %s
+                            FOR UPDATE SKIP LOCKED
+                        )
+                        RETURNING shard
+                        """,
+                        (self.owner, self.ttl, target - len(owned)),
+                    )
+                    owned += [row[0] for row in cursor.fetchall()]
+            conn.commit()
+
+        LIVE_INSTANCES.set(live)
+        self.valid_until = started + self.ttl
+        self._set_owned(owned)
+        return self.owned
+
+    def run(self):
+        while not self.stop.wait(self.ttl / 3):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                HEARTBEAT_FAILURES.inc()
+                print(f"Erreur heartbeat ETL: {e}", flush=True)
+                if time.monotonic() >= self.valid_until:
+                    self._set_owned(())
+
+    def start(self):
+        self.heartbeat()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def release(self):
+        # Arrêt propre: les shards sont repris sans attendre l'expiration
+        self.stop.set()
+        if self.thread is not None:
+            self.thread.join()
+        with self.pool.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "UPDATE etl_lease SET owner = NULL, expires_at = NULL "
+                    "WHERE owner = %s",
+                    (self.owner,),
+                )
+                cursor.execute(
+                    "DELETE FROM etl_instance WHERE owner = %s", (self.owner,)
+                )
+            conn.commit()
+        self._set_owned(())
@@ -0,0 +1,110 @@
+import numpy as np
+
+from geo import destination_point, haversine, heading_difference
+from opensky import GEO_ALTITUDE, ICAO24, ON_GROUND, TRUE_TRACK, VELOCITY
+
+STATE_FIELDS = (
+    "latitude",
+    "longitude",
+    "altitude",
+    "velocity",
+    "track",
+    "on_ground",
+    "time",
+)
+
+
+class DeadReckoningFilter:
+    # Compression de trajectoire à l'ingestion: pour chaque avion, la position
+    # est prédite à partir du dernier point gardé (vitesse + cap, altitude
+    # constante). Un point n'est gardé que s'il s'écarte de cette estime au-delà
+    # des tolérances, change d'état sol/vol ou si `max_gap` secondes se sont
+    # écoulées. Entre deux points gardés, la trajectoire se reconstruit par la
+    # même estime à partir des champs stockés (velocity, true_track).
+
+    def __init__(self, distance=500.0, altitude=100.0, heading=5.0, max_gap=300.0):
+        self.distance = distance
+        self.altitude = altitude
+        self.heading = heading
+        self.max_gap = max_gap
+
+        self.slots = {}
+        self.state = {field: np.full(1024, np.nan) for field in STATE_FIELDS}
+        self.received = 0
+        self.kept = 0
+        self.max_error = 0.0
+
+    def _slot(self, icao24):
+        slot = self.slots.get(icao24)
+        if slot is None:
+            slot = self.slots[icao24] = len(self.slots)
+            capacity = len(self.state["time"])
+            if slot >= capacity:
+                for field, values in self.state.items():
+                    grown = np.full(capacity * 2, np.nan)
+                    grown[:capacity] = values
+                    self.state[field] = grown
+        return slot
+
+    def apply(self, snapshot):
+        n = len(snapshot)
+        self.received += n
+        if not n:
+            return snapshot
+
+        slots = np.fromiter(
+            map(self._slot, snapshot.column(ICAO24, object)), np.int64, n
+        )
+        latitude = snapshot.latitude
+        longitude = snapshot.longitude
+        altitude = snapshot.column(GEO_ALTITUDE)
+        velocity = snapshot.column(VELOCITY)
+        track = snapshot.column(TRUE_TRACK)
+        on_ground = snapshot.column(ON_GROUND).astype(np.float64)
+
+        last = {field: values[slots] for field, values in self.state.items()}
+        dt = snapshot.time - last["time"]
+
+        predicted_lat, predicted_lon = destination_point(
+            last["latitude"], last["longitude"], last["track"], last["velocity"] * dt
+        )
+        error = haversine(predicted_lat, predicted_lon, latitude, longitude)
+
+        # NaN (nouvel avion, vitesse ou cap inconnus) -> comparaison fausse -> gardé
+        keep = (
+            ~(error <= self.distance)
+            | ~((dt > 0) & (dt < self.max_gap))
+            | (on_ground != last["on_ground"])
+            | (np.abs(altitude - last["altitude"]) > self.altitude)
+            | (heading_difference(track, last["track"]) > self.heading)
+        )
+        # Même snapshot reçu deux fois: rien de nouveau à écrire (un retour en
+        # arrière, rejeu relancé par exemple, repart au contraire d'un point gardé)
+        keep &= dt != 0
+
+        dropped = error[~keep]
+        if dropped.size:
+            self.max_error = max(self.max_error, float(np.nanmax(dropped, initial=0)))
+
+        kept_slots = slots[keep]
+        current = {
+            "latitude": latitude,
+            "longitude": longitude,
+            "altitude": altitude,
+            "velocity": velocity,
+            "track": track,
+            "on_ground": on_ground,
+        }
+        for field, values in current.items():
+            self.state[field][kept_slots] = values[keep]
+        self.state["time"][kept_slots] = snapshot.time
+
+        self.kept += int(keep.sum())
+        return snapshot.select(keep)
+
+    def summary(self):
+        ratio = self.received / self.kept if self.kept else 0.0
+        return (
+            f"{self.kept}/{self.received} points gardés (x{ratio:.1f}), "
+            f"écart max {self.max_error:.0f} m"
+        )